@@ -0,0 +1,292 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Batch Estimation (command line, without the GUI)
+
+Usage: python -m batch [-a ALGO] [-m MODEL] [-o OUTPUT] [--seed SEED]
+                       [--workers N] [--warm-start [INDEX]] [--stats]
+                       [--curves DIR] [--race] PATH [PATH ...]
+
+Where PATH is a .mto file, a directory of .mto files or a glob pattern, and
+OUTPUT is a .csv or .json file ("-" or omitted writes CSV to stdout)
+"""
+import os, sys, time, glob, csv, json, argparse
+import saveload
+import parallel
+import resultcache
+import warmstart
+import instrument
+import curves
+from estimate import PARAMS, param_dict
+from config import MotorData, AlgoSettings
+from resultcache import ResultCache, cached_estimate
+
+# Short command line names of the algorithms
+ALGO_NAMES = {
+    "nr"        : "Newton-Raphson",
+    "lm"        : "Levenberg-Marquardt",
+    "dnr"       : "Damped Newton-Raphson",
+    "ga"        : "Genetic Algorithm",
+    "hy-nr"     : "Hybrid GA-NR",
+    "hy-lm"     : "Hybrid GA-LM",
+    "hy-dnr"    : "Hybrid GA-DNR"
+    }
+
+MODEL_NAMES = {
+    "single"    : "Single cage",
+    "double"    : "Double cage"
+    }
+
+FIELDS = ["file", "description", "model", "algorithm"] + PARAMS["Double cage"] + ["err", "iter", "conv", "time", "cached", "error"]
+
+# Instrumentation columns (objective function evaluations, rejected steps and
+# time in each solver phase, see instrument.py)
+STATS_FIELDS = ["evaluations", "retries"] + ["t_" + name for name in instrument.PHASES]
+
+"""
+FIND_FILES - Lists the .mto files given by a list of files, directories and
+             glob patterns
+
+Usage: find_files (paths)
+
+Returns: sorted list of file names (without duplicates)
+"""
+def find_files(paths):
+
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "*.mto")))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            files.extend(glob.glob(path))
+
+    return sorted(set(files))
+
+"""
+ESTIMATE_FILE - Estimates the equivalent circuit parameters of the motor in a
+                .mto file
+
+Usage: estimate_file (filename, model, algo, settings, executor, seed, cache, warm, stats, curve_dir, race)
+
+Where   model is "Single cage" or "Double cage"
+        algo is one of estimate.ALGORITHMS
+        settings is a dictionary of algorithm settings overriding those of
+          the file (and the defaults)
+        executor and seed are as per estimate.estimate
+        cache is an optional resultcache.ResultCache
+        warm is an optional warmstart.WarmStartIndex
+        stats is a true/false flag to add the instrumentation columns (see
+          estimate_motor)
+        curve_dir is an optional directory to write the torque-speed and
+          current-speed curves of the motor to (as NAME.csv for NAME.mto,
+          see curves.write_curves)
+        race is an optional race.SolverRace (see estimate_motor)
+
+Returns: dictionary of results (one row of the results table). Errors are
+         reported in the "error" field rather than raised
+"""
+def estimate_file(filename, model, algo, settings=None, executor=None, seed=None, cache=None, warm=None, stats=False, curve_dir=None, race=None):
+
+    row = {"file" : filename}
+
+    try:
+        [motor_data, algo_data] = saveload.read_file(filename)
+    except Exception as e:
+        row.update({"model" : model, "algorithm" : algo, "error" : str(e)})
+        return row
+
+    # Settings of the file, then the overrides
+    algo_data.update(settings or {})
+
+    estimate_motor(row, motor_data, algo_data, model, algo, executor, seed, cache, warm, stats, race)
+
+    if (curve_dir is not None) and ("error" not in row):
+        try:
+            x = [row[name] for name in PARAMS[model]]
+            name = os.path.splitext(os.path.basename(filename))[0]
+            curves.write_curves(curves.get_curves(model, x, motor_data), os.path.join(curve_dir, name + ".csv"))
+        except Exception as e:
+            row["error"] = "curves: %s" % e
+
+    return row
+
+"""
+ESTIMATE_MOTOR - Estimates the equivalent circuit parameters of a motor and
+                 adds the results to a row of the results table
+
+Usage: estimate_motor (row, motor_data, algo_data, model, algo, executor, seed, cache, warm, stats, race)
+
+Where   row is a dictionary of results (updated in place)
+        motor_data is a dictionary of motor data
+        algo_data is a dictionary of algorithm settings (missing settings
+          take the default values of config.AlgoSettings)
+        model, algo, executor and seed are as per estimate.estimate
+        cache is an optional resultcache.ResultCache
+        warm is an optional warmstart.WarmStartIndex
+        stats is a true/false flag: if true, the solver is instrumented and
+          the STATS_FIELDS are added to the row
+        race is an optional race.SolverRace: if given, its algorithms are
+          raced instead of running algo (without the cache, warm start or
+          stats), and the winner is the algorithm of the row
+
+Returns: row. Errors are reported in the "error" field rather than raised
+"""
+def estimate_motor(row, motor_data, algo_data, model, algo, executor=None, seed=None, cache=None, warm=None, stats=False, race=None):
+
+    row.update({"description" : motor_data.get("description", ""), "model" : model, "algorithm" : algo})
+
+    try:
+        # Defaults, then the given data
+        motor = MotorData.from_dict(motor_data)
+        settings = AlgoSettings.from_dict(algo_data)
+
+        t = time.perf_counter()
+        if race is not None:
+            [z, iter, err, conv, row["algorithm"]] = race.run(model, motor, settings, seed)[0:5]
+            cached = False
+        elif stats:
+            [z, iter, err, conv, cached, s] = instrument.run(cached_estimate, cache, model, algo, motor, settings, None, executor, seed, warm)
+            row.update(stats_row(s))
+        else:
+            [z, iter, err, conv, cached] = cached_estimate(cache, model, algo, motor, settings, None, executor, seed, warm)
+        row["time"] = time.perf_counter() - t
+        row["cached"] = int(cached)
+
+        row.update(param_dict(model, z))
+        row["err"] = float(err)
+        row["iter"] = int(iter)
+        row["conv"] = int(conv)
+    except Exception as e:
+        row["error"] = str(e)
+
+    return row
+
+# Instrumentation columns of a row, from instrument.Stats
+def stats_row(s):
+    row = {"evaluations" : s.evaluations(), "retries" : s.counts.get("retry", 0)}
+    for name in instrument.PHASES:
+        row["t_" + name] = s.times.get(name, 0.0)
+
+    return row
+
+"""
+WRITE_RESULTS - Writes a results table as CSV or JSON
+
+Usage: write_results (rows, filename, fields)
+
+Where   rows is a list of result dictionaries (see estimate_file)
+        filename is a .csv or .json file, or "-" for CSV on stdout
+        fields is the list of CSV columns (default FIELDS)
+"""
+def write_results(rows, filename, fields=None):
+
+    if filename.lower().endswith(".json"):
+        with open(filename, "w") as f:
+            json.dump(rows, f, indent=2)
+        return
+
+    if filename == "-":
+        write_csv(rows, sys.stdout, fields)
+    else:
+        with open(filename, "w", newline="") as f:
+            write_csv(rows, f, fields)
+
+def write_csv(rows, f, fields=None):
+    writer = csv.DictWriter(f, fieldnames=fields or FIELDS, restval="")
+    writer.writeheader()
+    writer.writerows(rows)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m batch", description="Estimate the equivalent circuit parameters of a set of motors (.mto files)")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help=".mto file, directory of .mto files or glob pattern")
+    parser.add_argument("-o", "--output", default="-", help="results file, .csv or .json (default CSV on stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the genetic and hybrid algorithms")
+    parser.add_argument("--stats", action="store_true", help="instrument the solvers, adding the objective function evaluations and the time in each solver phase to the results")
+    parser.add_argument("--warm-start", nargs="?", const=warmstart.DEFAULT_PATH, default=None, metavar="INDEX", help="start the descent algorithms from the nearest converged motors of a warm start index, adding the converged motors to it (default %s)" % warmstart.DEFAULT_PATH)
+    parser.add_argument("--race", action="store_true", help="race the nr, lm and dnr algorithms (and -a if it is a hybrid algorithm) in worker processes, taking the first converged result")
+    parser.add_argument("--curves", default=None, metavar="DIR", help="write the torque-speed and current-speed curves of each motor to a CSV file in DIR")
+    add_settings_args(parser)
+
+    return parser.parse_args(argv)
+
+# Command line options for the model, algorithm and settings (shared with the
+# fleet estimator)
+def add_settings_args(parser):
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGO_NAMES), default="nr", help="algorithm (default nr)")
+    parser.add_argument("-m", "--model", choices=sorted(MODEL_NAMES), default="double", help="motor model (default double)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the genetic and hybrid algorithms")
+    parser.add_argument("--cache", nargs="?", const=resultcache.DEFAULT_PATH, default=None, metavar="PATH", help="reuse and store results in a result cache (default %s)" % resultcache.DEFAULT_PATH)
+    parser.add_argument("--max-iter", type=int, default=None, help="override max_iter of the files")
+    parser.add_argument("--n-gen", type=int, default=None, help="override n_gen of the files")
+    parser.add_argument("--pop", type=int, default=None, help="override pop of the files")
+    parser.add_argument("--n-r", type=int, default=None, help="override n_r of the files")
+    parser.add_argument("--n-e", type=int, default=None, help="override n_e of the files")
+    parser.add_argument("--n-starts", type=int, default=None, metavar="N", help="run the descent algorithms from N starting points in lockstep (multi-start)")
+    parser.add_argument("--max-time", type=float, default=None, metavar="SECONDS", help="time budget of each motor, the best solution so far is returned when it runs out")
+    parser.add_argument("--max-evals", type=int, default=None, metavar="N", help="objective function evaluation budget of each motor")
+
+# Algorithm settings given on the command line
+def settings_args(args):
+    settings = {}
+    for key in ("max_iter", "n_gen", "pop", "n_r", "n_e", "n_starts", "max_time", "max_evals"):
+        if getattr(args, key, None) is not None:
+            settings[key] = getattr(args, key)
+
+    return settings
+
+# Result cache given on the command line (or None)
+def result_cache(args):
+    if args.cache is None:
+        return None
+
+    return ResultCache(args.cache)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    files = find_files(args.paths)
+    if not files:
+        print("No .mto files found", file=sys.stderr)
+        return 1
+
+    settings = settings_args(args)
+    model = MODEL_NAMES[args.model]
+    algo = ALGO_NAMES[args.algorithm]
+    executor = parallel.get_executor(args.workers)
+    cache = result_cache(args)
+    warm = None if args.warm_start is None else warmstart.WarmStartIndex(args.warm_start)
+    if (args.curves is not None) and not os.path.isdir(args.curves):
+        os.makedirs(args.curves)
+
+    race = None
+    if args.race:
+        from race import SolverRace, RACE_ALGORITHMS
+        race = SolverRace(RACE_ALGORITHMS + ([algo] if algo.startswith("Hybrid") else []))
+
+    rows = []
+    try:
+        for filename in files:
+            row = estimate_file(filename, model, algo, settings, executor, args.seed, cache, warm, args.stats, args.curves, race)
+            rows.append(row)
+
+            print("%s: %s" % (filename, row.get("error") or "err = %g, iter = %d, conv = %d (%.2f s)" % (row["err"], row["iter"], row["conv"], row["time"])), file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if warm is not None:
+            warm.save()
+        if race is not None:
+            race.shutdown()
+
+    write_results(rows, args.output, FIELDS + STATS_FIELDS if args.stats else FIELDS)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Benchmark Suite
+
+Runs every algorithm on every motor of a library (the double cage algorithms
+and the single cage Newton-Raphson solver) with fixed random seeds, and
+records the wall time, objective evaluations, iterations, final error and
+convergence rate of each case. The report is written as JSON and can be
+compared against a stored baseline report.
+
+Usage: python -m benchmark [PATH ...] [-o REPORT] [--baseline REPORT]
+                           [--repeats N] [--seed SEED] [-a ALGO ...]
+
+Where PATH is a .mto file, a directory of .mto files or a glob pattern
+(default the library directory)
+"""
+import os, sys, time, json, platform, argparse
+import numpy as np
+import saveload
+import instrument
+from estimate import ALGORITHMS, estimate
+from config import MotorData, AlgoSettings
+from batch import ALGO_NAMES, find_files, settings_args
+
+# Version of the report format
+REPORT_VERSION = 1
+
+# Default library of benchmark motors
+LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "library")
+
+# Benchmark cases (model, algorithm)
+CASES = [("Double cage", algo) for algo in ALGORITHMS] + [("Single cage", "Newton-Raphson")]
+
+# Default tolerances of the baseline comparison: relative increase of the
+# minimum wall time and of the mean number of objective evaluations, and
+# decrease of the convergence rate. Time differences below TIME_MIN seconds
+# are not reported (too short to measure reliably)
+TIME_TOL = 0.5
+EVALS_TOL = 0.05
+CONV_TOL = 0.0
+TIME_MIN = 0.01
+
+"""
+RUN_CASE - Runs one benchmark case (an algorithm on a motor) a number of times
+
+Usage: run_case (motor, settings, model, algo, seeds)
+
+Where   motor is a config.MotorData record
+        settings is a config.AlgoSettings record
+        model, algo are as per estimate.estimate
+        seeds is the list of random seeds of the runs (one run each)
+
+The runs are instrumented (see instrument.py) to count the objective
+function evaluations and time the solver phases.
+
+Returns: dictionary of the case results (runs, converged, conv_rate, failed,
+         time_median, time_min, evals_mean, iter_mean, err_median, and the
+         mean retries and phase times of a run)
+"""
+def run_case(motor, settings, model, algo, seeds):
+
+    times = []
+    evals = []
+    stats = instrument.Stats()
+    iters = []
+    errs = []
+    converged = 0
+    failed = 0
+
+    for seed in seeds:
+        with instrument.collect() as s:
+            t = time.perf_counter()
+            try:
+                [z, iter, err, conv] = estimate(model, algo, motor, settings, seed=seed)
+            except (ArithmeticError, np.linalg.LinAlgError):
+                [iter, err, conv] = [np.nan, np.nan, 0]
+                failed += 1
+            times.append(time.perf_counter() - t)
+
+        evals.append(s.evaluations())
+        stats.merge(s)
+        iters.append(iter)
+        errs.append(err)
+        converged += int(conv == 1)
+
+    return {
+        "runs" : len(seeds),
+        "converged" : converged,
+        "conv_rate" : converged / len(seeds),
+        "failed" : failed,
+        "time_median" : float(np.median(times)),
+        "time_min" : float(np.min(times)),
+        "evals_mean" : float(np.mean(evals)),
+        "iter_mean" : nan_none(np.nanmean(iters) if failed < len(seeds) else np.nan),
+        "err_median" : nan_none(np.nanmedian(errs) if failed < len(seeds) else np.nan),
+        "retries_mean" : stats.counts.get("retry", 0) / len(seeds),
+        "phase_times" : {name : t / len(seeds) for [name, t] in sorted(stats.times.items())}
+        }
+
+# NaN and inf as None (null in the JSON report)
+def nan_none(x):
+    x = float(x)
+    return x if np.isfinite(x) else None
+
+"""
+RUN_BENCHMARK - Runs the benchmark cases on a set of motors
+
+Usage: run_benchmark (files, cases, repeats, seed, settings, log)
+
+Where   files is a list of .mto files
+        cases is a list of (model, algorithm) pairs (default CASES)
+        repeats is the number of runs of each case, with seeds seed,
+          seed + 1, ... seed + repeats - 1
+        settings is a dictionary of algorithm settings overriding those of
+          the files
+        log is an optional function called with a line of text per case
+
+Returns: report dictionary (see write_report)
+"""
+def run_benchmark(files, cases=None, repeats=3, seed=0, settings=None, log=None):
+
+    cases = cases or CASES
+    seeds = [seed + i for i in range(repeats)]
+    results = []
+
+    for filename in files:
+        [motor_data, algo_data] = saveload.read_file(filename)
+        algo_data.update(settings or {})
+        motor = MotorData.from_dict(motor_data)
+        s = AlgoSettings.from_dict(algo_data)
+
+        for [model, algo] in cases:
+            r = {"motor" : os.path.basename(filename), "model" : model, "algorithm" : algo}
+            r.update(run_case(motor, s, model, algo, seeds))
+            results.append(r)
+
+            if log is not None:
+                log("%s, %s, %s: conv %d/%d, %.3f s, %d evals" % (r["motor"], model, algo, r["converged"], r["runs"], r["time_median"], r["evals_mean"]))
+
+    return {
+        "version" : REPORT_VERSION,
+        "created" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform" : platform.platform(),
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "repeats" : repeats,
+        "seed" : seed,
+        "settings" : settings or {},
+        "results" : results,
+        "summary" : summarize(results)
+        }
+
+# Totals per model and algorithm over all motors
+def summarize(results):
+    summary = []
+
+    for [model, algo] in unique((r["model"], r["algorithm"]) for r in results):
+        rs = [r for r in results if (r["model"] == model) and (r["algorithm"] == algo)]
+        runs = sum(r["runs"] for r in rs)
+        summary.append({
+            "model" : model,
+            "algorithm" : algo,
+            "runs" : runs,
+            "conv_rate" : sum(r["converged"] for r in rs) / runs,
+            "failed" : sum(r["failed"] for r in rs),
+            "time_total" : sum(r["time_median"] for r in rs),
+            "evals_total" : sum(r["evals_mean"] for r in rs)
+            })
+
+    return summary
+
+# Items of a sequence without repetitions, in order
+def unique(items):
+    seen = []
+    for item in items:
+        if item not in seen:
+            seen.append(item)
+
+    return seen
+
+"""
+COMPARE - Compares a benchmark report against a baseline report
+
+Usage: compare (report, baseline, time_tol, evals_tol, conv_tol)
+
+Where   time_tol, evals_tol are the allowed relative increases of the minimum
+          wall time (the least noisy) and mean objective evaluations of a case
+        conv_tol is the allowed decrease of the convergence rate of a case
+
+Cases are matched by motor, model and algorithm (cases only in one of the
+reports are ignored).
+
+Returns: list of regressions, each a line of text
+"""
+def compare(report, baseline, time_tol=TIME_TOL, evals_tol=EVALS_TOL, conv_tol=CONV_TOL):
+
+    base = {(r["motor"], r["model"], r["algorithm"]) : r for r in baseline["results"]}
+    regressions = []
+
+    for r in report["results"]:
+        b = base.get((r["motor"], r["model"], r["algorithm"]))
+        if b is None:
+            continue
+
+        case = "%s, %s, %s" % (r["motor"], r["model"], r["algorithm"])
+
+        if r["conv_rate"] < b["conv_rate"] - conv_tol:
+            regressions.append("%s: convergence rate %.2f (baseline %.2f)" % (case, r["conv_rate"], b["conv_rate"]))
+        if (r["time_min"] > b["time_min"] * (1 + time_tol)) and (r["time_min"] - b["time_min"] > TIME_MIN):
+            regressions.append("%s: time %.3f s (baseline %.3f s)" % (case, r["time_min"], b["time_min"]))
+        if r["evals_mean"] > b["evals_mean"] * (1 + evals_tol):
+            regressions.append("%s: %.1f evaluations (baseline %.1f)" % (case, r["evals_mean"], b["evals_mean"]))
+
+    return regressions
+
+def write_report(report, filename):
+    if filename == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(filename, "w") as f:
+            json.dump(report, f, indent=2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark the estimation algorithms on a library of motors")
+    parser.add_argument("paths", nargs="*", metavar="PATH", help=".mto file, directory of .mto files or glob pattern (default the library directory)")
+    parser.add_argument("-o", "--output", default="-", help="JSON report file (default stdout)")
+    parser.add_argument("--baseline", default=None, metavar="REPORT", help="baseline report to compare against (exit status 1 on regressions)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of each case (default 3)")
+    parser.add_argument("--time-tol", type=float, default=TIME_TOL, help="allowed relative increase of the time of a case (default %g)" % TIME_TOL)
+    parser.add_argument("--evals-tol", type=float, default=EVALS_TOL, help="allowed relative increase of the evaluations of a case (default %g)" % EVALS_TOL)
+    parser.add_argument("-a", "--algorithm", dest="algorithms", action="append", choices=sorted(ALGO_NAMES), default=None, help="benchmark only an algorithm (can be repeated, default all)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the first run of each case (default 0)")
+    for key in ("max_iter", "n_gen", "pop", "n_r", "n_e"):
+        parser.add_argument("--" + key.replace("_", "-"), type=int, default=None, help="override %s of the files" % key)
+    args = parser.parse_args(argv)
+
+    files = find_files(args.paths or [LIBRARY])
+    if not files:
+        print("No .mto files found", file=sys.stderr)
+        return 1
+
+    cases = CASES
+    if args.algorithms:
+        algos = [ALGO_NAMES[a] for a in args.algorithms]
+        cases = [c for c in CASES if c[1] in algos]
+
+    report = run_benchmark(files, cases, args.repeats, args.seed, settings_args(args), lambda line: print(line, file=sys.stderr))
+    write_report(report, args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(report, baseline, args.time_tol, args.evals_tol)
+        for line in regressions:
+            print("Regression: %s" % line, file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Solver Budgets
+
+A Budget limits the wall-clock time and/or the number of objective function
+evaluations of a solver run. The solvers check it after every trial step
+(descent algorithms), generation (genetic algorithm) or member (hybrid
+algorithm, every generation with an executor) and, once it is exhausted,
+stop and return the best solution found so far (conv = 0 unless it
+converged).
+
+Evaluations are counted by the solver instrumentation (see instrument.py):
+a budget with an evaluation limit collects its own stats while its runs are
+limited (see limited), so it only counts the evaluations of its own runs,
+even with other estimations running at once in other threads.
+"""
+import time
+import instrument
+
+"""
+BUDGET - Time and evaluation limits of a solver run
+
+Usage: budget = Budget (max_time, max_evals)
+
+Where   max_time is the maximum run time in seconds (None or 0 for no limit)
+        max_evals is the maximum number of objective function evaluations
+          (None or 0 for no limit)
+
+The time limit counts from when the budget is created, and the evaluation
+limit counts the evaluations of the runs limited by the budget.
+budget.exhausted() returns True once a limit is reached.
+"""
+class Budget:
+
+    def __init__(self, max_time=None, max_evals=None):
+        self.max_time = max_time or None
+        self.max_evals = max_evals or None
+        self.t0 = time.monotonic()
+        self.evals = 0
+        self.stats = None
+
+    def elapsed(self):
+        return time.monotonic() - self.t0
+
+    # Objective function evaluations of the finished runs, and the stats of
+    # the running one (see limited)
+    def evaluations(self):
+        if self.stats is None:
+            return self.evals
+
+        return self.evals + self.stats.evaluations()
+
+    def exhausted(self):
+        if (self.max_time is not None) and (self.elapsed() >= self.max_time):
+            return True
+
+        if (self.max_evals is not None) and (self.evaluations() >= self.max_evals):
+            return True
+
+        return False
+
+"""
+SETTINGS_BUDGET - Budget of the max_time and max_evals algorithm settings
+
+Usage: settings_budget (settings)
+
+Where   settings is a config.AlgoSettings record
+
+Returns: Budget, or None if the settings have no limits
+"""
+def settings_budget(settings):
+
+    if (settings.max_time <= 0) and (settings.max_evals <= 0):
+        return None
+
+    return Budget(settings.max_time, settings.max_evals)
+
+"""
+LIMITED - Runs a solver with a budget, counting its evaluations in the
+          budget if it limits the evaluations
+
+Usage: limited (budget, fn, *args, **kwargs)
+
+Where   budget is a Budget (or None)
+
+The evaluations are collected as per instrument.collect (and also added to
+any stats already being collected). Runs limited within fn with the same
+budget are counted once.
+
+Returns: the result of fn(*args, **kwargs)
+"""
+def limited(budget, fn, *args, **kwargs):
+
+    if (budget is None) or (budget.max_evals is None) or (budget.stats is not None):
+        return fn(*args, **kwargs)
+
+    with instrument.collect() as s:
+        budget.stats = s
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            budget.stats = None
+            budget.evals += s.evaluations()
@@ -10,6 +10,7 @@ Author: Julius Susanto
 Last edited: November 2014
 """
 import numpy as np
+import instrument
 
 """
 GET_TORQUE - Calculate double cage motor torque and stator current (without core loss component)
@@ -32,6 +33,8 @@ complex number and without core loss component)
 """    
 def get_torque(slip, x):
     
+    instrument.count("get_torque")
+    
     # Calculate admittances
     Ys = 1 / complex(x[0], x[1])
     Ym = 1 / complex(0, x[2])
@@ -49,12 +52,286 @@ def get_torque(slip, x):
     
     return torque, ist
 
+"""
+GET_TORQUE_VEC - Array version of get_torque, evaluates the double cage motor
+                 torque and stator current over a vector of slips (and
+                 optionally a batch of parameter vectors) in one call
+
+Usage: get_torque_vec (slip,x)
+
+Where slip is a scalar or array of motor slips (pu)
+       x is a vector of motor equivalent parameters (as per get_torque)
+         or an N x 7 (or N x 8) matrix with one parameter vector per row
+
+Returns: motor torque (pu) and stator current (complex, without core loss
+component) as arrays of shape slip.shape for a single parameter vector, or
+(N,) + slip.shape for a matrix of parameter vectors
+"""
+def get_torque_vec(slip, x):
+
+    instrument.count("get_torque_vec")
+    slip = np.asarray(slip, dtype=float)
+
+    return _torque_dbl(slip, split_params(x, slip.ndim))
+
+# Double cage torque and stator current, with x a sequence of parameter
+# arrays that broadcast elementwise against slip
+def _torque_dbl(slip, x):
+
+    # Calculate admittances
+    Ys = 1 / (x[0] + 1j * x[1])
+    Ym = 1 / (1j * x[2])
+    Yr1 = 1 / (x[3] / slip + 1j * x[4])
+    Yr2 = 1 / (x[5] / slip + 1j * x[6])
+
+    # Calculate voltage and currents
+    u1 = Ys / (Ys + Ym + Yr1 + Yr2)
+    ir1 = np.abs(u1 * Yr1)
+    ir2 = np.abs(u1 * Yr2)
+
+    # Calculate torque and stator current
+    torque = x[3] / slip * (ir1 ** 2) + x[5] / slip * (ir2 ** 2)
+    ist = (1 - u1) * Ys
+
+    return torque, ist
+
+"""
+SPLIT_PARAMS - Splits a parameter vector (or a matrix of parameter vectors,
+               one per row) into a list of parameter arrays that broadcast
+               against a slip array with ndim dimensions
+
+Usage: split_params (x, ndim)
+
+Returns: array whose element k holds parameter k of every row, with shape
+(N,) + (1,) * ndim (or (1,) * ndim for a single vector)
+"""
+def split_params(x, ndim):
+
+    x = np.moveaxis(np.asarray(x, dtype=float), -1, 0)
+
+    return x.reshape(x.shape + (1,) * ndim)
+
+"""
+GET_BREAKDOWN - Calculate double cage motor breakdown torque and breakdown slip
+
+Usage: get_breakdown (x, method)
+
+Where x is a vector of motor equivalent parameters (as per get_torque)
+         or an N x 8 matrix with one parameter vector per row
+       method is the breakdown torque search used:
+         "scan" = interval search over 100 slips (0.01 to 1.00)
+         "golden" = peaks bracketed on a coarse log-spaced slip grid, then
+                    refined by golden-section search
+         "newton" = peaks bracketed on a coarse log-spaced slip grid, then
+                    refined by solving dT/ds = 0 with Newton's method
+                    (default)
+
+Returns: breakdown torque (pu) and breakdown slip (pu), as scalars for a
+single parameter vector or as vectors for a matrix of parameter vectors
+"""
+def get_breakdown(x, method="newton"):
+
+    return _breakdown(_torque_dbl, get_torque, x, method)
+
+# Breakdown torque search settings: coarse bracketing grid over 0.001 to 1.0
+# slip, and refinement tolerance / iteration limit on ln(slip)
+BD_GRID = np.logspace(-3, 0, 16)
+BD_TOL = 1e-5
+BD_MAX_ITER = 20
+
+# Breakdown torque search, where torque is the elementwise (array) torque
+# function and torque_s the scalar one of the motor model
+def _breakdown(torque, torque_s, x, method):
+
+    x = np.abs(np.asarray(x, dtype=float))
+    single = (x.ndim == 1)
+    x = np.atleast_2d(x)
+    rows = np.arange(x.shape[0])
+    
+    if method == "scan":
+        grid = np.arange(1,101) / 100
+    elif (method == "golden") or (method == "newton"):
+        grid = BD_GRID
+    else:
+        raise ValueError("Unknown breakdown torque search method: %s" % method)
+    
+    # Interval search over the grid
+    T = torque(grid, split_params(x, 1))[0]
+    k = np.argmax(T, axis=1)
+    T_b = T[rows, k]
+    s_b = grid[k]
+    
+    if method != "scan":
+        # Candidate peaks are the two highest local maxima on the grid (double
+        # cage curves can have two humps of similar height)
+        T_pad = np.pad(T, ((0,0),(1,1)), constant_values=-np.inf)
+        T_peak = np.where((T >= T_pad[:,:-2]) & (T >= T_pad[:,2:]), T, -np.inf)
+        k = np.argsort(-T_peak, axis=1)[:,0:2]
+        k[:,1] = np.where(np.isfinite(T_peak[rows, k[:,1]]), k[:,1], k[:,0])
+        
+        # Bracket each candidate between its neighbouring grid points and
+        # take a parabolic fit through the three points as the first guess
+        u = np.log(grid)
+        a = u[np.maximum(k - 1, 0)]
+        b = u[np.minimum(k + 1, grid.size - 1)]
+        T_l = T[rows[:,np.newaxis], np.maximum(k - 1, 0)]
+        T_k = T[rows[:,np.newaxis], k]
+        T_r = T[rows[:,np.newaxis], np.minimum(k + 1, grid.size - 1)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u0 = u[k] + (b - a) / 4 * (T_l - T_r) / (T_l - 2 * T_k + T_r)
+        u0 = np.where((u0 > a) & (u0 < b), u0, (a + b) / 2)
+        
+        if single:
+            # Refine with scalar arithmetic (cheaper than numpy for one motor)
+            f = lambda u: torque_s(np.exp(u), x[0])[0]
+            for j in range(0, 1 if k[0,0] == k[0,1] else 2):
+                if method == "golden":
+                    u_b = _golden_scalar(f, a[0,j], b[0,j])
+                else:
+                    u_b = _newton_scalar(f, a[0,j], b[0,j], u0[0,j])
+                
+                T_u = f(u_b)
+                if T_u > T_b[0]:
+                    T_b[0] = T_u
+                    s_b[0] = np.exp(u_b)
+        else:
+            # Refine both candidates of every row in one set of array operations
+            x2 = split_params(np.repeat(x, 2, axis=0), 0)
+            f = lambda u: torque(np.exp(u), x2)[0]
+            if method == "golden":
+                u_b = _golden_vec(f, a.ravel(), b.ravel())
+            else:
+                u_b = _newton_vec(f, a.ravel(), b.ravel(), u0.ravel())
+            
+            T_u = f(u_b).reshape(-1, 2)
+            j = np.argmax(T_u, axis=1)
+            better = (T_u[rows, j] > T_b)
+            T_b = np.where(better, T_u[rows, j], T_b)
+            s_b = np.where(better, np.exp(u_b.reshape(-1, 2)[rows, j]), s_b)
+    
+    if single:
+        return T_b[0], s_b[0]
+    
+    return T_b, s_b
+
+# Golden-section search for the maximum of f(u) over [a, b] (scalar version)
+def _golden_scalar(f, a, b):
+
+    r = (np.sqrt(5) - 1) / 2
+    c = b - r * (b - a)
+    d = a + r * (b - a)
+    f_c = f(c)
+    f_d = f(d)
+    
+    while (b - a) > BD_TOL:
+        if f_c > f_d:
+            # Peak lies in [a, d]
+            b, d, f_d = d, c, f_c
+            c = b - r * (b - a)
+            f_c = f(c)
+        else:
+            # Peak lies in [c, b]
+            a, c, f_c = c, d, f_d
+            d = a + r * (b - a)
+            f_d = f(d)
+    
+    return c if f_c > f_d else d
+
+# Golden-section search for the maximum of f(u) over [a, b] (array version,
+# one interval per element)
+def _golden_vec(f, a, b):
+
+    r = (np.sqrt(5) - 1) / 2
+    c = b - r * (b - a)
+    d = a + r * (b - a)
+    f_c = f(c)
+    f_d = f(d)
+    
+    n = int(np.ceil(np.log(BD_TOL / np.max(b - a)) / np.log(r)))
+    for i in range(0,n):
+        # Keep [a, d] where the peak lies left of d, else keep [c, b]
+        left = (f_c > f_d)
+        a = np.where(left, a, c)
+        b = np.where(left, d, b)
+        
+        # Evaluate the one new interior point of each interval
+        u = np.where(left, b - r * (b - a), a + r * (b - a))
+        f_u = f(u)
+        
+        c, d, f_c, f_d = (np.where(left, u, d), np.where(left, c, u),
+                          np.where(left, f_u, f_d), np.where(left, f_c, f_u))
+    
+    return np.where(f_c > f_d, c, d)
+
+# Newton's method on df/du = 0 for the maximum of f(u) over [a, b], starting
+# at u (scalar version). Derivatives are taken by central differences, and
+# the bracket is bisected whenever the Newton step would leave it.
+def _newton_scalar(f, a, b, u):
+
+    h = 1e-4
+    
+    for i in range(0,BD_MAX_ITER):
+        f_l = f(u - h)
+        f_u = f(u)
+        f_r = f(u + h)
+        df = (f_r - f_l) / (2 * h)
+        d2f = (f_r - 2 * f_u + f_l) / h ** 2
+        
+        # Shrink the bracket towards the peak
+        if df > 0:
+            a = u
+        else:
+            b = u
+        
+        if (d2f < 0) and (a < u - df / d2f < b):
+            u_new = u - df / d2f
+        else:
+            u_new = (a + b) / 2
+        
+        if np.abs(u_new - u) < BD_TOL:
+            return u_new
+        
+        u = u_new
+    
+    return u
+
+# Newton's method on df/du = 0 for the maximum of f(u) over [a, b], starting
+# at u (array version, one interval per element)
+def _newton_vec(f, a, b, u):
+
+    h = 1e-4
+    
+    for i in range(0,BD_MAX_ITER):
+        f_l = f(u - h)
+        f_u = f(u)
+        f_r = f(u + h)
+        df = (f_r - f_l) / (2 * h)
+        d2f = (f_r - 2 * f_u + f_l) / h ** 2
+        
+        # Shrink the bracket towards the peak
+        rising = (df > 0)
+        a = np.where(rising, u, a)
+        b = np.where(rising, b, u)
+        
+        # Take the Newton step if it stays inside the bracket, else bisect
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u_n = u - df / d2f
+        newton = (d2f < 0) & (u_n > a) & (u_n < b)
+        u_new = np.where(newton, u_n, (a + b) / 2)
+        
+        done = np.all(np.abs(u_new - u) < BD_TOL)
+        u = u_new
+        if done:
+            break
+    
+    return u
+
 """
 CALC_PQT - Calculates motor mechanical power, reactive power, breakdown
 torque and efficiency from equivalent circuit parameters (used for double
 cage model with core losses)
 
-Usage: calc_pqt (sf,x)
+Usage: calc_pqt (sf,x,bd_method)
 
 Where sf is the full load slip (pu)
        x is a 8 x 1 vector of motor equivalent parameters:
@@ -67,11 +344,13 @@ Where sf is the full load slip (pu)
             x(5) = Rr2 = outer cage resistance
             x(6) = Xr2 = outer cage reactance
             x(7) = Rc = core resistance
+       bd_method is the breakdown torque search (see get_breakdown)
               
 Returns: y is a vector [Pm Q Tb I_nl]
 """
-def calc_pqt(sf, x):
+def calc_pqt(sf, x, bd_method="newton"):
 
+    instrument.count("calc_pqt")
     x = np.abs(x)
     
     # Calculate full-load torque and current
@@ -96,19 +375,192 @@ def calc_pqt(sf, x):
     # Calculate efficiency (at FL)
     eff_fl = Pm / p_in                                 
     
-    # Calculate breakdown torque with an interval search
-    T_b = 0
-    for n in range(1,101):
-        i = float(n) / 100
-        [T_i, I_i] = get_torque(i,x)                                
-        if T_i > T_b:
-            T_b = T_i           # Calculated breakdown torque
+    # Calculate breakdown torque
+    T_b = get_breakdown(x, bd_method)[0]
 
     [T_lr, i_lr] = get_torque(1,x);
     y = [Pm, Q_fl, T_b, T_lr, np.abs(i_lr + i_c), eff_fl]
     
     return y
+
+"""
+CALC_PQT_BATCH - Batch version of calc_pqt, evaluates the performance of a
+                 whole population of double cage parameter vectors at once
+
+Usage: calc_pqt_batch (sf,x,pqt,bd_method)
+
+Where sf is the full load slip (pu)
+       x is a N x 8 matrix of motor equivalent parameters, one parameter
+         vector [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc] per row
+       pqt is the target performance vector [Pm Q Tb Tlr Ilr eff]
+         (optional)
+       bd_method is the breakdown torque search (see get_breakdown)
+
+Returns: y is a N x 6 matrix with rows [Pm Q Tb Tlr Ilr eff]
+         err is the vector of squared (per-unitised) errors of each row
+         against pqt, or None if pqt is not given
+"""
+def calc_pqt_batch(sf, x, pqt=None, bd_method="newton"):
+
+    x = np.abs(np.atleast_2d(np.asarray(x, dtype=float)))
+    instrument.count("calc_pqt_batch", x.shape[0])
+
+    # Calculate full-load torque and current
+    [T_fl, i_s] = get_torque_vec(sf,x)
+
+    # Calculate mechanical power and reactive power input (at FL)
+    Pm = T_fl * (1 - sf)
+    Q_fl = np.abs(np.imag(np.conj(i_s)))
+
+    # Calculate core loss currents, total input current and input power (at FL)
+    i_c = 1 / x[:,7]
+    i_in = i_s + i_c
+    p_in = np.real(np.conj(i_in))
+
+    # Calculate efficiency (at FL)
+    eff_fl = Pm / p_in
+
+    # Calculate breakdown torque
+    T_b = get_breakdown(x, bd_method)[0]
+
+    [T_lr, i_lr] = get_torque_vec(1,x)
+    y = np.column_stack([Pm, Q_fl, T_b, T_lr, np.abs(i_lr + i_c), eff_fl])
+
+    return y, calc_err(y, pqt)
+
+"""
+CALC_ERR - Squared error of one or more performance vectors against the
+           target performance vector, with each term per-unitised by the
+           target (as used by the solvers' objective functions)
+
+Usage: calc_err (y,pqt)
+
+Returns: vector of squared errors (one per row of y), or None if pqt is None
+"""
+def calc_err(y, pqt):
+
+    if pqt is None:
+        return None
+
+    e = np.divide(np.subtract(pqt, y), pqt)
+
+    return np.sum(e ** 2, axis=-1)
     
+"""
+CALC_PQT_JAC - Calculates the motor performance vector of calc_pqt together
+               with its analytic Jacobian matrix (partial derivatives with
+               respect to the equivalent circuit parameters)
+
+Usage: calc_pqt_jac (sf,x,bd_method)
+
+Where sf is the full load slip (pu)
+       x is a 8 x 1 vector of motor equivalent parameters (as per calc_pqt)
+         or an N x 8 matrix with one parameter vector per row
+       bd_method is the breakdown torque search (see get_breakdown)
+
+Returns: y is the vector [Pm Q Tb Tlr Ilr eff] (N x 6 matrix for N rows)
+         dy is the 6 x 8 Jacobian matrix dy/dx (N x 6 x 8 for N rows)
+
+Note: the breakdown torque derivative is taken at the breakdown slip, where
+dT/ds = 0, so the movement of the breakdown slip itself does not contribute
+"""
+def calc_pqt_jac(sf, x, bd_method="newton"):
+
+    x = np.asarray(x, dtype=float)
+    single = (x.ndim == 1)
+    x = np.atleast_2d(x)
+    instrument.count("calc_pqt_jac", x.shape[0])
+    
+    # Derivative of the np.abs() applied to the parameters
+    sgn = np.where(x < 0, -1.0, 1.0)
+    x = np.abs(x)
+    xp = split_params(x, 0)
+    
+    # Full-load torque, current, mechanical and reactive power
+    [T_fl, i_s, dT_fl, di_s] = _torque_dbl_grad(sf, xp)
+    Pm = T_fl * (1 - sf)
+    dPm = dT_fl * (1 - sf)
+    Q_fl = np.abs(np.imag(i_s))
+    dQ_fl = np.sign(np.imag(i_s)) * np.imag(di_s)
+    
+    # Core loss current, input power and efficiency (at FL)
+    i_c = 1 / x[:,7]
+    di_c = -i_c ** 2
+    p_in = np.real(i_s) + i_c
+    dp_in = np.real(di_s)
+    eff_fl = Pm / p_in
+    deff_fl = (dPm * p_in - Pm * dp_in) / p_in ** 2
+    
+    # Breakdown torque (partial derivatives at the breakdown slip)
+    [T_b, s_b] = get_breakdown(x, bd_method)
+    [T_bs, i_bs, dT_b, di_bs] = _torque_dbl_grad(s_b, xp)
+    
+    # Locked rotor torque and current
+    [T_lr, i_lr, dT_lr, di_lr] = _torque_dbl_grad(1.0, xp)
+    w = i_lr + i_c
+    I_lr = np.abs(w)
+    dI_lr = np.real(np.conj(w) * di_lr) / I_lr
+    
+    y = np.column_stack([Pm, Q_fl, T_b, T_lr, I_lr, eff_fl])
+    
+    # Assemble Jacobian (the last column is Rc, which only enters through i_c)
+    dy = np.zeros(x.shape[0:1] + (6, 8))
+    dy[:,:,0:7] = np.stack([dPm, dQ_fl, dT_b, dT_lr, dI_lr, deff_fl]).transpose(2, 0, 1)
+    dy[:,4,7] = np.real(w) * di_c / I_lr
+    dy[:,5,7] = -Pm * di_c / p_in ** 2
+    dy = dy * sgn[:,np.newaxis,:]
+    
+    if single:
+        return y[0], dy[0]
+    
+    return y, dy
+
+# Double cage torque and stator current with their partial derivatives with
+# respect to [Rs Xs Xm Rr1 Xr1 Rr2 Xr2] (leading axis of dT and dist), with
+# x a sequence of parameter arrays that broadcast elementwise against slip
+def _torque_dbl_grad(slip, x):
+
+    # Calculate admittances
+    Ys = 1 / (x[0] + 1j * x[1])
+    Ym = 1 / (1j * x[2])
+    Yr1 = 1 / (x[3] / slip + 1j * x[4])
+    Yr2 = 1 / (x[5] / slip + 1j * x[6])
+    Yt = Ys + Ym + Yr1 + Yr2
+    
+    # Calculate voltage and currents
+    u1 = Ys / Yt
+    ir1 = u1 * Yr1
+    ir2 = u1 * Yr2
+    
+    # Calculate torque and stator current
+    torque = x[3] / slip * np.abs(ir1) ** 2 + x[5] / slip * np.abs(ir2) ** 2
+    ist = (1 - u1) * Ys
+    
+    # Partial derivatives of the admittances (dY/dR = -Y^2, dY/dX = -jY^2)
+    dYs = np.zeros((7,) + Yt.shape, dtype=complex)
+    dYm = np.zeros_like(dYs)
+    dYr1 = np.zeros_like(dYs)
+    dYr2 = np.zeros_like(dYs)
+    dYs[0] = -Ys ** 2
+    dYs[1] = -1j * Ys ** 2
+    dYm[2] = -1j * Ym ** 2
+    dYr1[3] = -Yr1 ** 2 / slip
+    dYr1[4] = -1j * Yr1 ** 2
+    dYr2[5] = -Yr2 ** 2 / slip
+    dYr2[6] = -1j * Yr2 ** 2
+    
+    # Chain rule through the voltage, currents and torque
+    du1 = (dYs - u1 * (dYs + dYm + dYr1 + dYr2)) / Yt
+    dir1 = du1 * Yr1 + u1 * dYr1
+    dir2 = du1 * Yr2 + u1 * dYr2
+    
+    dT = 2 * (x[3] / slip * np.real(np.conj(ir1) * dir1) + x[5] / slip * np.real(np.conj(ir2) * dir2))
+    dT[3] = dT[3] + np.abs(ir1) ** 2 / slip
+    dT[5] = dT[5] + np.abs(ir2) ** 2 / slip
+    dist = (1 - u1) * dYs - du1 * Ys
+    
+    return torque, ist, dT, dist
+
 """
 GET_TORQUE_SC - Calculate single cage motor torque and stator current (without core loss component)
  
@@ -128,6 +580,8 @@ complex number and without core loss component)
 """    
 def get_torque_sc(slip, x):
     
+    instrument.count("get_torque_sc")
+    
     # Calculate admittances
     Ys = 1 / complex(x[0], x[1])
     Ym = 1 / complex(0, x[2])
@@ -142,12 +596,69 @@ def get_torque_sc(slip, x):
     
     return torque, ist
 
+"""
+GET_TORQUE_SC_VEC - Array version of get_torque_sc, evaluates the single cage
+                    motor torque and stator current over a vector of slips
+                    (and optionally a batch of parameter vectors) in one call
+
+Usage: get_torque_sc_vec (slip,x)
+
+Where slip is a scalar or array of motor slips (pu)
+       x is a vector of motor equivalent parameters (as per get_torque_sc)
+         or an N x 6 matrix with one parameter vector per row
+
+Returns: motor torque (pu) and stator current (complex, without core loss
+component) as arrays of shape slip.shape for a single parameter vector, or
+(N,) + slip.shape for a matrix of parameter vectors
+"""
+def get_torque_sc_vec(slip, x):
+
+    instrument.count("get_torque_sc_vec")
+    slip = np.asarray(slip, dtype=float)
+
+    return _torque_sc(slip, split_params(x, slip.ndim))
+
+# Single cage torque and stator current, with x a sequence of parameter
+# arrays that broadcast elementwise against slip
+def _torque_sc(slip, x):
+
+    # Calculate admittances
+    Ys = 1 / (x[0] + 1j * x[1])
+    Ym = 1 / (1j * x[2])
+    Yr1 = 1 / (x[3] / slip + 1j * x[5])
+
+    # Calculate voltage and currents
+    u1 = Ys / (Ys + Ym + Yr1)
+
+    # Calculate torque and stator current
+    torque = np.abs(x[3] / slip * (Yr1 * u1) ** 2)
+    ist = (1 - u1) * Ys
+
+    return torque, ist
+
+"""
+GET_BREAKDOWN_SC - Calculate single cage motor breakdown torque and breakdown
+                   slip
+
+Usage: get_breakdown_sc (x, method)
+
+Where x is a vector of motor equivalent parameters (as per get_torque_sc)
+         or an N x 6 matrix with one parameter vector per row
+       method is the breakdown torque search used (as per get_breakdown)
+
+Returns: breakdown torque (pu) and breakdown slip (pu), as scalars for a
+single parameter vector or as vectors for a matrix of parameter vectors
+"""
+def get_breakdown_sc(x, method="newton"):
+
+    return _breakdown(_torque_sc, get_torque_sc, x, method)
+
 """
 CALC_PQT_SC - Calculates motor mechanical power, reactive power, breakdown
 torque and efficiency from equivalent circuit parameters (used for single
 cage model with core losses)
 
-Usage: calc_pqt_sc (sf,x)
+Usage: calc_pqt_sc (sf,x,bd_method)
 
 Where sf is the full load slip (pu)
        x is a 6 x 1 vector of motor equivalent parameters:
@@ -158,11 +669,13 @@ Where sf is the full load slip (pu)
             x(3) = Rr1 = rotor resistance
             x(5) = Xr1 = rotor reactance
             x(4) = Rc = core resistance
+       bd_method is the breakdown torque search (see get_breakdown)
               
 Returns: y is a vector [Pm Q Tb eff]
 """
-def calc_pqt_sc(sf, x):
+def calc_pqt_sc(sf, x, bd_method="newton"):
 
+    instrument.count("calc_pqt_sc")
     x = np.abs(x)
     
     # Calculate full-load torque and current
@@ -170,31 +683,69 @@ def calc_pqt_sc(sf, x):
     
     # Calculate mechanical power (at FL)
     Pm = T_fl * (1 - sf)                               
-    Sn = np.complex(1,0) * np.conj(i_s)
+    Sn = complex(1,0) * np.conj(i_s)
     
     # Calculate reactive power input (at FL)
     Q_fl = np.abs(np.imag(Sn)) 
 
     # Calculate core loss currents (at FL)
-    i_c = 1 / np.complex (x[4],0)
+    i_c = 1 / complex(x[4],0)
 
     # Calculate total input current (at FL)    
     i_in = i_s + i_c
 
     # Calculate input power (at FL)
-    p_in = np.real(np.complex(1,0) * np.conj(i_in))
+    p_in = np.real(complex(1,0) * np.conj(i_in))
     
     # Calculate efficiency (at FL)
     eff_fl = Pm / p_in                                 
 
-    # Calculate breakdown torque with an interval search
-    T_b = 0
-    for n in range(1,101):
-        i = float(n) / 100
-        [T_i, I_i] = get_torque_sc(i,x)                                
-        if T_i > T_b:
-            T_b = T_i           # Calculated breakdown torque
+    # Calculate breakdown torque
+    T_b = get_breakdown_sc(x, bd_method)[0]
 
     y = [Pm, Q_fl, T_b, eff_fl]
     
-    return y
\ No newline at end of file
+    return y
+
+"""
+CALC_PQT_SC_BATCH - Batch version of calc_pqt_sc, evaluates the performance of
+                    a whole population of single cage parameter vectors at once
+
+Usage: calc_pqt_sc_batch (sf,x,pqt,bd_method)
+
+Where sf is the full load slip (pu)
+       x is a N x 6 matrix of motor equivalent parameters, one parameter
+         vector [Rs Xs Xm Rr1 Rc Xr1] per row
+       pqt is the target performance vector [Pm Q Tb eff] (optional)
+       bd_method is the breakdown torque search (see get_breakdown)
+
+Returns: y is a N x 4 matrix with rows [Pm Q Tb eff]
+         err is the vector of squared (per-unitised) errors of each row
+         against pqt, or None if pqt is not given
+"""
+def calc_pqt_sc_batch(sf, x, pqt=None, bd_method="newton"):
+
+    x = np.abs(np.atleast_2d(np.asarray(x, dtype=float)))
+    instrument.count("calc_pqt_sc_batch", x.shape[0])
+
+    # Calculate full-load torque and current
+    [T_fl, i_s] = get_torque_sc_vec(sf,x)
+
+    # Calculate mechanical power and reactive power input (at FL)
+    Pm = T_fl * (1 - sf)
+    Q_fl = np.abs(np.imag(np.conj(i_s)))
+
+    # Calculate core loss currents, total input current and input power (at FL)
+    i_c = 1 / x[:,4]
+    i_in = i_s + i_c
+    p_in = np.real(np.conj(i_in))
+
+    # Calculate efficiency (at FL)
+    eff_fl = Pm / p_in
+
+    # Calculate breakdown torque
+    T_b = get_breakdown_sc(x, bd_method)[0]
+
+    y = np.column_stack([Pm, Q_fl, T_b, eff_fl])
+
+    return y, calc_err(y, pqt)
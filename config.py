@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Motor Data and Algorithm Settings Records
+
+MotorData and AlgoSettings are immutable records (named tuples, without
+instance dictionaries) holding the data of one estimation job. They are
+passed explicitly to the solvers, so that several jobs can run at once in
+threads or processes. The globals module dicts are kept for the GUI and can
+be converted with from_dict / as_dict.
+"""
+from collections import namedtuple
+
+# Field names and default values
+MOTOR_DEFAULTS = [
+    ("description",     "Toshiba 6.6kV 350kW"),
+    ("sync_speed",      1500.0),
+    ("rated_speed",     1481.0),
+    ("rated_pf",        0.87),
+    ("rated_eff",       0.91),
+    ("T_b",             3.2),
+    ("T_lr",            2.4),
+    ("I_lr",            6.5),
+    ("rated_power",     1.0),
+    ("rated_current",   10.0),
+    ("rated_voltage",   220.0)
+    ]
+
+ALGO_DEFAULTS = [
+    ("max_iter",        30),
+    ("k_r",             1.0),
+    ("k_x",             0.5),
+    ("conv_err",        1e-5),
+    ("n_gen",           30),
+    ("pop",             20),
+    ("n_r",             15),
+    ("n_e",             2),
+    ("c_f",             0.8),
+    ("n_starts",        1),
+    ("n_workers",       1),
+    ("cache_size",      4096),
+    ("cache_tol",       1e-6),
+    ("max_time",        0.0),
+    ("max_evals",       0)
+    ]
+
+# Convert values to the type of the field's default value (ints, floats and
+# strings), ignoring unknown fields
+def coerce(defaults, d):
+    types = {key : type(value) for [key, value] in defaults}
+
+    return {key : types[key](value) for [key, value] in d.items() if key in types}
+
+class Record(object):
+    __slots__ = ()
+
+    # Create a record from a dictionary (e.g. globals.motor_data), missing
+    # fields are taken from base (or the default values) and unknown fields
+    # are ignored
+    @classmethod
+    def from_dict(cls, d, base=None):
+        if base is None:
+            base = cls()
+
+        return base._replace(**coerce(cls.DEFAULTS, d))
+
+    # Copy of the record with some fields changed
+    def replace(self, **changes):
+        return self._replace(**coerce(self.DEFAULTS, changes))
+
+    def as_dict(self):
+        return dict(self._asdict())
+
+class MotorData(Record, namedtuple("MotorData", [key for [key, value] in MOTOR_DEFAULTS], defaults=[value for [key, value] in MOTOR_DEFAULTS])):
+    """
+    Motor nameplate data
+
+    Fields: description, sync_speed, rated_speed (rpm), rated_pf, rated_eff
+            (pu), T_b, T_lr (as # of FL torque), I_lr (pu), rated_power,
+            rated_current, rated_voltage
+    """
+    __slots__ = ()
+    DEFAULTS = MOTOR_DEFAULTS
+
+    # Full-load slip (pu)
+    @property
+    def sf(self):
+        return (self.sync_speed - self.rated_speed) / self.sync_speed
+
+class AlgoSettings(Record, namedtuple("AlgoSettings", [key for [key, value] in ALGO_DEFAULTS], defaults=[value for [key, value] in ALGO_DEFAULTS])):
+    """
+    Algorithm settings
+
+    Fields: max_iter, k_r, k_x, conv_err (descent algorithms), n_gen, pop, n_r,
+            n_e, c_f (genetic and hybrid algorithms), n_starts (multi-start
+            descent algorithms, 1 for a single start), n_workers (parallel
+            evaluation), cache_size, cache_tol (hybrid descent cache),
+            max_time (s), max_evals (solver budget, 0 for no limit, see
+            budget.py)
+    """
+    __slots__ = ()
+    DEFAULTS = ALGO_DEFAULTS
+
+"""
+MOTOR_RECORD / ALGO_RECORD - Converts motor data or algorithm settings given
+                             as a record or a dictionary to a record
+
+Usage: motor_record (motor_data)
+       algo_record (algo_data)
+
+Returns: MotorData or AlgoSettings record (defaults if None)
+"""
+def motor_record(motor_data):
+
+    if isinstance(motor_data, MotorData):
+        return motor_data
+
+    return MotorData.from_dict(motor_data or {})
+
+def algo_record(algo_data):
+
+    if isinstance(algo_data, AlgoSettings):
+        return algo_data
+
+    return AlgoSettings.from_dict(algo_data or {})
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Convergence Plot
+
+Embedded plot of the squared error of a running estimation, against the
+iteration (descent algorithms) or generation (genetic and hybrid
+algorithms), fed with points from the solver trace (see solvertrace.py).
+New points are blitted over a cached background; the whole plot is only
+redrawn when the points go beyond the axes limits or the plot is resized.
+"""
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+
+class ConvergencePlot(FigureCanvasQTAgg):
+    """
+    Squared error of accepted steps (or best member) as a line, rejected
+    descent steps as markers and the population mean error as a dashed line,
+    on a logarithmic scale with the convergence criterion as a target
+    """
+
+    def __init__(self, parent=None):
+        self.figure = Figure(figsize=(6, 2), facecolor='white')
+        super(ConvergencePlot, self).__init__(self.figure)
+        self.setParent(parent)
+
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_yscale('log')
+        self.ax.set_ylabel("Squared error")
+        self.ax.grid(color = '0.75', linestyle='--', linewidth=1)
+
+        self.target = self.ax.axhline(1e-5, color='g', linestyle=':', linewidth=1)
+        [self.best] = self.ax.plot([], [], 'b', animated=True)
+        [self.mean] = self.ax.plot([], [], 'b--', linewidth=0.75, animated=True)
+        [self.rejected] = self.ax.plot([], [], 'rx', markersize=4, animated=True)
+        self.lines = [self.mean, self.rejected, self.best]
+
+        self.background = None
+        self.mpl_connect('draw_event', self.on_draw)
+        self.start(30, 1e-5, "Iteration")
+
+    # Clear the plot for a new run of n iterations (or generations) with
+    # convergence criterion conv_err
+    def start(self, n, conv_err, label):
+        self.x = []
+        self.err = []
+        self.x_rej = []
+        self.err_rej = []
+        self.err_mean = []
+
+        # Accepted points and last iteration of each solver (the records of
+        # several solvers, e.g. of a race, are drawn as separate segments)
+        self.series = {}
+        self.last = {}
+
+        self.ax.set_xlim(0, max(n, 1))
+        self.ax.set_ylim(conv_err / 10, 1.0)
+        self.ax.set_xlabel(label)
+        self.target.set_ydata([conv_err, conv_err])
+
+        for line in self.lines:
+            line.set_data([], [])
+
+        self.draw_idle()
+
+    # Add a list of solvertrace.TraceRecord to the plot
+    def add(self, records):
+        for r in records:
+            [iter, err, accepted, err_mean] = [r.iter, float(r.err), r.accepted, float(r.err_mean)]
+            if not (np.isfinite(err) and (err > 0)):
+                continue
+
+            # Stop records repeat the best solution so far
+            if r.reason:
+                continue
+
+            if accepted:
+                [xs, errs, means] = self.series.setdefault(r.solver, ([], [], []))
+
+                # A new run (e.g. a warm start retried) starts a new segment
+                if (r.solver in self.last) and (iter < self.last[r.solver]):
+                    xs.append(np.nan)
+                    errs.append(np.nan)
+                    means.append(np.nan)
+                xs.append(iter)
+                errs.append(err)
+                means.append(err_mean if err_mean > 0 else np.nan)
+                self.last[r.solver] = iter
+            else:
+                self.x_rej.append(iter)
+                self.err_rej.append(err)
+
+        self.x = [v for [xs, errs, means] in self.series.values() for v in xs + [np.nan]]
+        self.err = [v for [xs, errs, means] in self.series.values() for v in errs + [np.nan]]
+        self.err_mean = [v for [xs, errs, means] in self.series.values() for v in means + [np.nan]]
+
+        self.best.set_data(self.x, self.err)
+        self.mean.set_data(self.x, self.err_mean)
+        self.rejected.set_data(self.x_rej, self.err_rej)
+
+        if self.rescale() or (self.background is None):
+            self.draw_idle()
+        else:
+            self.blit_lines()
+
+    # Extend the axes limits (by whole decades) to fit the points, returns
+    # True if they changed
+    def rescale(self):
+        errs = [e for e in self.err + self.err_mean + self.err_rej if np.isfinite(e)]
+        xs = [x for x in self.x + self.x_rej if np.isfinite(x)]
+        if not errs:
+            return False
+
+        [x0, x1] = self.ax.get_xlim()
+        [y0, y1] = self.ax.get_ylim()
+        changed = False
+
+        if max(xs) > x1:
+            x1 = 2 * max(xs)
+            changed = True
+        if min(errs) < y0:
+            y0 = 10 ** np.floor(np.log10(min(errs)))
+            changed = True
+        if max(errs) > y1:
+            y1 = 10 ** np.ceil(np.log10(max(errs)))
+            changed = True
+
+        if changed:
+            self.ax.set_xlim(x0, x1)
+            self.ax.set_ylim(y0, y1)
+
+        return changed
+
+    # Cache the background after a full redraw, then draw the lines over it
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
+    def blit_lines(self):
+        self.restore_region(self.background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.blit(self.figure.bbox)
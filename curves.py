@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Torque-Speed and Current-Speed Curves
+
+The curves of an equivalent circuit are evaluated over a whole speed grid in
+one array operation (common_calcs.get_torque_vec / get_torque_sc_vec),
+optionally refined around the breakdown torque, and cached per parameter
+vector so that plotting or writing the same result again costs nothing.
+"""
+import csv
+from collections import namedtuple, OrderedDict
+import numpy as np
+from config import motor_record
+from common_calcs import get_torque_vec, get_torque_sc_vec, get_breakdown, get_breakdown_sc
+
+# Default number of speed steps from standstill to synchronous speed
+N_POINTS = 1000
+
+# Number of extra speeds between the grid points either side of the breakdown
+# torque
+N_REFINE = 50
+
+"""
+CURVES - Torque-speed and current-speed curves of a motor
+
+Fields: speed (rpm)
+        torque (T/Tn)
+        current (stator current magnitude, pu)
+        breakdown is the index of the breakdown (maximum) torque
+"""
+Curves = namedtuple("Curves", ["speed", "torque", "current", "breakdown"])
+
+"""
+SPEED_GRID - Evenly spaced speeds from standstill to synchronous speed
+
+Usage: speed_grid (sync_speed, n)
+
+Returns: array of n + 1 speeds (rpm)
+"""
+def speed_grid(sync_speed, n=N_POINTS):
+
+    return np.arange(n + 1) / n * sync_speed
+
+"""
+CALC_CURVES - Calculates the torque-speed and current-speed curves of a motor
+
+Usage: calc_curves (model, x, motor, speed, refine)
+
+Where   model is "Single cage" or "Double cage"
+        x is the vector of equivalent circuit parameters (as per the solvers)
+        motor is a config.MotorData record (or a motor data dictionary)
+        speed is an array of speeds in rpm (default speed_grid with N_POINTS
+          steps)
+        refine is a true/false flag to add N_REFINE speeds either side of the
+          breakdown torque of the grid, and the exact breakdown speed (from
+          the breakdown slip of common_calcs.get_breakdown)
+
+The torque and current at synchronous speed are taken as zero.
+
+Returns: Curves
+"""
+def calc_curves(model, x, motor, speed=None, refine=True):
+
+    motor = motor_record(motor)
+    if speed is None:
+        speed = speed_grid(motor.sync_speed)
+
+    speed = np.asarray(speed, dtype=float)
+    [torque, current] = eval_speeds(model, x, motor, speed)
+
+    if refine and (len(speed) > 2):
+        i = int(np.argmax(torque))
+        extra = np.concatenate([np.linspace(speed[j], speed[j + 1], N_REFINE + 2)[1:-1] for j in (i - 1, i) if 0 <= j < len(speed) - 1])
+
+        # Exact breakdown point (if it is within the speed range)
+        speed_b = (1 - breakdown_slip(model, x)) * motor.sync_speed
+        if speed[0] < speed_b < speed[-1]:
+            extra = np.append(extra, speed_b)
+
+        [t_extra, i_extra] = eval_speeds(model, x, motor, extra)
+
+        order = np.argsort(np.concatenate([speed, extra]), kind="stable")
+        speed = np.concatenate([speed, extra])[order]
+        torque = np.concatenate([torque, t_extra])[order]
+        current = np.concatenate([current, i_extra])[order]
+
+    return Curves(speed, torque, current, int(np.argmax(torque)))
+
+# Breakdown slip (pu) of an equivalent circuit
+def breakdown_slip(model, x):
+    x = np.abs(np.asarray(x, dtype=float))
+
+    if model == "Single cage":
+        return get_breakdown_sc(x)[1]
+
+    return get_breakdown(x)[1]
+
+# Torque (T/Tn) and current magnitude (pu) at an array of speeds
+def eval_speeds(model, x, motor, speed):
+    slip = 1 - speed / motor.sync_speed
+    torque = np.zeros(len(speed))
+    current = np.zeros(len(speed))
+    run = slip != 0
+
+    if model == "Single cage":
+        [Ti, Ii] = get_torque_sc_vec(slip[run], x)
+    else:
+        [Ti, Ii] = get_torque_vec(slip[run], x)
+
+    # Rated per-unit torque
+    T_rtd = motor.rated_eff * motor.rated_pf / (1 - motor.sf)
+
+    torque[run] = Ti / T_rtd
+    current[run] = np.abs(Ii)
+
+    return torque, current
+
+"""
+CURVECACHE - In-memory cache of curves, keyed by model, parameter vector,
+             motor data and speed grid
+
+Usage: cache = CurveCache (max_entries)
+
+Where   max_entries is the number of curves kept (least recently used are
+          evicted first)
+
+Curves are returned by cache.curves(model, x, motor, speed, refine), with the
+arguments of calc_curves, and are calculated only if not cached. The number
+of lookups found and not found are counted in cache.hits and cache.misses.
+The arrays of cached curves are shared and must not be changed.
+"""
+class CurveCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def curves(self, model, x, motor, speed=None, refine=True):
+        motor = motor_record(motor)
+        grid = None if speed is None else np.asarray(speed, dtype=float).tobytes()
+        key = (model, np.asarray(x, dtype=float).tobytes(), motor.sync_speed, motor.rated_speed, motor.rated_pf, motor.rated_eff, grid, bool(refine))
+
+        c = self.entries.get(key)
+        if c is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return c
+
+        self.misses += 1
+        c = calc_curves(model, x, motor, speed, refine)
+        for a in c[0:3]:
+            a.flags.writeable = False
+
+        self.entries[key] = c
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return c
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Default cache (used by get_curves)
+cache = CurveCache()
+
+"""
+GET_CURVES - Calculates the curves of a motor (as per calc_curves), using the
+             default cache
+"""
+def get_curves(model, x, motor, speed=None, refine=True):
+
+    return cache.curves(model, x, motor, speed, refine)
+
+"""
+WRITE_CURVES - Writes curves as a CSV file (speed, torque and current
+               columns)
+"""
+def write_curves(c, filename):
+
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["speed", "torque", "current"])
+        writer.writerows(zip(c.speed.tolist(), c.torque.tolist(), c.current.tolist()))
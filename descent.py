@@ -10,16 +10,157 @@ Author: Julius Susanto
 Last edited: August 2014
 """
 import numpy as np
-from common_calcs import get_torque, calc_pqt, get_torque_sc, calc_pqt_sc
+import instrument
+from solvertrace import step_record, generation_record, stop_record
+from common_calcs import calc_pqt, calc_pqt_sc, calc_pqt_jac
+
+# Jacobian matrices with a condition number over COND_MAX are singular to
+# working precision
+COND_MAX = 1 / np.finfo(float).eps
+
+"""
+SINGULAR - Checks if a Jacobian matrix is singular (or has non-finite
+           elements)
+
+Usage: singular (j)
+
+Where   j is a square matrix (or a K x n x n stack of matrices)
+
+Returns: True if j is singular to working precision (a vector of flags for a
+         stack of matrices)
+"""
+def singular(j):
+    
+    j = np.asarray(j, dtype=float)
+    finite = np.all(np.isfinite(j), axis=(-2,-1))
+    cond = np.full(finite.shape, np.inf)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if j.ndim == 2:
+            if finite:
+                cond = np.linalg.cond(j)
+        elif np.any(finite):
+            cond[finite] = np.linalg.cond(j[finite])
+    
+    return ~(cond <= COND_MAX)
+
+"""
+UPDATE_Z - Change of variables from the constrained parameters x back to the
+           double cage equivalent circuit parameters z (updates z in place)
+
+Usage: update_z (z, x, mode, kx, kr)
+
+Where   z is the 8 x 1 vector of equivalent circuit parameters
+          z = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
+        x is the 6 x 1 vector of constrained parameters
+          x = [Rr1 Rr2-Rr1 Xm Xs Xr1-Xr2 Rc]
+        mode = 0: normal, 1: fixed Rs and Xr2
+        kx and kr are linear restrictions in normal mode
+
+Also accepts K x 8 and K x 6 matrices (one member per row) with kx and kr
+as vectors of length K
+"""
+def update_z(z, x, mode, kx, kr):
+    
+    z[...,1] = x[...,3]
+    z[...,2] = x[...,2]
+    z[...,3] = x[...,0]
+    
+    if mode == 0:
+        z[...,4] = kx * x[...,3] + x[...,4]
+    else:
+        z[...,4] = z[...,6] + x[...,4]
+    
+    z[...,5] = x[...,0] + x[...,1]
+    z[...,7] = x[...,5]
+    
+    if mode == 0:
+        z[...,0] = kr * z[...,3]
+        z[...,6] = kx * z[...,1]
+
+"""
+DZ_DX - Jacobian matrix dz/dx of the change of variables in update_z
+
+Usage: dz_dx (mode, kx, kr)
+
+Returns: 8 x 6 matrix (K x 8 x 6 if kx and kr are vectors of length K)
+"""
+def dz_dx(mode, kx, kr):
+    
+    kx = np.asarray(kx, dtype=float)
+    kr = np.asarray(kr, dtype=float)
+    m = np.zeros(np.broadcast_shapes(kx.shape, kr.shape) + (8,6))
+    
+    m[...,1,3] = 1      # Xs = x(3)
+    m[...,2,2] = 1      # Xm = x(2)
+    m[...,3,0] = 1      # Rr1 = x(0)
+    m[...,4,4] = 1      # Xr1 = kx * x(3) + x(4), or Xr2 + x(4)
+    m[...,5,0] = 1      # Rr2 = x(0) + x(1)
+    m[...,5,1] = 1
+    m[...,7,5] = 1      # Rc = x(5)
+    
+    if mode == 0:
+        m[...,0,0] = kr     # Rs = kr * x(0)
+        m[...,4,3] = kx
+        m[...,6,3] = kx     # Xr2 = kx * x(3)
+    
+    return m
+
+"""
+OBJECTIVE_JAC - Evaluates the double cage objective function
+                y = (pqt - calc_pqt(sf,z)) / pqt and its Jacobian matrix
+                dy/dx with respect to the constrained parameters x
+
+Usage: objective_jac (sf, pqt, x, z, mode, kx, kr, jac)
+
+Where   sf is the full-load slip
+        pqt is the target performance vector [Pm Q Tb Tlr Ilr eff]
+        x and z are the current constrained and circuit parameters
+        mode, kx and kr are as per update_z
+        jac is the Jacobian matrix used:
+          "analytic" = chain rule through calc_pqt_jac (one evaluation, also
+                       accepts K x 6 / K x 8 matrices of members)
+          "fd" = forward differences with step h = 0.00001 (seven
+                 calc_pqt evaluations)
+
+Returns: y is the objective function vector
+         j is the 6 x 6 Jacobian matrix (K x 6 x 6 for K members)
+"""
+def objective_jac(sf, pqt, x, z, mode, kx, kr, jac):
+    
+    pqt = np.asarray(pqt, dtype=float)
+    
+    if jac == "analytic":
+        [f, df] = calc_pqt_jac(sf, z)
+        y = np.divide(np.subtract(pqt, f), pqt)
+        j = -np.matmul(df, dz_dx(mode, kx, kr)) / pqt[:,np.newaxis]
+    
+    elif jac == "fd":
+        h = 0.00001
+        y = np.divide(np.subtract(pqt, calc_pqt(sf,z)), pqt)
+        
+        j = np.zeros((6,6))
+        x_h = np.copy(x)
+        z_h = np.copy(z)
+        for i in range(0,6):
+            x_h[i] = x[i] + h
+            update_z(z_h, x_h, mode, kx, kr)
+            j[:,i] = (np.divide(np.subtract(pqt, calc_pqt(sf,z_h)), pqt) - y) / h
+            x_h[i] = x[i]
+    
+    else:
+        raise ValueError("Unknown Jacobian matrix type: %s" % jac)
+    
+    return y, j
 
 """
 NR_SOLVER  - Newton-Rhapson solver for double cage model with core losses
              Solves for 6 circuit parameters [Xs Xm Rr1 Xr1 Rr2 Rc]
              Includes change of variables
              Includes adaptive step size (as per Pedra 2008)
-             Includes determinant check of jacobian matrix
+             Includes singularity check of jacobian matrix
 
-Usage: nr_solver (p, mode, kx, kr, max_iter, err_tol)
+Usage: nr_solver (p, mode, kx, kr, max_iter, err_tol, jac, z0, trace, budget)
 
 Where   p is a vector of motor performance parameters:
         p = [sf eff pf Tb Tlr Ilr]
@@ -34,6 +175,18 @@ Where   p is a vector of motor performance parameters:
                   and fixed Xr2 and Kr in mode 1
         max_iter is the maximum number of iterations  
         err_tol is the error tolerance for convergence
+        jac is the Jacobian matrix used: "analytic" (default) or "fd"
+          (forward differences)
+        z0 is an optional initial vector of equivalent circuit parameters
+          (default is the standard initial estimate), Rs and Xr2 are still
+          set by the restrictions or fixed values
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every trial step (and a stop record if the run stops early)
+        budget is an optional budget.Budget, the run stops when it is
+          exhausted
+
+The best solution found is returned (the last trial step may have been
+rejected).
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
@@ -49,7 +202,7 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def nr_solver(p, mode, kx, kr, max_iter, err_tol):
+def nr_solver(p, mode, kx, kr, max_iter, err_tol, jac="analytic", z0=None, trace=None, budget=None):
     
     # Human-readable motor performance parameters
     # And base value initialisation
@@ -65,12 +218,15 @@ def nr_solver(p, mode, kx, kr, max_iter, err_tol):
 
     # Set initial conditions
     z = np.zeros(8)
-    z[2] = 1 / Q_fl            #Xm
-    z[1] = 0.05 * z[2]         #Xs
-    z[3] = 1 / Pm_fl * sf      #Rr1
-    z[4] = 1.2 * z[1]          #Xr1
-    z[5] = 5 * z[3]            #Rr2
-    z[7] = 12
+    if z0 is None:
+        z[2] = 1 / Q_fl            #Xm
+        z[1] = 0.05 * z[2]         #Xs
+        z[3] = 1 / Pm_fl * sf      #Rr1
+        z[4] = 1.2 * z[1]          #Xr1
+        z[5] = 5 * z[3]            #Rr2
+        z[7] = 12
+    else:
+        z[:] = z0
     
     if mode == 0:
         z[0] = kr * z[3]           #Rs
@@ -92,7 +248,6 @@ def nr_solver(p, mode, kx, kr, max_iter, err_tol):
     pqt = [Pm_fl, Q_fl, T_b, T_lr, i_lr, eff]
 
     # Set up NR algorithm parameters
-    h = 0.00001
     n = 0
     hn = 1
     hn_min = 0.0000001
@@ -100,43 +255,29 @@ def nr_solver(p, mode, kx, kr, max_iter, err_tol):
     iter = 0
     conv = 0
     
+    # Best solution so far
+    z_best = np.copy(z)
+    err_best = np.inf
+    
+    # Reason the run stopped early, if it did (see solvertrace.STOP_REASONS)
+    reason = ""
+    
     # Run NR algorithm
-    while (err > err_tol) and (iter < max_iter):
+    while (err > err_tol) and (iter < max_iter) and not reason:
         
-        # Evaluate objective function for current iteration
-        diff = np.subtract(pqt, calc_pqt(sf,z))
-        y = np.divide(diff, pqt)
+        # Evaluate objective function and Jacobian matrix for current iteration
+        t = instrument.start()
+        [y, j] = objective_jac(sf, pqt, x, z, mode, kx, kr, jac)
+        instrument.stop("jacobian", t)
         err0 = np.dot(y, np.transpose(y))
         
-        # Construct Jacobian matrix
-        j = np.zeros((6,6))
-        for i in range(1,7):
-            x[i-1] = x[i-1] + h
-            
-            # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
-            
-            diff = np.subtract(pqt, calc_pqt(sf,z))
-            j[:,i-1] = (np.divide(diff, pqt) - y) / h
-            x[i-1] = x[i-1] - h
+        if err0 < err_best:
+            z_best = np.copy(z)
+            err_best = err0
         
         # Check if jacobian matrix is singular and exit function if so
-        if (np.linalg.det(j) == 0):
-            print("Jacobian matrix is singular")
+        if singular(j):
+            reason = "singular"
             break
         
         x_reset = x
@@ -146,60 +287,73 @@ def nr_solver(p, mode, kx, kr, max_iter, err_tol):
         # Inner loop (descent direction check and step size adjustment)
         while (iter == iter0):
             # Calculate next iteration and update x
-            jmat = np.matrix(j)
-            delta_x = np.dot(jmat.getI(), np.transpose(y)).A[0]
+            t = instrument.start()
+            try:
+                delta_x = np.linalg.solve(j, y)
+            except np.linalg.LinAlgError:
+                # Singular to working precision, keep the best solution so far
+                reason = "singular"
+                break
+            t = instrument.lap("solve", t)
             x = np.abs(np.subtract(x, hn * delta_x))
             
             # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
+            update_z(z, x, mode, kx, kr)
             
             # Calculate squared error terms
             diff = np.subtract(pqt, calc_pqt(sf,z))
             y = np.divide(diff, pqt)
             err = np.dot(y, np.transpose(y))
             
+            if err < err_best:
+                z_best = np.copy(z)
+                err_best = err
+            
             # Descent direction check and step size adjustment
             if (np.abs(err) >= np.abs(err0)):
                 n = n + 1
                 hn = 2 ** (-n)
                 x = x_reset
                 y = y_reset
+                instrument.stop("retry", t)
             else:
                 n = 0
                 iter = iter + 1
+                instrument.stop("step", t)
             
-            # If descent direction isn't minimising, then there is no convergence
+            if trace is not None:
+                trace(step_record("NR", iter, err, hn, np.nan, iter > iter0, z))
+            
+            # If descent direction isn't minimising, then stop (the best
+            # solution so far may still have converged)
             if (hn < hn_min):
-                break 
+                reason = "stalled"
+                break
+            
+            # Stop with the best solution so far if the budget is exhausted
+            if (budget is not None) and budget.exhausted():
+                reason = "budget"
+                break
 
-    if err < err_tol:
+    # Record why the run stopped early
+    if (trace is not None) and reason:
+        trace(stop_record("NR", iter, err_best, z_best, reason))
+    
+    # Output the best solution (the last trial step may have been rejected)
+    if err_best < err_tol:
         conv = 1
     
-    return z, iter, err, conv
+    return z_best, iter, err_best, conv
 
 """
 LM_SOLVER  - Levenberg-Marquadt solver for double cage model with core losses
              Solves for 6 circuit parameters [Xs Xm Rr1 Xr1 Rr2 Rc]
              Includes change of variables
              Includes adaptive step size (as per Pedra 2008)
-             Includes determinant check of jacobian matrix
+             Includes singularity check of jacobian matrix
              Basic error adjustment of damping parameter lambda
 
-Usage: lm_solver (p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol)
+Usage: lm_solver (p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol, jac, z0, trace, budget)
 
 Where   p is a vector of motor performance parameters:
         p = [sf eff pf Tb Tlr Ilr]
@@ -216,6 +370,18 @@ Where   p is a vector of motor performance parameters:
         lambda_max is maximum damping parameter
         max_iter is the maximum number of iterations
         err_tol is the error tolerance for convergence
+        jac is the Jacobian matrix used: "analytic" (default) or "fd"
+          (forward differences)
+        z0 is an optional initial vector of equivalent circuit parameters
+          (default is the standard initial estimate), Rs and Xr2 are still
+          set by the restrictions or fixed values
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every trial step (and a stop record if the run stops early)
+        budget is an optional budget.Budget, the run stops when it is
+          exhausted
+
+The best solution found is returned (the last trial step may have been
+rejected).
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
@@ -231,7 +397,7 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
+def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol, jac="analytic", z0=None, trace=None, budget=None):
     
     # Human-readable motor performance parameters
     # And base value initialisation
@@ -247,12 +413,15 @@ def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
 
     # Set initial conditions
     z = np.zeros(8)
-    z[2] = 1 / Q_fl            #Xm
-    z[1] = 0.05 * z[2]         #Xs
-    z[3] = 1 / Pm_fl * sf      #Rr1
-    z[4] = 1.2 * z[1]          #Xr1
-    z[5] = 5 * z[3]            #Rr2
-    z[7] = 12
+    if z0 is None:
+        z[2] = 1 / Q_fl            #Xm
+        z[1] = 0.05 * z[2]         #Xs
+        z[3] = 1 / Pm_fl * sf      #Rr1
+        z[4] = 1.2 * z[1]          #Xr1
+        z[5] = 5 * z[3]            #Rr2
+        z[7] = 12
+    else:
+        z[:] = z0
     
     if mode == 0:
         z[0] = kr * z[3]           #Rs
@@ -274,7 +443,6 @@ def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
     pqt = [Pm_fl, Q_fl, T_b, T_lr, i_lr, eff]
 
     # Set up LM algorithm parameters
-    h = 0.00001
     lambda_i = lambda_0
     err = 1.0
     iter = 0
@@ -282,43 +450,31 @@ def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
     beta = 3
     gamma = 3
     
+    # Best solution so far
+    z_best = np.copy(z)
+    err_best = np.inf
+    
+    # Reason the run stopped early, if it did (see solvertrace.STOP_REASONS)
+    reason = ""
+    
     # Run LM algorithm
-    while (err > err_tol) and (iter < max_iter):
+    while (err > err_tol) and (iter < max_iter) and not reason:
         
-        # Evaluate objective function for current iteration
-        diff = np.subtract(pqt, calc_pqt(sf,z))
-        y = np.divide(diff, pqt)
+        # Evaluate objective function and Jacobian matrix for current iteration
+        t = instrument.start()
+        [y, j] = objective_jac(sf, pqt, x, z, mode, kx, kr, jac)
+        instrument.stop("jacobian", t)
         err0 = np.dot(y, np.transpose(y))
         
-        # Construct Jacobian matrix
-        j = np.zeros((6,6))
-        for i in range(1,7):
-            x[i-1] = x[i-1] + h
-            
-            # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
-            
-            diff = np.subtract(pqt, calc_pqt(sf,z))
-            j[:,i-1] = (np.divide(diff, pqt) - y) / h
-            x[i-1] = x[i-1] - h
+        if err0 < err_best:
+            z_best = np.copy(z)
+            err_best = err0
         
-        # Check if jacobian matrix is singular and exit function if so
-        if (np.linalg.det(j) == 0):
-            print("Jacobian matrix is singular")
+        # Check if jacobian matrix has non-finite elements and exit function if
+        # so (a badly conditioned jacobian is fine, the damped matrix solved
+        # is checked below)
+        if not np.all(np.isfinite(j)):
+            reason = "not finite"
             break
         
         x_reset = x
@@ -330,36 +486,33 @@ def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
             # Calculate next iteration and update x
             # (Matlab: delta_x = inv(j'*j + lambda_i.*diag(diag(j'*j)))*j'*y')
             
+            t = instrument.start()
             jblock = np.dot(np.transpose(j), j)
             j1 = jblock + lambda_i * np.diag(np.diag(jblock))
-            j2 = np.matrix(j1)
-            j3 = np.dot(j2.getI(), np.transpose(j))
-            
-            delta_x = np.dot(j3, np.transpose(y)).A[0]
+            if singular(j1):
+                reason = "singular"
+                break
+            try:
+                delta_x = np.linalg.solve(j1, np.dot(np.transpose(j), y))
+            except np.linalg.LinAlgError:
+                # Singular to working precision, keep the best solution so far
+                reason = "singular"
+                break
+            t = instrument.lap("solve", t)
             x = np.abs(np.subtract(x, delta_x))
             
             # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
+            update_z(z, x, mode, kx, kr)
             
             # Calculate squared error terms
             diff = np.subtract(pqt, calc_pqt(sf,z))
             y = np.divide(diff, pqt)
             err = np.dot(y, np.transpose(y))
             
+            if err < err_best:
+                z_best = np.copy(z)
+                err_best = err
+            
             ####################
             # TO DO
             #if (isnan(err)):
@@ -370,27 +523,42 @@ def lm_solver(p, mode, kx, kr, lambda_0, lambda_max, max_iter, err_tol):
                 lambda_i = lambda_i * beta;
                 x = x_reset
                 y = y_reset
+                instrument.stop("retry", t)
             else:
                 lambda_i = lambda_i / gamma
                 iter = iter + 1
+                instrument.stop("step", t)
+            
+            if trace is not None:
+                trace(step_record("LM", iter, err, np.nan, lambda_i, iter > iter0, z))
             
             # If descent direction isn't minimising, then there is no convergence
             if (lambda_i > lambda_max):
-                break 
+                break
+            
+            # Stop with the best solution so far if the budget is exhausted
+            if (budget is not None) and budget.exhausted():
+                reason = "budget"
+                break
 
-    if err < err_tol:
+    # Record why the run stopped early
+    if (trace is not None) and reason:
+        trace(stop_record("LM", iter, err_best, z_best, reason))
+    
+    # Output the best solution (the last trial step may have been rejected)
+    if err_best < err_tol:
         conv = 1
     
-    return z, iter, err, conv
+    return z_best, iter, err_best, conv
 
 """
 DNR_SOLVER - Damped Newton-Rhapson solver for double cage model with core losses
              Solves for 6 circuit parameters [Xs Xm Rr1 Xr1 Rr2 Rc]
              Includes change of variables
              Includes adaptive step size (as per Pedra 2008)
-             Includes determinant check of jacobian matrix
+             Includes singularity check of jacobian matrix
 
-Usage: dnr_solver (p, mode, kx, kr, lambda_i, max_iter, err_tol)
+Usage: dnr_solver (p, mode, kx, kr, lambda_i, max_iter, err_tol, jac, z0, trace, budget)
 
 Where   p is a vector of motor performance parameters:
         p = [sf eff pf Tb Tlr Ilr]
@@ -406,6 +574,18 @@ Where   p is a vector of motor performance parameters:
         lambda_i is the initial damping parameter
         max_iter is the maximum number of iterations  
         err_tol is the error tolerance for convergence
+        jac is the Jacobian matrix used: "analytic" (default) or "fd"
+          (forward differences)
+        z0 is an optional initial vector of equivalent circuit parameters
+          (default is the standard initial estimate), Rs and Xr2 are still
+          set by the restrictions or fixed values
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every trial step (and a stop record if the run stops early)
+        budget is an optional budget.Budget, the run stops when it is
+          exhausted
+
+The best solution found is returned (the last trial step may have been
+rejected).
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
@@ -421,7 +601,7 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
+def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol, jac="analytic", z0=None, trace=None, budget=None):
     
     # Human-readable motor performance parameters
     # And base value initialisation
@@ -437,12 +617,15 @@ def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
 
     # Set initial conditions
     z = np.zeros(8)
-    z[2] = 1 / Q_fl            #Xm
-    z[1] = 0.05 * z[2]         #Xs
-    z[3] = 1 / Pm_fl * sf      #Rr1
-    z[4] = 1.2 * z[1]          #Xr1
-    z[5] = 5 * z[3]            #Rr2
-    z[7] = 12
+    if z0 is None:
+        z[2] = 1 / Q_fl            #Xm
+        z[1] = 0.05 * z[2]         #Xs
+        z[3] = 1 / Pm_fl * sf      #Rr1
+        z[4] = 1.2 * z[1]          #Xr1
+        z[5] = 5 * z[3]            #Rr2
+        z[7] = 12
+    else:
+        z[:] = z0
     
     if mode == 0:
         z[0] = kr * z[3]           #Rs
@@ -464,7 +647,6 @@ def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
     pqt = [Pm_fl, Q_fl, T_b, T_lr, i_lr, eff]
 
     # Set up DNR algorithm parameters
-    h = 0.00001
     n = 0
     hn = 1
     hn_min = 0.0000001
@@ -474,43 +656,29 @@ def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
     gamma = 3
     beta = 3
     
+    # Best solution so far
+    z_best = np.copy(z)
+    err_best = np.inf
+    
+    # Reason the run stopped early, if it did (see solvertrace.STOP_REASONS)
+    reason = ""
+    
     # Run DNR algorithm
-    while (err > err_tol) and (iter < max_iter):
+    while (err > err_tol) and (iter < max_iter) and not reason:
         
-        # Evaluate objective function for current iteration
-        diff = np.subtract(pqt, calc_pqt(sf,z))
-        y = np.divide(diff, pqt)
+        # Evaluate objective function and Jacobian matrix for current iteration
+        t = instrument.start()
+        [y, j] = objective_jac(sf, pqt, x, z, mode, kx, kr, jac)
+        instrument.stop("jacobian", t)
         err0 = np.dot(y, np.transpose(y))
         
-        # Construct Jacobian matrix
-        j = np.zeros((6,6))
-        for i in range(1,7):
-            x[i-1] = x[i-1] + h
-            
-            # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
-            
-            diff = np.subtract(pqt, calc_pqt(sf,z))
-            j[:,i-1] = (np.divide(diff, pqt) - y) / h
-            x[i-1] = x[i-1] - h
+        if err0 < err_best:
+            z_best = np.copy(z)
+            err_best = err0
         
         # Check if jacobian matrix is singular and exit function if so
-        if (np.linalg.det(j) == 0):
-            print("Jacobian matrix is singular")
+        if singular(j):
+            reason = "singular"
             break
         
         x_reset = x
@@ -520,32 +688,28 @@ def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
         # Inner loop (descent direction check and step size adjustment)
         while (iter == iter0):
             # Calculate next iteration and update x
-            jmat = np.matrix(np.subtract(j, lambda_i * np.identity(6)))
-            delta_x = np.dot(jmat.getI(), np.transpose(y)).A[0]
+            t = instrument.start()
+            try:
+                delta_x = np.linalg.solve(np.subtract(j, lambda_i * np.identity(6)), y)
+            except np.linalg.LinAlgError:
+                # Singular to working precision, keep the best solution so far
+                reason = "singular"
+                break
+            t = instrument.lap("solve", t)
             x = np.abs(np.subtract(x, hn * delta_x))
             
             # Change of variables back to equivalent circuit parameters
-            z[1] = x[3]
-            z[2] = x[2]
-            z[3] = x[0]
-            
-            if mode == 0:
-                z[4] = kx * x[3] + x[4]
-            else:
-                z[4] = z[6] + x[4]
-            
-            z[5] = x[0] + x[1]
-            z[7] = x[5]
-            
-            if mode == 0:
-                z[0] = kr * z[3]
-                z[6] = kx * z[1]
+            update_z(z, x, mode, kx, kr)
             
             # Calculate squared error terms
             diff = np.subtract(pqt, calc_pqt(sf,z))
             y = np.divide(diff, pqt)
             err = np.dot(y, np.transpose(y))
             
+            if err < err_best:
+                z_best = np.copy(z)
+                err_best = err
+            
             # Descent direction check and step size adjustment
             if (np.abs(err) >= np.abs(err0)):
                 n = n + 1
@@ -553,27 +717,287 @@ def dnr_solver(p, mode, kx, kr, lambda_i, max_iter, err_tol):
                 lambda_i = lambda_i * beta
                 x = x_reset
                 y = y_reset
+                instrument.stop("retry", t)
             else:
                 n = 0
                 lambda_i = lambda_i / gamma
                 iter = iter + 1
+                instrument.stop("step", t)
             
-            # If descent direction isn't minimising, then there is no convergence
+            if trace is not None:
+                trace(step_record("DNR", iter, err, hn, lambda_i, iter > iter0, z))
+            
+            # If descent direction isn't minimising, then stop (the best
+            # solution so far may still have converged)
             if (hn < hn_min):
-                return z, iter, err, conv
+                reason = "stalled"
+                break
+            
+            # Stop with the best solution so far if the budget is exhausted
+            if (budget is not None) and budget.exhausted():
+                reason = "budget"
+                break
 
-    if err < err_tol:
+    # Record why the run stopped early
+    if (trace is not None) and reason:
+        trace(stop_record("DNR", iter, err_best, z_best, reason))
+    
+    # Output the best solution (the last trial step may have been rejected)
+    if err_best < err_tol:
         conv = 1
     
-    return z, iter, err, conv
+    return z_best, iter, err_best, conv
+
+"""
+MS_SOLVER  - Multi-start descent solver for double cage model with core losses
+             Runs K starting points of the NR, LM or DNR algorithm in lockstep
+             Residuals and Jacobians of all members are evaluated as stacked
+             arrays and the K linear systems are solved in one batched call
+             Members are masked out as they stall or fail, and the run stops
+             as soon as one member converges
+
+Usage: ms_solver (desc, p, mode, kx, kr, max_iter, err_tol, z0, lambda_0, lambda_max, trace, budget)
+
+Where   desc is the type of descent algorithm used - "NR", "LM", "DNR"
+        p is a vector of motor performance parameters:
+        p = [sf eff pf Tb Tlr Ilr]
+        mode = 0: normal, 1: fixed Rs and Xr2
+        kx and kr are vectors of the K members' linear restrictions in normal
+                  mode (or fixed Xr2 and Rs in mode 1), scalars are broadcast
+        max_iter is the maximum number of iterations
+        err_tol is the error tolerance for convergence
+        z0 is an optional K x 8 matrix of initial equivalent circuit
+           parameters (default is the standard initial estimate)
+        lambda_0 is the initial damping parameter (LM and DNR)
+        lambda_max is the maximum damping parameter (LM)
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          of the members after every sweep (as per generation_record, with
+          the sweep as the iteration), and a stop record if the run stops
+          early (the budget ran out, or every member stalled)
+        budget is an optional budget.Budget, the run stops when it is
+          exhausted (checked after every sweep)
+
+Returns:   z is the vector of motor equivalent parameters of the best member
+          iter is the number of iterations of the best member
+          err is the squared error of the best member
+          conv is a true/false flag indicating convergence
+"""
+def ms_solver(desc, p, mode, kx, kr, max_iter, err_tol, z0=None, lambda_0=1e-7, lambda_max=5.0, trace=None, budget=None):
+    
+    # Human-readable motor performance parameters
+    # And base value initialisation
+    sf = p[0]                          # Full-load slip (pu)
+    eff = p[1]                         # Full-load efficiency (pu)
+    pf = p[2]                          # Full-load power factor (pu)
+    T_fl = pf * eff / (1 - sf)         # Full-load torque (pu)
+    T_b = p[3] * T_fl                  # Breakdown torque (pu)
+    T_lr = p[4] * T_fl                 # Locked rotor torque (pu)
+    i_lr = p[5]                        # Locked rotor current (pu)
+    Pm_fl = pf * eff                   # Mechanical power (at FL)
+    Q_fl = np.sin(np.arccos(pf))         # Full-load reactive power (pu)
+    
+    # Member linear restrictions
+    if z0 is not None:
+        z0 = np.atleast_2d(np.asarray(z0, dtype=float))
+    k = np.broadcast_shapes(np.shape(kx), np.shape(kr), (1,) if z0 is None else z0.shape[0:1])
+    kx = np.broadcast_to(np.asarray(kx, dtype=float), k)
+    kr = np.broadcast_to(np.asarray(kr, dtype=float), k)
+    K = k[0]
+    
+    # Set initial conditions
+    z = np.zeros((K,8))
+    if z0 is None:
+        z[:,2] = 1 / Q_fl            #Xm
+        z[:,1] = 0.05 * z[:,2]       #Xs
+        z[:,3] = 1 / Pm_fl * sf      #Rr1
+        z[:,4] = 1.2 * z[:,1]        #Xr1
+        z[:,5] = 5 * z[:,3]          #Rr2
+        z[:,7] = 12
+    else:
+        z[:,:] = z0
+    
+    if mode == 0:
+        z[:,0] = kr * z[:,3]         #Rs
+        z[:,6] = kx * z[:,1]         #Xr2
+    else:
+        z[:,0] = kr
+        z[:,6] = kx
+    
+    # Change of variables to constrained parameters (with initial values)
+    x = np.column_stack([z[:,3], z[:,5] - z[:,3], z[:,2], z[:,1], z[:,4] - z[:,6], z[:,7]])
+    
+    # Formulate solution
+    pqt = [Pm_fl, Q_fl, T_b, T_lr, i_lr, eff]
+    
+    # Set up algorithm parameters (one per member)
+    n = np.zeros(K)
+    hn = np.ones(K)
+    hn_min = 0.0000001
+    lambda_i = np.full(K, float(lambda_0))
+    beta = 3
+    gamma = 3
+    iter = np.zeros(K, dtype=int)
+    sweep = 0
+    
+    # Reason the run stopped early, if it did (see solvertrace.STOP_REASONS)
+    reason = ""
+    
+    # Evaluate objective function and Jacobian matrix of the starting points
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        [y, j] = objective_jac(sf, pqt, x, z, mode, kx, kr, "analytic")
+        err = np.sum(y ** 2, axis=1)
+    active = (err > err_tol) & (iter < max_iter)
+    
+    # Run the members in lockstep, one trial step of every active member per sweep
+    # (diverging members may produce non-finite values, which are rejected)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        while np.any(active):
+        
+            # Members with a singular (or non-finite) Jacobian matrix cannot continue
+            # (for LM, the damped matrix solved must not be singular, the Jacobian
+            # matrix itself may be badly conditioned)
+            a = np.flatnonzero(active)
+            if desc == "LM":
+                jt = np.transpose(j[a], (0,2,1))
+                jblock = np.matmul(jt, j[a])
+                j1 = jblock + lambda_i[a,np.newaxis,np.newaxis] * (np.eye(6) * jblock)
+                stalled = singular(j1)
+                jt = jt[~stalled]
+                j1 = j1[~stalled]
+            else:
+                stalled = singular(j[a])
+            active[a[stalled]] = False
+            a = a[~stalled]
+            if a.size == 0:
+                break
+        
+            # Calculate the step of every active member with one batched solve
+            t = instrument.start()
+            if desc == "NR":
+                delta_x = hn[a,np.newaxis] * _batch_solve(j[a], y[a])
+        
+            elif desc == "LM":
+                delta_x = _batch_solve(j1, np.matmul(jt, y[a,:,np.newaxis])[:,:,0])
+        
+            elif desc == "DNR":
+                j1 = j[a] - lambda_i[a,np.newaxis,np.newaxis] * np.eye(6)
+                delta_x = hn[a,np.newaxis] * _batch_solve(j1, y[a])
+        
+            else:
+                raise ValueError("Unknown descent algorithm: %s" % desc)
+        
+            # Evaluate trial points (objective function and Jacobian matrix)
+            t = instrument.lap("solve", t)
+            x_t = np.abs(x[a] - delta_x)
+            z_t = z[a].copy()
+            update_z(z_t, x_t, mode, kx[a], kr[a])
+            [y_t, j_t] = objective_jac(sf, pqt, x_t, z_t, mode, kx[a], kr[a], "analytic")
+            instrument.stop("jacobian", t)
+            err_t = np.sum(y_t ** 2, axis=1)
+        
+            # Descent direction check and step size / damping adjustment
+            # (trial points with a NaN error are always rejected)
+            reject = ~(np.abs(err_t) < np.abs(err[a]))
+            if desc == "LM":
+                reject = reject & ((iter[a] > 0) | np.isnan(err_t))
+        
+            r = a[reject]
+            instrument.count("retry", r.size)
+            n[r] = n[r] + 1
+            if desc == "LM":
+                lambda_i[r] = lambda_i[r] * beta
+            else:
+                hn[r] = 2 ** (-n[r])
+                if desc == "DNR":
+                    lambda_i[r] = lambda_i[r] * beta
+        
+            acc = a[~reject]
+            n[acc] = 0
+            if desc != "NR":
+                lambda_i[acc] = lambda_i[acc] / gamma
+            iter[acc] = iter[acc] + 1
+            x[acc] = x_t[~reject]
+            z[acc] = z_t[~reject]
+            y[acc] = y_t[~reject]
+            j[acc] = j_t[~reject]
+            err[acc] = err_t[~reject]
+            
+            sweep = sweep + 1
+            if trace is not None:
+                trace(generation_record(desc, sweep, z, err))
+        
+            # Mask out converged, exhausted and stalled members
+            active = active & (err > err_tol) & (iter < max_iter)
+            if desc == "LM":
+                active = active & (lambda_i <= lambda_max)
+            else:
+                active = active & (hn >= hn_min)
+            
+            # Stop as soon as one of the members has converged
+            if np.any(err < err_tol):
+                break
+            
+            if (budget is not None) and budget.exhausted():
+                reason = "budget"
+                break
+    
+    # Output the best member
+    best = np.argmin(np.where(np.isfinite(err), err, np.inf))
+    conv = int(err[best] < err_tol)
+    
+    # Record why the run stopped early (every member stalled or failed
+    # before its last iteration)
+    if (not reason) and (not conv) and np.all(iter < max_iter):
+        reason = "stalled"
+    if (trace is not None) and reason:
+        trace(stop_record(desc, iter[best], err[best], z[best], reason))
+    
+    return z[best], iter[best], err[best], conv
+
+# Solves the stacked linear systems a[i] * d[i] = b[i] (falls back to solving
+# member by member if one of the systems is singular)
+def _batch_solve(a, b):
+    
+    try:
+        return np.linalg.solve(a, b[:,:,np.newaxis])[:,:,0]
+    except np.linalg.LinAlgError:
+        d = np.full(b.shape, np.nan)
+        for i in range(0,b.shape[0]):
+            try:
+                d[i] = np.linalg.solve(a[i], b[i])
+            except np.linalg.LinAlgError:
+                pass
+        return d
+
+"""
+MS_STARTS - Linear restrictions for the members of a multi-start run
+
+Usage: ms_starts (kx, kr, k, spread, seed)
+
+Where   kx and kr are the nominal linear restrictions (first member)
+        k is the number of members
+        spread is the factor each restriction may be scaled up or down by
+        seed is the seed for the random draws
+
+Returns: vectors kx and kr of length k, where the first member keeps the
+         nominal values and the others are scaled by factors drawn
+         log-uniformly between 1 / spread and spread
+"""
+def ms_starts(kx, kr, k, spread=4.0, seed=None):
+    
+    rng = np.random.default_rng(seed)
+    scale = np.exp(rng.uniform(-np.log(spread), np.log(spread), (k,2)))
+    scale[0,:] = 1
+    
+    return kx * scale[:,0], kr * scale[:,1]
 
 """    
 NR_SOLVER _SC - Newton-Rhapson solver for single cage model with core losses
                 Solves for 4 circuit parameters [Xs Xm Rr1 Rc]
                 Includes adaptive step size (as per Pedra 2008)
-                Includes determinant check of jacobian matrix
+                Includes singularity check of jacobian matrix
 
-Usage: nr_solver (p, mode, kx, kr, max_iter, err_tol)
+Usage: nr_solver_sc (p, mode, kx, kr, max_iter, err_tol, trace, budget)
 
 Where   p is a vector of motor performance parameters:
         p = [sf eff pf Tb]
@@ -586,6 +1010,13 @@ Where   p is a vector of motor performance parameters:
                   and fixed Xr2 and Kr in mode 1
         max_iter is the maximum number of iterations  
         err_tol is the error tolerance for convergence
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every trial step (and a stop record if the run stops early)
+        budget is an optional budget.Budget, the run stops when it is
+          exhausted
+
+The best solution found is returned (the last trial step may have been
+rejected).
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rc]
@@ -599,7 +1030,7 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def nr_solver_sc(p, mode, kx, kr, max_iter, err_tol):
+def nr_solver_sc(p, mode, kx, kr, max_iter, err_tol, trace=None, budget=None):
     
     # Human-readable motor performance parameters
     # And base value initialisation
@@ -637,25 +1068,38 @@ def nr_solver_sc(p, mode, kx, kr, max_iter, err_tol):
     iter = 0
     conv = 0
     
+    # Best solution so far
+    z_best = np.copy(z)
+    err_best = np.inf
+    
+    # Reason the run stopped early, if it did (see solvertrace.STOP_REASONS)
+    reason = ""
+    
     # Run NR algorithm
-    while (err > err_tol) and (iter < max_iter):
+    while (err > err_tol) and (iter < max_iter) and not reason:
         
         # Evaluate objective function for current iteration
         diff = np.subtract(pqt, calc_pqt_sc(sf,z))
         y = np.divide(diff, pqt)
         err0 = np.dot(y, np.transpose(y))
         
+        if err0 < err_best:
+            z_best = np.copy(z)
+            err_best = err0
+        
         # Construct Jacobian matrix
+        t = instrument.start()
         j = np.zeros((4,4))
         for i in range(1,5):
             z[i] = z[i] + h            
             diff = np.subtract(pqt, calc_pqt_sc(sf,z))
             j[:,i-1] = (np.divide(diff, pqt) - y) / h
             z[i] = z[i] - h
+        instrument.stop("jacobian", t)
         
         # Check if jacobian matrix is singular and exit function if so
-        if (np.linalg.det(j) == 0):
-            print("Jacobian matrix is singular")
+        if singular(j):
+            reason = "singular"
             break
         
         z_reset = z
@@ -665,8 +1109,14 @@ def nr_solver_sc(p, mode, kx, kr, max_iter, err_tol):
         # Inner loop (descent direction check and step size adjustment)
         while (iter == iter0):
             # Calculate next iteration and update z
-            jmat = np.matrix(j)
-            delta_z = np.dot(jmat.getI(), np.transpose(y)).A[0]
+            t = instrument.start()
+            try:
+                delta_z = np.linalg.solve(j, y)
+            except np.linalg.LinAlgError:
+                # Singular to working precision, keep the best solution so far
+                reason = "singular"
+                break
+            t = instrument.lap("solve", t)
             z[1] = np.abs(z[1] - delta_z[0])
             z[2] = np.abs(z[2] - delta_z[1])
             z[3] = np.abs(z[3] - delta_z[2])
@@ -684,21 +1134,42 @@ def nr_solver_sc(p, mode, kx, kr, max_iter, err_tol):
             y = np.divide(diff, pqt)
             err = np.dot(y, np.transpose(y))
             
+            if err < err_best:
+                z_best = np.copy(z)
+                err_best = err
+            
             # Descent direction check and step size adjustment
             if (np.abs(err) >= np.abs(err0)):
                 n = n + 1
                 hn = 2 ** (-n)
                 z = z_reset
                 y = y_reset
+                instrument.stop("retry", t)
             else:
                 n = 0
                 iter = iter + 1
+                instrument.stop("step", t)
             
-            # If descent direction isn't minimising, then there is no convergence
+            if trace is not None:
+                trace(step_record("NR-SC", iter, err, hn, np.nan, iter > iter0, z))
+            
+            # If descent direction isn't minimising, then stop (the best
+            # solution so far may still have converged)
             if (hn < hn_min):
-                break 
+                reason = "stalled"
+                break
+            
+            # Stop with the best solution so far if the budget is exhausted
+            if (budget is not None) and budget.exhausted():
+                reason = "budget"
+                break
 
-    if err < err_tol:
+    # Record why the run stopped early
+    if (trace is not None) and reason:
+        trace(stop_record("NR-SC", iter, err_best, z_best, reason))
+    
+    # Output the best solution (the last trial step may have been rejected)
+    if err_best < err_tol:
         conv = 1
     
-    return z, iter, err, conv
\ No newline at end of file
+    return z_best, iter, err_best, conv
\ No newline at end of file
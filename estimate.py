@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Parameter Estimation
+"""
+from descent import nr_solver, lm_solver, dnr_solver, nr_solver_sc, ms_solver, ms_starts
+from config import motor_record, algo_record
+from budget import settings_budget, limited
+
+MODELS = ["Single cage", "Double cage"]
+
+ALGORITHMS = ["Newton-Raphson", "Levenberg-Marquardt", "Damped Newton-Raphson", "Genetic Algorithm", "Hybrid GA-NR", "Hybrid GA-LM", "Hybrid GA-DNR"]
+
+# Double cage descent algorithms (accept an initial estimate)
+DESCENT = ["Newton-Raphson", "Levenberg-Marquardt", "Damped Newton-Raphson"]
+
+# Descent algorithm types of the multi-start solver (see descent.ms_solver)
+MS_DESCENT = {
+    "Newton-Raphson"        : "NR",
+    "Levenberg-Marquardt"   : "LM",
+    "Damped Newton-Raphson" : "DNR"
+    }
+
+# Names of the equivalent circuit parameters, in the order returned by the
+# solvers of each model
+PARAMS = {
+    "Single cage"   : ["Rs", "Xs", "Xm", "Rr1", "Rc", "Xr1"],
+    "Double cage"   : ["Rs", "Xs", "Xm", "Rr1", "Xr1", "Rr2", "Xr2", "Rc"]
+    }
+
+"""
+PARAM_DICT - Equivalent circuit parameters by name
+
+Usage: param_dict (model, z)
+
+Returns: dictionary of parameter name : value (as a float)
+"""
+def param_dict(model, z):
+
+    return {name : float(z[i]) for i, name in enumerate(PARAMS[model])}
+
+"""
+PERFORMANCE_PARAMS - Motor performance parameters used by the solvers, from
+                     the motor nameplate data
+
+Usage: performance_params (model, motor)
+
+Where   model is "Single cage" or "Double cage"
+        motor is a config.MotorData record (or dictionary of motor data)
+
+Returns: p = [sf eff pf Tb] (single cage) or p = [sf eff pf Tb Tlr Ilr]
+         (double cage)
+"""
+def performance_params(model, motor):
+
+    m = motor_record(motor)
+
+    if model == "Single cage":
+        return [m.sf, m.rated_eff, m.rated_pf, m.T_b]
+
+    if model == "Double cage":
+        return [m.sf, m.rated_eff, m.rated_pf, m.T_b, m.T_lr, m.I_lr]
+
+    raise ValueError("Unknown motor model: %s" % model)
+
+"""
+ESTIMATE - Estimates the equivalent circuit parameters of a motor with the
+           selected model and algorithm
+
+Usage: estimate (model, algo, motor, settings, progress, executor, seed, z0, trace, budget)
+
+Where   model is "Single cage" or "Double cage"
+        algo is one of ALGORITHMS (the single cage model only supports
+          "Newton-Raphson")
+        motor is a config.MotorData record (or dictionary of motor data, as
+          per globals.motor_data)
+        settings is a config.AlgoSettings record (or dictionary of
+          algorithm settings, as per globals.algo_data)
+        progress is an optional progress / cancel callback for the genetic
+          and hybrid algorithms (see ga_solver and hy_solver)
+        executor is an optional concurrent.futures executor for the genetic
+          and hybrid algorithms (see parallel.get_executor)
+        seed is an optional random seed for the genetic and hybrid algorithms
+          (and the multi-start restrictions, default 0)
+        z0 is an optional initial estimate of the equivalent circuit
+          parameters for the double cage descent algorithms (see warmstart)
+        trace is an optional callback called with a solvertrace.TraceRecord
+          for every step or generation of the solver (every sweep of the
+          starting points for multi-start runs)
+        budget is an optional budget.Budget limiting the run (by default a
+          new budget of the max_time and max_evals settings, if any)
+
+With the n_starts setting over 1, the double cage descent algorithms run
+n_starts starting points in lockstep (descent.ms_solver), with the linear
+restrictions k_x and k_r of all but the first scaled at random (see
+descent.ms_starts).
+
+Returns: z, iter, err, conv as returned by the solver (the best solution
+         found if the budget ran out)
+"""
+def estimate(model, algo, motor, settings, progress=None, executor=None, seed=None, z0=None, trace=None, budget=None):
+
+    s = algo_record(settings)
+    if budget is None:
+        budget = settings_budget(s)
+
+    return limited(budget, solve, model, algo, performance_params(model, motor), s, progress, executor, seed, z0, trace, budget)
+
+# Run the solver of an algorithm (arguments as per estimate, with p the motor
+# performance parameters and s an AlgoSettings record)
+def solve(model, algo, p, s, progress, executor, seed, z0, trace, budget):
+
+    if model == "Single cage":
+        if algo != "Newton-Raphson":
+            raise ValueError("Algorithm not available for the single cage model: %s" % algo)
+
+        return nr_solver_sc(p, 0, s.k_x, s.k_r, s.max_iter, s.conv_err, trace, budget)
+
+    if (algo in MS_DESCENT) and (s.n_starts > 1):
+        [kx, kr] = ms_starts(s.k_x, s.k_r, s.n_starts, seed=0 if seed is None else seed)
+        return ms_solver(MS_DESCENT[algo], p, 0, kx, kr, s.max_iter, s.conv_err, z0, trace=trace, budget=budget)
+
+    if algo == "Newton-Raphson":
+        return nr_solver(p, 0, s.k_x, s.k_r, s.max_iter, s.conv_err, z0=z0, trace=trace, budget=budget)
+
+    if algo == "Levenberg-Marquardt":
+        return lm_solver(p, 0, s.k_x, s.k_r, 1e-7, 5.0, s.max_iter, s.conv_err, z0=z0, trace=trace, budget=budget)
+
+    if algo == "Damped Newton-Raphson":
+        return dnr_solver(p, 0, s.k_x, s.k_r, 1e-7, s.max_iter, s.conv_err, z0=z0, trace=trace, budget=budget)
+
+    # The genetic and hybrid solvers are imported when first used (they are
+    # not needed to start the GUI)
+    if algo == "Genetic Algorithm":
+        from genetic import ga_solver
+        return ga_solver(progress, p, s.pop, s.n_r, s.n_e, s.c_f, s.n_gen, s.conv_err, executor, seed, trace, budget)
+
+    if algo.startswith("Hybrid GA-") and (algo in ALGORITHMS):
+        from hybrid import hy_solver
+        desc = algo[len("Hybrid GA-"):]
+        return hy_solver(progress, desc, p, s.pop, s.n_r, s.n_e, s.c_f, s.n_gen, s.conv_err, executor, seed, settings=s, trace=trace, budget=budget)
+
+    raise ValueError("Unknown algorithm: %s" % algo)
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Fleet Estimation (command line, without the GUI)
+
+Usage: python -m fleet [-a ALGO] [-m MODEL] [--workers N] [--restart]
+                       INPUT -o OUTPUT
+
+Where INPUT is a CSV file of motor nameplate data, one motor per row, with
+the columns description, sync_speed, rated_speed, rated_pf, rated_eff, T_b,
+T_lr and I_lr (as per saveload.save_file), and OUTPUT is the CSV results file
+
+The input is read as a stream and the motors are estimated on a process
+pool, with each result appended to the output as soon as it is available.
+If the output already exists, the motors already in it are skipped, so an
+interrupted run carries on where it stopped (unless --restart is given).
+"""
+import os, sys, csv, argparse
+import concurrent.futures
+import batch
+from batch import ALGO_NAMES, MODEL_NAMES, FIELDS, estimate_motor
+
+# Nameplate columns of the input file
+MOTOR_FIELDS = ["description", "sync_speed", "rated_speed", "rated_pf", "rated_eff", "T_b", "T_lr", "I_lr"]
+
+# Results columns ("row" is the index of the motor in the input file)
+FLEET_FIELDS = ["row"] + FIELDS[1:]
+
+"""
+READ_MOTORS - Reads motor nameplate data from a CSV file, one row at a time
+
+Usage: for [row, motor_data] in read_motors (filename)
+
+Returns: (generator) row index (from 0) and dictionary of motor data. Values
+         that cannot be read are left as strings (and reported as errors
+         when the motor is estimated)
+"""
+def read_motors(filename):
+
+    with open(filename, newline="") as f:
+        for row, record in enumerate(csv.DictReader(f)):
+            motor_data = {}
+
+            for key in MOTOR_FIELDS:
+                item = (record.get(key) or "").strip()
+
+                if key == "description":
+                    motor_data[key] = item
+                else:
+                    try:
+                        motor_data[key] = float(item)
+                    except ValueError:
+                        motor_data[key] = item
+
+            yield row, motor_data
+
+"""
+COMPLETED_ROWS - Rows of the input already in a results file (for resuming
+                 an interrupted run)
+
+Usage: completed_rows (filename)
+
+A partly written last line (from an interrupted run) is removed from the
+file, so that results can be appended to it.
+
+Returns: set of row indices
+"""
+def completed_rows(filename):
+
+    if not os.path.exists(filename):
+        return set()
+
+    with open(filename, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+    done = set()
+    with open(filename, newline="") as f:
+        for record in csv.DictReader(f):
+            try:
+                done.add(int(record["row"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+    return done
+
+"""
+ESTIMATE_ROW - Estimates one motor of the fleet (runs on the worker
+               processes)
+
+Usage: estimate_row (row, motor_data, model, algo, settings, seed, cache)
+
+Returns: dictionary of results (one row of the results file)
+"""
+def estimate_row(row, motor_data, model, algo, settings, seed, cache=None):
+
+    for key in MOTOR_FIELDS[1:]:
+        if not isinstance(motor_data[key], float):
+            return {"row" : row, "description" : motor_data["description"], "model" : model, "algorithm" : algo, "error" : "invalid %s: '%s'" % (key, motor_data[key])}
+
+    return estimate_motor({"row" : row}, motor_data, settings, model, algo, None, seed, cache)
+
+"""
+RUN_FLEET - Estimates all the motors of a fleet input file, appending the
+            results to the output file as they are completed
+
+Usage: run_fleet (input, output, model, algo, settings, n_workers, seed, restart, log, cache)
+
+Where   input is the CSV file of motor nameplate data
+        output is the CSV results file
+        model, algo are as per estimate.estimate
+        settings is a dictionary of algorithm settings (overriding the
+          defaults)
+        n_workers is the number of worker processes (1 to run serially)
+        seed is an optional random seed (motor i uses seed + i)
+        restart is a true/false flag: if true, the output file is started
+          again rather than resumed
+        log is an optional function called with each completed row
+        cache is an optional resultcache.ResultCache
+
+Returns: number of motors estimated (not counting those already done)
+"""
+def run_fleet(input, output, model, algo, settings=None, n_workers=None, seed=None, restart=False, log=None, cache=None):
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if restart and os.path.exists(output):
+        os.remove(output)
+
+    done = completed_rows(output)
+    new_file = not os.path.exists(output) or (os.path.getsize(output) == 0)
+
+    n = 0
+    with open(output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FLEET_FIELDS, restval="", extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+            f.flush()
+
+        # Write each result (and flush it) as soon as it is available
+        def write(result):
+            writer.writerow(result)
+            f.flush()
+            if log is not None:
+                log(result)
+
+        todo = ((row, motor_data) for [row, motor_data] in read_motors(input) if row not in done)
+
+        if n_workers <= 1:
+            for [row, motor_data] in todo:
+                write(estimate_row(row, motor_data, model, algo, settings or {}, None if seed is None else seed + row, cache))
+                n = n + 1
+            return n
+
+        # Keep a bounded number of motors in flight, so that the input is
+        # read as it is needed
+        max_pending = 4 * n_workers
+        pending = set()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            try:
+                for [row, motor_data] in todo:
+                    if len(pending) >= max_pending:
+                        [finished, pending] = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in finished:
+                            write(future.result())
+                            n = n + 1
+
+                    pending.add(executor.submit(estimate_row, row, motor_data, model, algo, settings or {}, None if seed is None else seed + row, cache))
+
+                for future in concurrent.futures.as_completed(pending):
+                    write(future.result())
+                    n = n + 1
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    return n
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m fleet", description="Estimate the equivalent circuit parameters of a fleet of motors (CSV of nameplate data), resuming interrupted runs")
+    parser.add_argument("input", metavar="INPUT", help="CSV file of motor nameplate data")
+    parser.add_argument("-o", "--output", required=True, help="CSV results file (resumed if it exists)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default one per CPU)")
+    parser.add_argument("--restart", action="store_true", help="start the results file again instead of resuming")
+    batch.add_settings_args(parser)
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    def log(result):
+        print("%d %s: %s" % (result["row"], result.get("description", ""), result.get("error") or "err = %g, iter = %d, conv = %d" % (result["err"], result["iter"], result["conv"])), file=sys.stderr)
+
+    try:
+        n = run_fleet(args.input, args.output, MODEL_NAMES[args.model], ALGO_NAMES[args.algorithm], batch.settings_args(args), args.workers, args.seed, args.restart, log, batch.result_cache(args))
+    except KeyboardInterrupt:
+        print("Interrupted, run again to resume", file=sys.stderr)
+        return 130
+
+    print("%d motors estimated" % n, file=sys.stderr)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
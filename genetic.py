@@ -10,7 +10,9 @@ Author: Julius Susanto
 Last edited: August 2014
 """
 import numpy as np
-from common_calcs import get_torque, calc_pqt
+import instrument
+from solvertrace import generation_record, stop_record
+from parallel import batch_err
 
 """
 GA_SOLVER  - Genetic algorithm solver for double cage model with core losses
@@ -20,9 +22,13 @@ GA_SOLVER  - Genetic algorithm solver for double cage model with core losses
              Includes adaptive step size (as per Pedra 2008)
              Includes determinant check of jacobian matrix
 
-Usage: nr_solver (p, pop, n_r, n_e, c_f, n_gen, err_tol)
+Usage: ga_solver (progress, p, pop, n_r, n_e, c_f, n_gen, err_tol, executor, seed, trace, budget)
 
-Where   p is a vector of motor performance parameters:
+Where   progress is an optional callback progress(gen, member, err), called
+          after each generation with the best squared error so far (member
+          is None). If it returns True, the run is cancelled and the best
+          member so far is returned (conv = 0)
+        p is a vector of motor performance parameters:
         p = [sf eff pf Tb Tlr Ilr]
           sf = full-load slip
           eff = full-load efficiency
@@ -36,6 +42,16 @@ Where   p is a vector of motor performance parameters:
         c_f is the crossover fraction
         n_gen is the maximum number of generations  
         err_tol is the error tolerance for convergence
+        executor is an optional concurrent.futures executor (see
+          parallel.get_executor) used to evaluate the fitness of each
+          generation in parallel
+        seed is an optional seed (or numpy.random.Generator) for the
+          random number generator, for repeatable runs
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every generation (and a stop record if the run is cancelled
+          or the budget runs out)
+        budget is an optional budget.Budget: when it is exhausted (checked
+          after every generation) the best member so far is returned
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
@@ -51,13 +67,15 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def ga_solver(self, p, pop, n_r, n_e, c_f, n_gen, err_tol):
+def ga_solver(progress, p, pop, n_r, n_e, c_f, n_gen, err_tol, executor=None, seed=None, trace=None, budget=None):
+    
+    rng = np.random.default_rng(seed)
     
     # Standard deviation weighting vector for mutation noise
-    sigma = [0.01, 0.01, 0.33, 0.01, 0.01, 0.01, 0.01, 6.67]; 
+    sigma = np.array([0.01, 0.01, 0.33, 0.01, 0.01, 0.01, 0.01, 6.67])
     
     # Initial weighting vector
-    w = np.matrix([0.15, 0.15, 5.0, 0.15, 0.3, 0.15, 0.15, 100.0])  
+    w = np.array([0.15, 0.15, 5.0, 0.15, 0.3, 0.15, 0.15, 100.0])
     
     # Human-readable motor performance parameters
     # And base value initialisation
@@ -79,71 +97,122 @@ def ga_solver(self, p, pop, n_r, n_e, c_f, n_gen, err_tol):
     conv = 0
     
     # Create initial population
-    wmat = np.dot(w.transpose(), np.matrix(np.ones(pop)))
-    x = np.array(wmat.transpose()) * np.random.rand(pop,8)
-    err = np.zeros(pop)
-    
-    # Check solution of initial population
-    for i in range(0,pop):
-        diff = np.subtract(pqt, calc_pqt(sf,x[i,:]))
-        y = np.divide(diff, pqt)
-        err[i] = np.dot(y, np.transpose(y))
-        
-        if err[i] < err_tol:
-            z = x[i,:]
-            conv = 1
-            return z, gen, err[i], conv
+    x = w * rng.random((pop,8))
+    
+    # Check solution of initial population (first converged member wins)
+    t = instrument.start()
+    err = batch_err(executor, sf, x, pqt)
+    instrument.stop("evaluation", t)
+    
+    if trace is not None:
+        trace(generation_record("GA", gen, x, err))
+    
+    i_conv = np.flatnonzero(err < err_tol)
+    
+    if i_conv.size > 0:
+        i = i_conv[0]
+        z = x[i,:]
+        conv = 1
+        return z, gen, err[i], conv
+    
+    # Best member so far
+    i = np.nanargmin(err)
+    z_best = x[i,:]
+    err_best = err[i]
     
     # Run genetic algorithm
     for gen in range(2,n_gen+1):
         
-        self.statusBar().showMessage('Calculating generation %d...' % gen)
-        
-        # Select for fitness
-        fitness = np.sort(err)
-        index = np.argsort(err)
+        # Report progress (and stop with the best member so far if cancelled
+        # or the budget is exhausted)
+        if (progress is not None) and progress(gen - 1, None, err_best):
+            if trace is not None:
+                trace(stop_record("GA", gen - 1, err_best, z_best, "cancelled"))
+            return z_best, gen - 1, err_best, conv
+        if (budget is not None) and budget.exhausted():
+            if trace is not None:
+                trace(stop_record("GA", gen - 1, err_best, z_best, "budget"))
+            return z_best, gen - 1, err_best, conv
         
         # Create next generation
-        x_new = np.zeros((pop,8))
-        x_mate = x[index[0:n_r],:]         # select mating pool
-        
-        # Elite children (select best "n_e" children for next generation)
-        x_new[0:n_e,:] = x[index[0:n_e],:]
-        
-        # Crossover (random weighted average of parents)
-        n_c = int(np.round((pop - n_e) * c_f))       # number of crossover children
-        
-        for j in range(0,n_c):
-            i_pair = np.ceil(n_r * np.random.rand(2,1))       # generate random pair of parents
-            weight = np.random.rand(8)                        # generate random weighting
-            # Crossover parents by weighted blend to generate new child           
-            x_new[(n_e + j),:] = weight * x_mate[int(i_pair[0,0])-1,:] + (1 - weight) * x_mate[int(i_pair[1,0])-1,:]
+        x = ga_next_generation(rng, x, err, n_r, n_e, c_f, sigma)[0]
         
-        # Mutation (gaussian noise added to parents)
-        n_m = pop - n_e - n_c;       # number of mutation children
+        # Check solution of current generation (first converged member wins)
+        t = instrument.start()
+        err = batch_err(executor, sf, x, pqt)
+        instrument.stop("evaluation", t)
         
-        for k in range(0,n_m):
-            # Select random parent from mating pool and add white noise
-            x_new[(n_e + n_c + k),:] = np.abs(x_mate[int(np.ceil(n_r * np.random.rand(1)) - 1),:] + sigma * np.random.randn(8))
+        if trace is not None:
+            trace(generation_record("GA", gen, x, err))
         
-        x = x_new
+        i_conv = np.flatnonzero(err < err_tol)
         
-        # Check solution of current generation
-        for i in range(0,pop):
-            diff = np.subtract(pqt, calc_pqt(sf,x[i,:]))
-            y = np.divide(diff, pqt)
-            err[i] = np.dot(y, np.transpose(y))
-        
-            if err[i] < err_tol:
-                z = x[i,:]
-                conv = 1
-                return z, gen, err[i], conv
+        if i_conv.size > 0:
+            i = i_conv[0]
+            z = x[i,:]
+            conv = 1
+            return z, gen, err[i], conv
         
-        # If the last generation, then output best results
-        if gen == n_gen:
-            fitness = np.sort(err)
-            index = np.argsort(err)
-            z = x[index[0],:]
-            conv = 0
-            err = fitness[0]
-            return z, gen, err, conv
+        i = np.nanargmin(err)
+        if err[i] < err_best:
+            z_best = x[i,:]
+            err_best = err[i]
+    
+    # Last generation, then output best results
+    return z_best, gen, err_best, conv
+
+"""
+GA_NEXT_GENERATION - Creates the next generation of a population from the
+                     fitness of the current one (elite children, crossover
+                     and mutation), using whole-population array operations
+
+Usage: ga_next_generation (rng, x, err, n_r, n_e, c_f, sigma)
+
+Where   rng is a numpy.random.Generator
+        x is the pop x n matrix of current members
+        err is the vector of squared errors of the current members
+        n_r is the number of members retained for mating
+        n_e is the number of elite children
+        c_f is the crossover fraction
+        sigma is the standard deviation of the mutation noise (scalar or
+          vector of length n)
+
+Returns: x_new is the pop x n matrix of the next generation
+         parents is a pop x 2 matrix of the rows of x each child came from
+         weight is the pop x n matrix of blend weights, such that
+           x_new = weight * x[parents[:,0]] + (1 - weight) * x[parents[:,1]]
+           before mutation noise (elite and mutation children have both
+           parents equal and a weight of one)
+"""
+def ga_next_generation(rng, x, err, n_r, n_e, c_f, sigma):
+    
+    [pop, n] = x.shape
+    n_c = int(np.round((pop - n_e) * c_f))       # number of crossover children
+    n_m = pop - n_e - n_c                        # number of mutation children
+    
+    # Select for fitness (best "n_r" members form the mating pool)
+    t = instrument.start()
+    index = np.argsort(err)
+    
+    parents = np.empty((pop,2), dtype=int)
+    weight = np.ones((pop,n))
+    
+    # Elite children (best "n_e" members carried over unchanged)
+    parents[0:n_e,:] = index[0:n_e,None]
+    
+    # Crossover (random weighted average of random pairs of parents)
+    t = instrument.lap("selection", t)
+    parents[n_e:n_e+n_c,:] = index[rng.integers(n_r, size=(n_c,2))]
+    weight[n_e:n_e+n_c,:] = rng.random((n_c,n))
+    
+    # Mutation (gaussian noise added to random parents)
+    t = instrument.lap("crossover", t)
+    parents[n_e+n_c:,:] = index[rng.integers(n_r, size=n_m)][:,None]
+    t = instrument.lap("mutation", t)
+    
+    x_new = weight * x[parents[:,0]] + (1 - weight) * x[parents[:,1]]
+    t = instrument.lap("crossover", t, 0)
+    x_new[n_e+n_c:,:] = np.abs(x_new[n_e+n_c:,:] + sigma * rng.standard_normal((n_m,n)))
+    instrument.stop("mutation", t, 0)
+    
+    return x_new, parents, weight
@@ -10,8 +10,13 @@ Author: Julius Susanto
 Last edited: August 2014
 """
 import numpy as np
-import globals
+from collections import OrderedDict
+from config import algo_record
 from descent import nr_solver, dnr_solver, lm_solver
+from parallel import map_members
+from genetic import ga_next_generation
+import instrument
+from solvertrace import generation_record, stop_record
 
 """
 HY_SOLVER  - Hybrid algorithm solver for double cage model with core losses
@@ -19,11 +24,16 @@ HY_SOLVER  - Hybrid algorithm solver for double cage model with core losses
              Rs and Xr2 are computed by linear restrictions
              Includes change of variables
              Includes adaptive step size (as per Pedra 2008)
-             Includes determinant check of jacobian matrix
+             Includes singularity check of jacobian matrix
 
-Usage: hy_solver (p, desc, pop, n_r, n_e, c_f, n_gen, err_tol)
+Usage: hy_solver (progress, desc, p, pop, n_r, n_e, c_f, n_gen, err_tol, executor, seed, cache, warm_start, settings, trace, budget)
 
-Where   p is a vector of motor performance parameters:
+Where   progress is an optional callback progress(gen, member, err), called
+          after each member (after each generation if an executor is used,
+          with member None) with the best squared error so far. If it
+          returns True, the run is cancelled and the best member so far is
+          returned (conv = 0)
+        p is a vector of motor performance parameters:
         p = [sf eff pf Tb Tlr Ilr]
           sf = full-load slip
           eff = full-load efficiency
@@ -38,6 +48,27 @@ Where   p is a vector of motor performance parameters:
         c_f is the crossover fraction
         n_gen is the maximum number of generations  
         err_tol is the error tolerance for convergence
+        executor is an optional concurrent.futures executor (see
+          parallel.get_executor) used to run the descent solvers of each
+          generation's members in parallel
+        seed is an optional seed (or numpy.random.Generator) for the
+          random number generator, for repeatable runs
+        cache is an optional DescentCache of descent results (by default a
+          new cache sized as per settings.cache_size and settings.cache_tol
+          is used for the run)
+        warm_start is a true/false flag: if true (default), the descent
+          solver of each child starts from a blend of its parents' descent
+          results instead of the standard initial estimate
+        settings is a config.AlgoSettings record (or dictionary) with the
+          max_iter and conv_err of the descent solver and the cache settings
+          (defaults if None)
+        trace is an optional callback, called with a solvertrace.TraceRecord
+          for every generation (of the descent results of its members, and
+          a stop record if the run is cancelled or the budget runs out)
+        budget is an optional budget.Budget: when it is exhausted (checked
+          during the descent runs and after each member, or after each
+          generation if an executor is used) the best member so far is
+          returned
 
 Returns:   x is a vector of motor equivalent parameters:
           x = [Rs Xs Xm Rr1 Xr1 Rr2 Xr2 Rc]
@@ -53,93 +84,264 @@ Returns:   x is a vector of motor equivalent parameters:
           err is the squared error of the objective function
           conv is a true/false flag indicating convergence
 """    
-def hy_solver(self, desc, p, pop, n_r, n_e, c_f, n_gen, err_tol):
+def hy_solver(progress, desc, p, pop, n_r, n_e, c_f, n_gen, err_tol, executor=None, seed=None, cache=None, warm_start=True, settings=None, trace=None, budget=None):
+    
+    rng = np.random.default_rng(seed)
+    settings = algo_record(settings)
+    
+    if cache is None:
+        cache = DescentCache(settings.cache_size, settings.cache_tol)
     
     # Initial settings
-    gen = 1
-    conv = 0  
     sigma = 0.01
+    max_iter = settings.max_iter
+    conv_err = settings.conv_err
+    
+    # Best member so far
+    z_best = None
+    err_best = np.inf
     
     # Create initial population of Rs and Xr2 estimates
-    RX = 0.15 * np.random.rand(pop,2)
-    x = np.zeros((pop,8))
-    iter = np.zeros(pop)
-    err = np.zeros(pop)
-    conv = np.zeros(pop)
+    RX = 0.15 * rng.random((pop,2))
+    z0 = None
     
-    # Check solution of initial population
-    for i in range(0,pop):
-        self.statusBar().showMessage('Calculating generation %d, member %d...' % (gen, i+1))
-        
-        if desc == "NR":
-            [x[i,:], iter[i], err[i], conv[i]] = nr_solver(p, 1, RX[i,0], RX[i,1], globals.algo_data["max_iter"], globals.algo_data["conv_err"])
+    # Run genetic algorithm
+    for gen in range(1,n_gen+1):
         
-        if desc == "LM":
-            [x[i,:], iter[i], err[i], conv[i]] = lm_solver(p, 1, RX[i,0], RX[i,1], 1e-7, 5.0, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
+        # Create next generation
+        if gen > 1:
+            [RX, parents, weight] = ga_next_generation(rng, RX, err, n_r, n_e, c_f, sigma)
             
-        if desc == "DNR":
-            [x[i,:], iter[i], err[i], conv[i]] = dnr_solver(p, 1, RX[i,0], RX[i,1], 1e-7, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
+            if warm_start:
+                z0 = blend_parents(x, err, parents, weight)
         
-        if err[i] < err_tol:
+        # Check solution of current generation
+        t = instrument.start()
+        [x, iter, err, conv, i, cancelled] = eval_generation(progress, gen, desc, p, RX, max_iter, conv_err, err_tol, executor, cache, z0, err_best, budget)
+        instrument.stop("evaluation", t)
+        
+        if trace is not None:
+            trace(generation_record("HY", gen, x, err))
+        
+        if i is not None:
             z = x[i,:]
             conv = 1
             return z, gen, err[i], conv
+        
+        # Keep track of the best member so far (members not solved are inf)
+        e = np.where(np.isnan(err), np.inf, err)
+        j = np.argmin(e)
+        if (z_best is None) or (e[j] < err_best):
+            z_best = x[j,:].copy()
+            err_best = e[j]
+        
+        if cancelled:
+            if trace is not None:
+                reason = "budget" if (budget is not None) and budget.exhausted() else "cancelled"
+                trace(stop_record("HY", gen, err_best, z_best, reason))
+            break
     
-    # Run genetic algorithm
-    for gen in range(2,n_gen+1):
+    # Cancelled or the last generation, then output best results
+    return z_best, gen, err_best, 0
+
+"""
+DESCENT_MEMBER - Runs the descent solver for one member of the hybrid
+                 population, with Rs and Xr2 fixed (mode 1)
+
+Usage: descent_member (desc, p, Xr2, Rs, max_iter, conv_err, z0, budget)
+
+Where   z0 is an optional initial vector of equivalent circuit parameters
+        budget is an optional budget.Budget of the descent solver
+
+Returns: z, iter, err, conv as returned by the descent solver
+"""
+def descent_member(desc, p, Xr2, Rs, max_iter, conv_err, z0=None, budget=None):
+    
+    if desc == "NR":
+        return nr_solver(p, 1, Xr2, Rs, max_iter, conv_err, z0=z0, budget=budget)
+    
+    if desc == "LM":
+        return lm_solver(p, 1, Xr2, Rs, 1e-7, 5.0, max_iter, conv_err, z0=z0, budget=budget)
         
-        # Select for fitness
-        fitness = np.sort(err)
-        index = np.argsort(err)
+    if desc == "DNR":
+        return dnr_solver(p, 1, Xr2, Rs, 1e-7, max_iter, conv_err, z0=z0, budget=budget)
+    
+    raise ValueError("Unknown descent algorithm: %s" % desc)
+
+"""
+EVAL_GENERATION - Runs the descent solver for every member of a generation of
+                  the hybrid algorithm
+
+Usage: eval_generation (progress, gen, desc, p, RX, max_iter, conv_err, err_tol, executor, cache, z0, err_best, budget)
+
+Where   progress is an optional progress callback (see hy_solver)
+        RX is the pop x 2 matrix of [Xr2 Rs] member estimates
+        executor is an optional concurrent.futures executor
+        cache is an optional DescentCache (members found in the cache are
+          not solved again, whatever their initial estimate)
+        z0 is an optional pop x 8 matrix of initial estimates for the
+          descent solver (rows of NaN use the standard initial estimate)
+        err_best is the best squared error of previous generations
+        budget is an optional budget.Budget (see hy_solver)
+
+Serially, members are solved in order and the generation stops at the
+first converged member. With an executor all members are solved
+concurrently, and the first converged member (in population order) is
+reported, so both give the same result. The run can be cancelled by the
+progress callback (or the budget) after any member (serially) or at the
+end of the generation (with an executor).
+
+Returns: x, iter, err, conv are the members' descent results (err is inf
+           for members not solved)
+         i is the index of the first converged member (or None)
+         cancelled is a true/false flag indicating the run was cancelled (or
+           the budget exhausted)
+"""
+def eval_generation(progress, gen, desc, p, RX, max_iter, conv_err, err_tol, executor, cache=None, z0=None, err_best=np.inf, budget=None):
+    
+    pop = RX.shape[0]
+    x = np.zeros((pop,8))
+    iter = np.zeros(pop)
+    err = np.full(pop, np.inf)
+    conv = np.zeros(pop)
+    
+    if cache is None:
+        cache = DescentCache(0)
+    
+    keys = [cache.key(desc, p, RX[i,0], RX[i,1], max_iter, conv_err) for i in range(0,pop)]
+    
+    if z0 is None:
+        z0 = np.full((pop,8), np.nan)
+    starts = [z0[i,:] if np.all(np.isfinite(z0[i,:])) else None for i in range(0,pop)]
+    
+    if executor is None:
+        for i in range(0,pop):
+            r = cache.get(keys[i])
+            if r is None:
+                r = descent_member(desc, p, RX[i,0], RX[i,1], max_iter, conv_err, starts[i], budget)
+                # (results cut short by the budget are not cached)
+                if (budget is None) or not budget.exhausted():
+                    cache.put(keys[i], r)
+            [x[i,:], iter[i], err[i], conv[i]] = r
+            
+            if err[i] < err_tol:
+                return x, iter, err, conv, i, False
+            
+            if err[i] < err_best:
+                err_best = err[i]
+            
+            if (progress is not None) and progress(gen, i+1, err_best):
+                return x, iter, err, conv, None, True
+            if (budget is not None) and budget.exhausted():
+                return x, iter, err, conv, None, True
+    else:
+        # Only members not found in the cache are sent to the executor
+        results = [cache.get(k) for k in keys]
+        todo = [i for i in range(0,pop) if results[i] is None]
         
-        # Create next generation
-        RX_new = np.zeros((pop,2))
-        RX_mate = RX[index[0:n_r],:]         # select mating pool
+        args = [(desc, p, RX[i,0], RX[i,1], max_iter, conv_err, starts[i]) for i in todo]
+        for i, r in zip(todo, map_members(executor, descent_member, args)):
+            cache.put(keys[i], r)
+            results[i] = r
         
-        # Elite children (select best "n_e" children for next generation)
-        RX_new[0:n_e,:] = RX[index[0:n_e],:]
+        for i in range(0,pop):
+            [x[i,:], iter[i], err[i], conv[i]] = results[i]
         
-        # Crossover (random weighted average of parents)
-        n_c = int(np.round((pop - n_e) * c_f))       # number of crossover children
+        i_conv = np.flatnonzero(err < err_tol)
+        if i_conv.size > 0:
+            return x, iter, err, conv, i_conv[0], False
         
-        for j in range(0,n_c):
-            i_pair = np.ceil(n_r * np.random.rand(2,1))       # generate random pair of parents
-            weight = np.random.rand(2)                        # generate random weighting
-            # Crossover parents by weighted blend to generate new child           
-            RX_new[(n_e + j),:] = weight * RX_mate[int(i_pair[0,0])-1,:] + (1 - weight) * RX_mate[int(i_pair[1,0])-1,:]
+        err_best = np.nanmin(np.append(err, err_best))
         
-        # Mutation (gaussian noise added to parents)
-        n_m = pop - n_e - n_c;       # number of mutation children
+        if (progress is not None) and progress(gen, None, err_best):
+            return x, iter, err, conv, None, True
+        if (budget is not None) and budget.exhausted():
+            return x, iter, err, conv, None, True
+    
+    return x, iter, err, conv, None, False
+
+"""
+BLEND_PARENTS - Initial estimates for the descent solvers of a new hybrid
+                generation, blended from the parents' descent results
+
+Usage: blend_parents (x, err, parents, weight)
+
+Where   x is the pop x 8 matrix of the previous generation's descent results
+        err is the vector of their squared errors
+        parents and weight are as returned by ga_next_generation
+
+Returns: pop x 8 matrix of initial estimates, z0 = w * x[parent 1] + 
+         (1 - w) * x[parent 2] with w the mean blend weight of each child.
+         Rows are NaN (standard initial estimate) where a parent's descent
+         failed (non-finite results or squared error above 1)
+"""
+def blend_parents(x, err, parents, weight):
+    
+    w = np.mean(weight, axis=1)[:,None]
+    
+    with np.errstate(invalid="ignore"):
+        z0 = w * x[parents[:,0]] + (1 - w) * x[parents[:,1]]
+    
+    ok = np.all(np.isfinite(z0), axis=1) & np.all(err[parents] < 1, axis=1)
+    z0[~ok,:] = np.nan
+    
+    return z0
+
+"""
+DESCENTCACHE - Bounded least-recently-used cache of descent solver results
+               for the hybrid algorithm
+
+Usage: cache = DescentCache (max_size, tol)
+
+Where   max_size is the maximum number of results kept (0 disables caching)
+        tol is the tolerance to which Rs and Xr2 are quantized, so members
+          within tol of a solved member reuse its result
+
+Results are looked up with cache.get(cache.key(desc, p, Xr2, Rs, max_iter,
+conv_err)), which returns (z, iter, err, conv) or None, and stored with
+cache.put(key, result). The number of lookups found and not found in the
+cache are counted in cache.hits and cache.misses.
+"""
+class DescentCache:
+    
+    def __init__(self, max_size=4096, tol=1e-6):
+        self.max_size = max_size
+        self.tol = tol
+        self.hits = 0
+        self.misses = 0
+        self.results = OrderedDict()
+    
+    def __len__(self):
+        return len(self.results)
+    
+    # Key of a member: descent type and quantized (Rs, Xr2), plus the motor
+    # data and solver settings so that a cache can be shared between runs
+    def key(self, desc, p, Xr2, Rs, max_iter, conv_err):
+        return (desc, tuple(p), max_iter, conv_err, int(np.round(Rs / self.tol)), int(np.round(Xr2 / self.tol)))
+    
+    def get(self, key):
+        r = self.results.get(key)
         
-        for k in range(0,n_m):
-            # Select random parent from mating pool and add white noise
-            RX_new[(n_e + n_c + k),:] = np.abs(RX_mate[int(np.ceil(n_r * np.random.rand(1)) - 1),:] + sigma * np.random.randn(2))
+        if r is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
         
-        RX = RX_new
+        return r
+    
+    def put(self, key, result):
+        if self.max_size <= 0:
+            return
         
-        # Check solution of current generation
-        for i in range(0,pop):
-            self.statusBar().showMessage('Calculating generation %d, member %d...' % (gen, i+1))
-            
-            if desc == "NR":
-                [x[i,:], iter[i], err[i], conv[i]] = nr_solver(p, 1, RX[i,0], RX[i,1], globals.algo_data["max_iter"], globals.algo_data["conv_err"])
-            
-            if desc == "LM":
-                [x[i,:], iter[i], err[i], conv[i]] = lm_solver(p, 1, RX[i,0], RX[i,1], 1e-7, 5.0, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
-                
-            if desc == "DNR":
-                [x[i,:], iter[i], err[i], conv[i]] = dnr_solver(p, 1, RX[i,0], RX[i,1], 1e-7, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
-                       
-            if err[i] < err_tol:
-                z = x[i,:]
-                conv = 1
-                return z, gen, err[i], conv
-        
-        # If the last generation, then output best results
-        if gen == n_gen:
-            fitness = np.sort(err)
-            index = np.argsort(err)
-            z = x[index[0],:]
-            conv = 0
-            err = fitness[0]
-            return z, gen, err, conv
+        [z, iter, err, conv] = result
+        self.results[key] = (np.array(z, copy=True), iter, err, conv)
+        self.results.move_to_end(key)
+        
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+    
+    def clear(self):
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Solver Instrumentation
+
+Counters of the objective function evaluations (calc_pqt, get_torque and
+their variants) and timers of the solver phases:
+    jacobian    Jacobian matrix construction (descent algorithms)
+    solve       linear solves of the descent steps
+    step        accepted trial steps (update and objective evaluation)
+    retry       rejected trial steps (line search / damping retries)
+    selection, crossover, mutation, evaluation (genetic and hybrid
+                algorithms, evaluation includes the hybrid descent runs)
+Each phase is also counted (e.g. counts["retry"] is the number of rejected
+steps).
+
+Instrumentation is off unless stats are being collected (see collect and
+run), and then the calls in the solvers only check a context variable.
+Stats are per thread (and asyncio task), so that estimations running at once
+don't count each other's calls: the stats of executor workers (threads or
+processes) are sent back by parallel.map_members.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Stats being collected in the current context (None when instrumentation is
+# off)
+_stats = contextvars.ContextVar("stats", default=None)
+
+# Timed solver phases
+PHASES = ["jacobian", "solve", "step", "retry", "selection", "crossover", "mutation", "evaluation"]
+
+# Counters of the objective function evaluations
+EVALUATIONS = ["calc_pqt", "calc_pqt_jac", "calc_pqt_sc", "calc_pqt_batch", "calc_pqt_sc_batch"]
+
+"""
+STATS - Counts and times collected while instrumentation is on
+
+Fields: counts (name : number of calls or events)
+        times (phase : total time in seconds)
+"""
+class Stats:
+
+    def __init__(self):
+        self.counts = {}
+        self.times = {}
+
+    # Objective function evaluations (one per parameter vector evaluated)
+    def evaluations(self):
+        return sum(self.counts.get(name, 0) for name in EVALUATIONS)
+
+    # Add the counts and times of other stats
+    def merge(self, other):
+        for [name, n] in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + n
+        for [name, t] in other.times.items():
+            self.times[name] = self.times.get(name, 0.0) + t
+
+    def as_dict(self):
+        return {"evaluations" : self.evaluations(), "counts" : dict(self.counts), "times" : dict(self.times)}
+
+# Stats being collected in the current thread (or None)
+def current():
+    return _stats.get()
+
+# Count n calls or events
+def count(name, n=1):
+    stats = _stats.get()
+    if stats is not None:
+        stats.counts[name] = stats.counts.get(name, 0) + n
+
+# Start timing a phase (returns None when instrumentation is off)
+def start():
+    if _stats.get() is not None:
+        return time.perf_counter()
+
+# Stop timing a phase started at t (counted as n more of the phase)
+def stop(name, t, n=1):
+    stats = _stats.get()
+    if (t is not None) and (stats is not None):
+        stats.times[name] = stats.times.get(name, 0.0) + time.perf_counter() - t
+        stats.counts[name] = stats.counts.get(name, 0) + n
+
+# Stop timing a phase started at t and start timing the next one
+def lap(name, t, n=1):
+    stop(name, t, n)
+    return start()
+
+"""
+COLLECT - Turns instrumentation on within a with block
+
+Usage: with collect() as s:
+           ...
+
+The stats of nested blocks are also added to the enclosing block's (at the
+end of the nested block). Only the calls made in the current thread are
+collected.
+"""
+@contextmanager
+def collect():
+
+    outer = _stats.get()
+    inner = Stats()
+    token = _stats.set(inner)
+
+    try:
+        yield inner
+    finally:
+        _stats.reset(token)
+        if outer is not None:
+            outer.merge(inner)
+
+"""
+RUN - Runs a solver (or estimate.estimate) with instrumentation on
+
+Usage: [z, iter, err, conv, stats] = run (fn, *args, **kwargs)
+
+Returns: the results of fn, followed by the Stats collected
+"""
+def run(fn, *args, **kwargs):
+
+    with collect() as s:
+        r = fn(*args, **kwargs)
+
+    return tuple(r) + (s,)
+
+# Call fn(*args) with instrumentation on (in an executor worker), returns the
+# result and the Stats collected
+def collected(fn, *args):
+    with collect() as s:
+        r = fn(*args)
+
+    return r, s
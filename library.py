@@ -0,0 +1,271 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Motor Library Index
+
+Scans a directory of .mto files into typed records (config.MotorData and
+config.AlgoSettings), with lookups by voltage, rating and description. The
+parsed records are cached in an index file, keyed by path, modification time
+and size, so that only new or changed files are read again.
+
+Usage: python -m library DIRECTORY [--voltage V] [--power MIN:MAX] [--search TEXT]
+"""
+import os, sys, re, json, bisect, hashlib, argparse
+from collections import namedtuple
+import saveload
+from config import MotorData, AlgoSettings
+
+# Default location of the index files (per user, one per library directory)
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".moto")
+
+# Version of the index file format
+INDEX_VERSION = 1
+
+# Rating units (in kW)
+POWER_UNITS = {"w" : 1e-3, "kw" : 1.0, "mw" : 1e3, "hp" : 0.7457}
+
+# Voltage units (in V)
+VOLTAGE_UNITS = {"v" : 1.0, "kv" : 1e3}
+
+"""
+LIBRARYENTRY - Motor of the library
+
+Fields: path, mtime, size (of the file)
+        motor (config.MotorData), settings (config.AlgoSettings)
+        voltage (V) and power (kW) ratings, from the description (None if
+          not given)
+"""
+LibraryEntry = namedtuple("LibraryEntry", ["path", "mtime", "size", "motor", "settings", "voltage", "power"])
+
+"""
+PARSE_RATINGS - Voltage and power ratings from a motor description,
+                e.g. "Weg 6.6kV 350HP"
+
+Usage: parse_ratings (description)
+
+Returns: voltage (V) and power (kW), None if not found
+"""
+def parse_ratings(description):
+
+    voltage = None
+    power = None
+
+    for [value, unit] in re.findall(r"(\d+(?:\.\d+)?)\s*(kV|V|MW|kW|W|HP)\b", description, re.IGNORECASE):
+        unit = unit.lower()
+
+        if (unit in VOLTAGE_UNITS) and (voltage is None):
+            voltage = float(value) * VOLTAGE_UNITS[unit]
+        elif (unit in POWER_UNITS) and (power is None):
+            power = float(value) * POWER_UNITS[unit]
+
+    return voltage, power
+
+"""
+MOTORLIBRARY - Index of the .mto files of a library directory
+
+Usage: library = MotorLibrary (directory, index_file)
+
+Where   directory is the library directory
+        index_file is the file the parsed records are cached in (default in
+          INDEX_DIR, False to not cache them)
+
+The directory is scanned when created, and again with library.scan()
+(only new or changed files are read). Lookups:
+    library.by_voltage (voltage, tol)
+    library.by_power (p_min, p_max)
+    library.search (text)
+    library.find (voltage, p_min, p_max, text)
+all return lists of LibraryEntry. Files that cannot be read are listed in
+library.errors (path : message).
+"""
+class MotorLibrary:
+
+    def __init__(self, directory, index_file=None):
+        self.directory = os.path.abspath(directory)
+
+        if index_file is None:
+            name = hashlib.sha1(self.directory.encode("utf-8")).hexdigest()[0:12]
+            index_file = os.path.join(INDEX_DIR, "library_%s.json" % name)
+
+        self.index_file = index_file
+        self.entries = {}
+        self.errors = {}
+        self.reads = 0
+
+        self.load_index()
+        self.scan()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.sorted)
+
+    # Scan the directory, reading only new or changed files
+    def scan(self):
+        entries = {}
+        self.errors = {}
+        changed = False
+
+        with os.scandir(self.directory) as it:
+            for f in it:
+                if not f.name.lower().endswith(".mto") or not f.is_file():
+                    continue
+
+                stat = f.stat()
+                entry = self.entries.get(f.path)
+
+                if (entry is None) or (entry.mtime != stat.st_mtime) or (entry.size != stat.st_size):
+                    try:
+                        entry = read_entry(f.path, stat.st_mtime, stat.st_size)
+                    except Exception as e:
+                        self.errors[f.path] = str(e)
+                        continue
+
+                    self.reads += 1
+                    changed = True
+
+                entries[f.path] = entry
+
+        changed = changed or (len(entries) != len(self.entries))
+        self.entries = entries
+        self.build_index()
+
+        if changed:
+            self.save_index()
+
+    # Sorted lookup tables
+    def build_index(self):
+        self.sorted = sorted(self.entries.values(), key=lambda e: e.path)
+
+        rated = [e for e in self.sorted if e.power is not None]
+        rated.sort(key=lambda e: e.power)
+        self.power_keys = [e.power for e in rated]
+        self.power_entries = rated
+
+        self.voltages = {}
+        for e in self.sorted:
+            if e.voltage is not None:
+                self.voltages.setdefault(e.voltage, []).append(e)
+
+    # Motors of a voltage rating (V), within a relative tolerance
+    def by_voltage(self, voltage, tol=0.01):
+        entries = []
+
+        for [v, e] in self.voltages.items():
+            if abs(v - voltage) <= tol * voltage:
+                entries.extend(e)
+
+        return sorted(entries, key=lambda e: e.path)
+
+    # Motors with a power rating (kW) between p_min and p_max (inclusive)
+    def by_power(self, p_min=None, p_max=None):
+        lo = 0 if p_min is None else bisect.bisect_left(self.power_keys, p_min)
+        hi = len(self.power_keys) if p_max is None else bisect.bisect_right(self.power_keys, p_max)
+
+        return self.power_entries[lo:hi]
+
+    # Motors whose description contains all the words of a text (not case
+    # sensitive)
+    def search(self, text):
+        words = text.lower().split()
+
+        return [e for e in self.sorted if all(w in e.motor.description.lower() for w in words)]
+
+    # Motors matching all the given criteria
+    def find(self, voltage=None, p_min=None, p_max=None, text=None):
+        entries = self.sorted
+
+        if voltage is not None:
+            entries = self.by_voltage(voltage)
+        if (p_min is not None) or (p_max is not None):
+            paths = set(e.path for e in self.by_power(p_min, p_max))
+            entries = [e for e in entries if e.path in paths]
+        if text:
+            paths = set(e.path for e in self.search(text))
+            entries = [e for e in entries if e.path in paths]
+
+        return entries
+
+    # Load the cached records of the index file (if any, and valid)
+    def load_index(self):
+        if not self.index_file or not os.path.exists(self.index_file):
+            return
+
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+
+            if (data.get("version") != INDEX_VERSION) or (data.get("directory") != self.directory):
+                return
+
+            for d in data["entries"]:
+                self.entries[d["path"]] = LibraryEntry(d["path"], d["mtime"], d["size"], MotorData.from_dict(d["motor"]), AlgoSettings.from_dict(d["settings"]), d["voltage"], d["power"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    # Save the records to the index file (not an error if it can't be written)
+    def save_index(self):
+        if not self.index_file:
+            return
+
+        data = {"version" : INDEX_VERSION, "directory" : self.directory, "entries" : [
+            {"path" : e.path, "mtime" : e.mtime, "size" : e.size, "motor" : e.motor.as_dict(), "settings" : e.settings.as_dict(), "voltage" : e.voltage, "power" : e.power} for e in self.sorted]}
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.index_file))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            tmp = self.index_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.index_file)
+        except OSError:
+            pass
+
+# Read a library entry from a .mto file
+def read_entry(path, mtime, size):
+    [motor_data, algo_data] = saveload.read_file(path)
+    motor = MotorData.from_dict(motor_data)
+    [voltage, power] = parse_ratings(motor.description)
+
+    return LibraryEntry(path, mtime, size, motor, AlgoSettings.from_dict(algo_data), voltage, power)
+
+# Voltage given on the command line (e.g. 6600, 6.6kV or 415V), in V
+def parse_voltage(text):
+    [voltage, power] = parse_ratings(text)
+    if voltage is None:
+        voltage = float(text)
+
+    return voltage
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m library", description="List the motors of a library directory")
+    parser.add_argument("directory", metavar="DIRECTORY", help="library directory of .mto files")
+    parser.add_argument("--voltage", type=parse_voltage, default=None, help="voltage rating (e.g. 6.6kV)")
+    parser.add_argument("--power", default=None, metavar="MIN:MAX", help="range of power ratings in kW (e.g. 300:700)")
+    parser.add_argument("--search", default=None, metavar="TEXT", help="words in the description")
+    args = parser.parse_args(argv)
+
+    [p_min, p_max] = [None, None]
+    if args.power:
+        [lo, sep, hi] = args.power.partition(":")
+        p_min = float(lo) if lo else None
+        p_max = (float(hi) if hi else None) if sep else p_min
+
+    library = MotorLibrary(args.directory)
+
+    for e in library.find(args.voltage, p_min, p_max, args.search):
+        print("%s\t%s\t%s\t%s" % (e.motor.description, "" if e.voltage is None else "%g V" % e.voltage, "" if e.power is None else "%g kW" % e.power, e.path))
+
+    for [path, message] in sorted(library.errors.items()):
+        print("%s: %s" % (path, message), file=sys.stderr)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,21 +10,101 @@ Author: Julius Susanto
 Last edited: August 2014
 """
 
-import os, sys
+import os, sys, time
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtGui import QAction, QFont, Qt
-from PySide6.QtWidgets import QLabel, QLineEdit
+from PySide6.QtWidgets import QLabel, QLineEdit, QMessageBox, QFileDialog
 import numpy as np
-import dateutil, pyparsing
-import matplotlib
-matplotlib.use('QtAgg')
-import matplotlib.pyplot as plt
 import globals
 import saveload
-from common_calcs import get_torque, get_torque_sc
-from descent import nr_solver, lm_solver, dnr_solver, nr_solver_sc
-from genetic import ga_solver
-from hybrid import hy_solver
+from curves import get_curves
+
+# Minimum time between progress updates from the estimation worker (s)
+PROGRESS_INTERVAL = 0.1
+
+# Matplotlib (and the solvers not needed to show the window) are imported when
+# first used, to keep the startup time down (see startup.py)
+def pyplot():
+    import matplotlib
+    matplotlib.use('QtAgg')
+    import matplotlib.pyplot as plt
+    
+    return plt
+
+class EstimateWorker(QtCore.QThread):
+    """
+    Runs a parameter estimation on a worker thread, with throttled progress
+    signals (generation, member, best squared error so far), throttled
+    batches of solver trace records (for the convergence plot), and
+    cancellation at the next member (or generation) boundary
+    """
+    
+    progress = QtCore.Signal(int, int, float)
+    traced = QtCore.Signal(object)
+    result = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+    
+    def __init__(self, model, algo, motor, settings, executor, cache=None, warm=None, race=None, parent=None):
+        super(EstimateWorker, self).__init__(parent)
+        
+        self.model = model
+        self.algo = algo
+        self.motor = motor
+        self.settings = settings
+        self.executor = executor
+        self.cache = cache
+        self.warm = warm
+        self.race = race
+        self.winner = None
+        self.cached = False
+        self.cancelled = False
+        self.last_progress = 0.0
+        self.points = []
+        self.last_trace = 0.0
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    # Progress callback of the solvers (returns True to cancel the run)
+    def report(self, gen, member, err):
+        t = time.monotonic()
+        
+        if t - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = t
+            self.progress.emit(gen, 0 if member is None else member, float(err))
+        
+        return self.cancelled
+    
+    # Trace callback of the solvers (records are sent in batches)
+    def trace(self, record):
+        self.points.append(record)
+        t = time.monotonic()
+        
+        if t - self.last_trace >= PROGRESS_INTERVAL:
+            self.last_trace = t
+            self.flush_points()
+    
+    def flush_points(self):
+        if self.points:
+            self.traced.emit(self.points)
+            self.points = []
+    
+    def run(self):
+        try:
+            if self.race is not None:
+                r = self.race.run(self.model, self.motor, self.settings, None, lambda: self.cancelled, self.trace)
+                [z, iter, err, conv, self.winner] = r[0:5]
+            else:
+                from resultcache import cached_estimate
+                [z, iter, err, conv, self.cached] = cached_estimate(self.cache, self.model, self.algo, self.motor, self.settings, self.report, self.executor, None, self.warm, self.trace)
+        except Exception as e:
+            self.flush_points()
+            self.failed.emit(str(e))
+            return
+        
+        self.flush_points()
+        # The worker may be gone when the results are shown (see show_results)
+        self.result.emit((z, iter, err, conv, self.cached, self.winner, self.cancelled))
 
 class Window(QtWidgets.QMainWindow):
     
@@ -32,11 +112,18 @@ class Window(QtWidgets.QMainWindow):
         super(Window, self).__init__()
         
         globals.init()
+        self.executor = None
+        self.n_workers = 1
+        self.worker = None
+        self.result_cache = None
+        self.warm_index = None
+        self.curve_lines = None
+        self.race = None
         self.initUI()       
         
     def initUI(self):
         
-        self.resize(800, 600)
+        self.resize(800, 780)
         self.centre()
         
         # palette = QtGui.QPalette()
@@ -52,7 +139,7 @@ class Window(QtWidgets.QMainWindow):
         exitAction = QtGui.QAction(QtGui.QIcon('icons/exit.png'), '&Exit', self)        
         exitAction.setShortcut('Ctrl+Q')
         exitAction.setStatusTip('Exit application')
-        exitAction.triggered.connect(QtWidgets.QApplication.quit)
+        exitAction.triggered.connect(self.close)
         
         loadAction = QAction('&Open File...', self)
         loadAction.setStatusTip('Open file and load motor data')
@@ -245,6 +332,25 @@ class Window(QtWidgets.QMainWindow):
         self.le12.setText(str(globals.algo_data["k_x"]))
         self.le12.setStatusTip('Linear constraint for Xr2')
         
+        self.label_starts = QtWidgets.QLabel('Multi-start points')
+        
+        self.le_starts = QtWidgets.QLineEdit()
+        self.le_starts.setText(str(globals.algo_data["n_starts"]))
+        self.le_starts.setStatusTip('Number of starting points run in lockstep (1 for a single start)')
+        
+        # Solver budget (all algorithms)
+        label_time = QtWidgets.QLabel('Time limit (s)')
+        
+        self.le_time = QtWidgets.QLineEdit()
+        self.le_time.setText(str(globals.algo_data["max_time"]))
+        self.le_time.setStatusTip('Maximum run time, keeping the best result so far (0 for no limit)')
+        
+        label_evals = QtWidgets.QLabel('Evaluation limit')
+        
+        self.le_evals = QtWidgets.QLineEdit()
+        self.le_evals.setText(str(globals.algo_data["max_evals"]))
+        self.le_evals.setStatusTip('Maximum number of objective function evaluations (0 for no limit)')
+        
         # Genetic Algorithm Widgets
         ############################
         
@@ -284,6 +390,28 @@ class Window(QtWidgets.QMainWindow):
         self.lec_f.setStatusTip('Proportion of children spawned through crossover')
         self.lec_f.hide()
         
+        self.labeln_workers = QtWidgets.QLabel('Worker processes')
+        self.labeln_workers.setVisible(0)
+        self.labelcache_size = QtWidgets.QLabel('Descent cache size')
+        self.labelcache_size.setVisible(0)
+        self.labelcache_tol = QtWidgets.QLabel('Descent cache tolerance')
+        self.labelcache_tol.setVisible(0)
+        
+        self.len_workers = QtWidgets.QLineEdit()
+        self.len_workers.setText(str(globals.algo_data["n_workers"]))
+        self.len_workers.setStatusTip('Number of processes evaluating the population (1 to evaluate in this one)')
+        self.len_workers.hide()
+        
+        self.lecache_size = QtWidgets.QLineEdit()
+        self.lecache_size.setText(str(globals.algo_data["cache_size"]))
+        self.lecache_size.setStatusTip('Number of descent results cached by the hybrid algorithms')
+        self.lecache_size.hide()
+        
+        self.lecache_tol = QtWidgets.QLineEdit()
+        self.lecache_tol.setText(str(globals.algo_data["cache_tol"]))
+        self.lecache_tol.setStatusTip('Distance within which members reuse a cached descent result')
+        self.lecache_tol.hide()
+        
         
         label_algo = QtWidgets.QLabel('Algorithm')
         #label_algo.setMinimumWidth(150)
@@ -296,9 +424,14 @@ class Window(QtWidgets.QMainWindow):
         self.combo_algo.addItem("Hybrid GA-NR")
         self.combo_algo.addItem("Hybrid GA-LM")
         self.combo_algo.addItem("Hybrid GA-DNR")
+        self.combo_algo.addItem("Race")
         
-        calc_button = QtWidgets.QPushButton("Calculate")
-        calc_button.setStatusTip('Estimate equivalent circuit parameters')
+        self.calc_button = QtWidgets.QPushButton("Calculate")
+        self.calc_button.setStatusTip('Estimate equivalent circuit parameters')
+        
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.setStatusTip('Stop the calculation and keep the best result so far')
+        self.cancel_button.hide()
         
         self.plot_button = QtWidgets.QPushButton("Plot")
         self.plot_button.setDisabled(1)
@@ -444,6 +577,12 @@ class Window(QtWidgets.QMainWindow):
         grid.addWidget(self.le11, i+2, 4)
         grid.addWidget(self.label12, i+3, 3)
         grid.addWidget(self.le12, i+3, 4)
+        grid.addWidget(self.label_starts, i+4, 3)
+        grid.addWidget(self.le_starts, i+4, 4)
+        grid.addWidget(label_time, i+5, 0)
+        grid.addWidget(self.le_time, i+5, 1)
+        grid.addWidget(label_evals, i+6, 0)
+        grid.addWidget(self.le_evals, i+6, 1)
         
         # Genetic algorithm parameters
         grid.addWidget(self.labeln_gen, i+2, 3)
@@ -456,12 +595,19 @@ class Window(QtWidgets.QMainWindow):
         grid.addWidget(self.len_e, i+2, 6)
         grid.addWidget(self.labelc_f, i+3, 5)
         grid.addWidget(self.lec_f, i+3, 6)
-        
-        grid.addWidget(calc_button, i+4, 5)
+        grid.addWidget(self.labeln_workers, i+5, 3)
+        grid.addWidget(self.len_workers, i+5, 4)
+        grid.addWidget(self.labelcache_size, i+6, 3)
+        grid.addWidget(self.lecache_size, i+6, 4)
+        grid.addWidget(self.labelcache_tol, i+6, 5)
+        grid.addWidget(self.lecache_tol, i+6, 6)
+        
+        grid.addWidget(self.cancel_button, i+1, 5)
+        grid.addWidget(self.calc_button, i+4, 5)
         grid.addWidget(self.plot_button, i+4, 6)
         
         # Algorithm results
-        i = 17
+        i = 19
         grid.addWidget(header4, i, 0)
         grid.addWidget(label13, i+1, 0)
         grid.addWidget(self.leRs, i+1, 1)
@@ -486,6 +632,10 @@ class Window(QtWidgets.QMainWindow):
         grid.addWidget(label23, i+3, 5)
         grid.addWidget(self.leIter, i+3, 6)
         
+        # Convergence of the running calculation (see convergence_plot)
+        self.grid = grid
+        self.conv_plot = None
+        
         grid.setAlignment(Qt.AlignTop)      
 
         main_screen = QtWidgets.QWidget()
@@ -495,7 +645,8 @@ class Window(QtWidgets.QMainWindow):
         self.setCentralWidget(main_screen)
         
         # Event handlers
-        calc_button.clicked.connect(self.calculate)
+        self.calc_button.clicked.connect(self.calculate)
+        self.cancel_button.clicked.connect(self.cancel_calculation)
         self.plot_button.clicked.connect(self.plot_curves)
         
         self.le1.editingFinished.connect(self.update_data)
@@ -510,11 +661,17 @@ class Window(QtWidgets.QMainWindow):
         self.le10.editingFinished.connect(self.update_data)
         self.le11.editingFinished.connect(self.update_data)
         self.le12.editingFinished.connect(self.update_data)
+        self.le_starts.editingFinished.connect(self.update_data)
         self.len_gen.editingFinished.connect(self.update_data)
         self.lepop.editingFinished.connect(self.update_data)
         self.len_r.editingFinished.connect(self.update_data)
         self.len_e.editingFinished.connect(self.update_data)
         self.lec_f.editingFinished.connect(self.update_data)
+        self.len_workers.editingFinished.connect(self.update_data)
+        self.lecache_size.editingFinished.connect(self.update_data)
+        self.lecache_tol.editingFinished.connect(self.update_data)
+        self.le_time.editingFinished.connect(self.update_data)
+        self.le_evals.editingFinished.connect(self.update_data)
         
         ##########################
         #TO DO - connects for combo boxes - combo_model and combo_algo (what signal to use?)
@@ -524,41 +681,87 @@ class Window(QtWidgets.QMainWindow):
         
         self.statusBar().showMessage('Ready')
     
-    # Calculate parameter estimates
+    # Calculate parameter estimates (on a worker thread)
     def calculate(self):
+        if self.worker is not None:
+            return
+        
         self.statusBar().showMessage('Calculating...')
         
-        sf = (globals.motor_data["sync_speed"] - globals.motor_data["rated_speed"]) / globals.motor_data["sync_speed"]
+        model = self.combo_model.currentText()
+        algo = self.combo_algo.currentText()
         
-        if self.combo_model.currentIndex() == 0:
-            # Single cage
-            p = [sf, globals.motor_data["rated_eff"], globals.motor_data["rated_pf"], globals.motor_data["T_b"]]
-            [z, iter, err, conv] = nr_solver_sc(p, 0, globals.algo_data["k_x"], globals.algo_data["k_r"], globals.algo_data["max_iter"], globals.algo_data["conv_err"]) 
-            
+        genetic = algo in ("Genetic Algorithm", "Hybrid GA-NR", "Hybrid GA-LM", "Hybrid GA-DNR")
+        
+        executor = None
+        if genetic:
+            executor = self.get_executor()
+        
+        # Snapshot of the current data (edits during the run don't affect it)
+        [motor, settings] = globals.records()
+        
+        conv_plot = self.convergence_plot()
+        if genetic:
+            conv_plot.start(settings.n_gen, settings.conv_err, "Generation")
         else:
-            # Double cage
-            p = [sf, globals.motor_data["rated_eff"], globals.motor_data["rated_pf"], globals.motor_data["T_b"], globals.motor_data["T_lr"], globals.motor_data["I_lr"] ]            
-            
-            if self.combo_algo.currentText() == "Newton-Raphson":
-                [z, iter, err, conv] = nr_solver(p, 0, globals.algo_data["k_x"], globals.algo_data["k_r"], globals.algo_data["max_iter"], globals.algo_data["conv_err"])           
-            
-            if self.combo_algo.currentText() == "Levenberg-Marquardt":
-                [z, iter, err, conv] = lm_solver(p, 0, globals.algo_data["k_x"], globals.algo_data["k_r"], 1e-7, 5.0, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
-                
-            if self.combo_algo.currentText() == "Damped Newton-Raphson":
-                [z, iter, err, conv] = dnr_solver(p, 0, globals.algo_data["k_x"], globals.algo_data["k_r"], 1e-7, globals.algo_data["max_iter"], globals.algo_data["conv_err"])
-                
-            if self.combo_algo.currentText() == "Genetic Algorithm":
-                [z, iter, err, conv] = ga_solver(self, p, globals.algo_data["pop"], globals.algo_data["n_r"], globals.algo_data["n_e"], globals.algo_data["c_f"], globals.algo_data["n_gen"], globals.algo_data["conv_err"])
-                
-            if self.combo_algo.currentText() == "Hybrid GA-NR":
-                [z, iter, err, conv] = hy_solver(self, "NR", p, globals.algo_data["pop"], globals.algo_data["n_r"], globals.algo_data["n_e"], globals.algo_data["c_f"], globals.algo_data["n_gen"], globals.algo_data["conv_err"])
-                
-            if self.combo_algo.currentText() == "Hybrid GA-LM":
-                [z, iter, err, conv] = hy_solver(self, "LM", p, globals.algo_data["pop"], globals.algo_data["n_r"], globals.algo_data["n_e"], globals.algo_data["c_f"], globals.algo_data["n_gen"], globals.algo_data["conv_err"])
-                
-            if self.combo_algo.currentText() == "Hybrid GA-DNR":
-                [z, iter, err, conv] = hy_solver(self, "DNR", p, globals.algo_data["pop"], globals.algo_data["n_r"], globals.algo_data["n_e"], globals.algo_data["c_f"], globals.algo_data["n_gen"], globals.algo_data["conv_err"])
+            conv_plot.start(settings.max_iter, settings.conv_err, "Iteration")
+        
+        race = None
+        if algo == "Race":
+            race = self.get_race()
+        
+        self.worker = EstimateWorker(model, algo, motor, settings, executor, self.get_result_cache(), self.get_warm_index(), race, self)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.traced.connect(conv_plot.add)
+        self.worker.result.connect(self.show_results)
+        self.worker.failed.connect(self.calculation_failed)
+        self.worker.finished.connect(self.calculation_finished)
+        
+        self.calc_button.setDisabled(1)
+        self.cancel_button.setEnabled(1)
+        self.cancel_button.show()
+        
+        self.worker.start()
+    
+    # Convergence plot of the calculations, created when first used (so that
+    # matplotlib isn't loaded at startup)
+    def convergence_plot(self):
+        if self.conv_plot is None:
+            from convplot import ConvergencePlot
+            self.conv_plot = ConvergencePlot(self)
+            self.conv_plot.setMinimumHeight(180)
+            self.grid.addWidget(self.conv_plot, 24, 0, 1, 7)
+        
+        return self.conv_plot
+    
+    # Cancel the running calculation (the best result so far is shown)
+    def cancel_calculation(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_button.setDisabled(1)
+            self.statusBar().showMessage('Cancelling...')
+    
+    # Show progress of the running calculation
+    def show_progress(self, gen, member, err):
+        if member > 0:
+            self.statusBar().showMessage('Calculating generation %d, member %d (best squared error %.3g)...' % (gen, member, err))
+        else:
+            self.statusBar().showMessage('Calculating generation %d (best squared error %.3g)...' % (gen, err))
+    
+    def calculation_failed(self, message):
+        QMessageBox.warning(self, 'Warning', "Calculation failed: %s" % message, QMessageBox.Ok)
+        self.statusBar().showMessage('Ready')
+    
+    def calculation_finished(self):
+        self.worker = None
+        self.calc_button.setEnabled(1)
+        self.cancel_button.hide()
+    
+    # Show the results of a calculation (everything needed comes with the
+    # results, as calculation_finished clears self.worker while the warning
+    # dialog is open)
+    def show_results(self, r):
+        [z, iter, err, conv, cached, winner, cancelled] = r
         
         self.leRs.setText(str(np.round(z[0],5)))
         self.leXs.setText(str(np.round(z[1],5)))
@@ -576,6 +779,10 @@ class Window(QtWidgets.QMainWindow):
         
         if conv == 1:
             self.leConv.setText("Yes")
+            if not cached:
+                self.warm_index.save()
+        elif cancelled:
+            self.leConv.setText("No")
         else:
             QMessageBox.warning(self, 'Warning', "Algorithm did not converge.", QMessageBox.Ok)
             self.leConv.setText("No")
@@ -589,11 +796,73 @@ class Window(QtWidgets.QMainWindow):
         else:
             self.plot_button.setDisabled(1)
         
-        self.statusBar().showMessage('Ready')
+        if winner is not None:
+            self.statusBar().showMessage('Ready (won by %s)' % winner)
+        elif cached:
+            self.statusBar().showMessage('Ready (cached result)')
+        else:
+            self.statusBar().showMessage('Ready')
         
-    # Plot torque-speed and current-speed curves
+    # Executor for evaluating GA / hybrid members in parallel (None when
+    # algo_data["n_workers"] <= 1), kept alive between calculations
+    def get_executor(self):
+        n_workers = globals.algo_data["n_workers"]
+        
+        if n_workers != self.n_workers:
+            if self.executor is not None:
+                self.executor.shutdown()
+            import parallel
+            self.executor = parallel.get_executor(n_workers)
+            self.n_workers = n_workers
+        
+        return self.executor
+    
+    # Result cache and warm start index, opened on the first calculation (not
+    # at startup, as they may be on a slow drive)
+    def get_result_cache(self):
+        if self.result_cache is None:
+            from resultcache import ResultCache
+            self.result_cache = ResultCache()
+        
+        return self.result_cache
+    
+    def get_warm_index(self):
+        if self.warm_index is None:
+            from warmstart import WarmStartIndex, DEFAULT_PATH
+            self.warm_index = WarmStartIndex(DEFAULT_PATH)
+        
+        return self.warm_index
+    
+    # Solver race of the "Race" algorithm (the descent algorithms and the
+    # hybrid GA-DNR, in worker processes kept alive between calculations)
+    def get_race(self):
+        if self.race is None:
+            from race import SolverRace, RACE_ALGORITHMS
+            self.race = SolverRace(RACE_ALGORITHMS + ["Hybrid GA-DNR"])
+        
+        return self.race
+    
+    # Stop a running calculation and the worker processes before closing (the
+    # worker thread would otherwise outlive the window)
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        
+        if self.race is not None:
+            self.race.shutdown()
+            self.race = None
+        
+        event.accept()
+    
+    # Plot torque-speed and current-speed curves (an open plot is updated in
+    # place)
     def plot_curves(self):
-        sf = (globals.motor_data["sync_speed"] - globals.motor_data["rated_speed"]) / globals.motor_data["sync_speed"]
+        model = self.combo_model.currentText()
         if self.combo_model.currentIndex() == 0:
             # Single cage
             x = [float(self.leRs.text()), float(self.leXs.text()) , float(self.leXm.text()), float(self.leRr1.text()), float(self.leRc.text()), float(self.leXr1.text())]
@@ -601,46 +870,35 @@ class Window(QtWidgets.QMainWindow):
             # Double cage
             x = [float(self.leRs.text()), float(self.leXs.text()) , float(self.leXm.text()), float(self.leRr1.text()), float(self.leXr1.text()), float(self.leRr2.text()), float(self.leXr2.text()), float(self.leRc.text())]
         
-        # Rated per-unit torque
-        T_rtd = globals.motor_data["rated_eff"] * globals.motor_data["rated_pf"] / (1 - sf)
-        
-        Tm = np.zeros(1001)
-        Im = np.zeros(1001)
-        speed = np.zeros(1001)
-        speed[1000] = globals.motor_data["sync_speed"]
-        for n in range(0,1000):
-            speed[n] = float(n) / 1000 * globals.motor_data["sync_speed"]
-            i = 1 - float(n) / 1000
-            if self.combo_model.currentIndex() == 0:
-                # Single cage
-                [Ti, Ii] = get_torque_sc(i,x)
-            else:
-                # Double cage
-                [Ti, Ii] = get_torque(i,x)
-            
-            Tm[n] = Ti / T_rtd      # Convert torque to T/Tn value
-            Im[n] = np.abs(Ii)
-        
-        # Plot torque-speed and current-speed curves
-        if plt.fignum_exists(1):
-            # Do nothing
-            QMessageBox.warning(self, 'Warning', "A plot is already open. Please close to create a new plot.", QMessageBox.Ok)
+        c = get_curves(model, x, globals.motor_data)
+        plt = pyplot()
+        
+        if plt.fignum_exists(1) and (self.curve_lines is not None):
+            [line_t, line_i] = self.curve_lines
+            line_t.set_data(c.speed, c.torque)
+            line_i.set_data(c.speed, c.current)
+            for line in self.curve_lines:
+                line.axes.set_xlim([0, globals.motor_data["sync_speed"]])
+                line.axes.relim()
+                line.axes.autoscale_view(scalex=False)
+            line_t.figure.canvas.draw_idle()
         else:
             plt.figure(1, facecolor='white')
             plt.subplot(211)
-            plt.plot(speed, Tm)
+            [line_t] = plt.plot(c.speed, c.torque)
             plt.xlim([0, globals.motor_data["sync_speed"]])
             plt.xlabel("Speed (rpm)")
             plt.ylabel("Torque (T/Tn)")
             plt.grid(color = '0.75', linestyle='--', linewidth=1)
             
             plt.subplot(212)
-            plt.plot(speed, Im, 'r')
+            [line_i] = plt.plot(c.speed, c.current, 'r')
             plt.xlim([0, globals.motor_data["sync_speed"]])
             plt.xlabel("Speed (rpm)")
             plt.ylabel("Current (pu)")
             plt.grid(color = '0.75', linestyle='--', linewidth=1)
             
+            self.curve_lines = [line_t, line_i]
             plt.show()
     
     # Update global variables on change in data fields
@@ -658,11 +916,17 @@ class Window(QtWidgets.QMainWindow):
             globals.algo_data["conv_err"] = float(self.le10.text())
             globals.algo_data["k_r"] = float(self.le11.text())
             globals.algo_data["k_x"] = float(self.le12.text())
+            globals.algo_data["n_starts"] = int(self.le_starts.text())
             globals.algo_data["n_gen"] = int(self.len_gen.text())
             globals.algo_data["pop"] = int(self.lepop.text())
             globals.algo_data["n_r"] = int(self.len_r.text())
             globals.algo_data["n_e"] = int(self.len_e.text())
             globals.algo_data["c_f"] = float(self.lec_f.text())
+            globals.algo_data["n_workers"] = int(self.len_workers.text())
+            globals.algo_data["cache_size"] = int(self.lecache_size.text())
+            globals.algo_data["cache_tol"] = float(self.lecache_tol.text())
+            globals.algo_data["max_time"] = float(self.le_time.text())
+            globals.algo_data["max_evals"] = int(self.le_evals.text())
         except Exception as err:
             print(err)
     
@@ -681,11 +945,17 @@ class Window(QtWidgets.QMainWindow):
         self.le10.setText(str(globals.algo_data["conv_err"]))
         self.le11.setText(str(globals.algo_data["k_r"]))
         self.le12.setText(str(globals.algo_data["k_x"]))
+        self.le_starts.setText(str(globals.algo_data["n_starts"]))
         self.len_gen.setText(str(globals.algo_data["n_gen"]))
         self.lepop.setText(str(globals.algo_data["pop"]))
         self.len_r.setText(str(globals.algo_data["n_r"]))
         self.len_e.setText(str(globals.algo_data["n_e"]))
         self.lec_f.setText(str(globals.algo_data["c_f"]))
+        self.len_workers.setText(str(globals.algo_data["n_workers"]))
+        self.lecache_size.setText(str(globals.algo_data["cache_size"]))
+        self.lecache_tol.setText(str(globals.algo_data["cache_tol"]))
+        self.le_time.setText(str(globals.algo_data["max_time"]))
+        self.le_evals.setText(str(globals.algo_data["max_evals"]))
     
     # Update the screen if the algorithm changes
     def update_algo(self):
@@ -694,6 +964,8 @@ class Window(QtWidgets.QMainWindow):
                 self.le11.hide()
                 self.label12.setVisible(0)
                 self.le12.hide()
+                self.label_starts.setVisible(0)
+                self.le_starts.hide()
                 
                 self.labeln_gen.setVisible(1)
                 self.labelpop.setVisible(1)
@@ -705,11 +977,22 @@ class Window(QtWidgets.QMainWindow):
                 self.len_r.show()
                 self.len_e.show()
                 self.lec_f.show()
+                self.labeln_workers.setVisible(1)
+                self.len_workers.show()
+                
+                # The descent cache is only used by the hybrid algorithms
+                hybrid = self.combo_algo.currentText().startswith("Hybrid")
+                self.labelcache_size.setVisible(hybrid)
+                self.lecache_size.setVisible(hybrid)
+                self.labelcache_tol.setVisible(hybrid)
+                self.lecache_tol.setVisible(hybrid)
         else:
                 self.label11.setVisible(1)
                 self.le11.show()
                 self.label12.setVisible(1)
                 self.le12.show()
+                self.label_starts.setVisible(1)
+                self.le_starts.show()
                 
                 self.labeln_gen.setVisible(0)
                 self.labelpop.setVisible(0)
@@ -721,6 +1004,12 @@ class Window(QtWidgets.QMainWindow):
                 self.len_r.hide()
                 self.len_e.hide()
                 self.lec_f.hide()
+                self.labeln_workers.setVisible(0)
+                self.len_workers.hide()
+                self.labelcache_size.setVisible(0)
+                self.lecache_size.hide()
+                self.labelcache_tol.setVisible(0)
+                self.lecache_tol.hide()
     
     # Update if model combo box changed
     def update_model(self):
@@ -743,6 +1032,7 @@ class Window(QtWidgets.QMainWindow):
             self.combo_algo.addItem("Hybrid GA-NR")
             self.combo_algo.addItem("Hybrid GA-LM")
             self.combo_algo.addItem("Hybrid GA-DNR")
+            self.combo_algo.addItem("Race")
             self.label18.setVisible(1)
             self.label19.setVisible(1)
             self.leXr2.show()
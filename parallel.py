@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Parallel Evaluation Module
+"""
+import os
+import concurrent.futures
+import numpy as np
+from common_calcs import calc_pqt_batch
+import instrument
+
+"""
+GET_EXECUTOR - Creates the executor used to evaluate population members
+               concurrently
+
+Usage: get_executor (n_workers, kind)
+
+Where   n_workers is the number of worker processes (or threads)
+        kind is "process" (default) or "thread"
+
+Returns: a concurrent.futures executor, or None for serial evaluation
+         (n_workers <= 1)
+"""
+def get_executor(n_workers, kind="process"):
+
+    if (n_workers is None) or (n_workers <= 1):
+        return None
+
+    if kind == "process":
+        return concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+
+    if kind == "thread":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+
+    raise ValueError("Unknown executor type: %s" % kind)
+
+"""
+MAP_MEMBERS - Evaluates fn(*args) for every tuple in a list of arguments,
+              concurrently on the executor (or serially if it is None)
+
+Usage: map_members (executor, fn, args)
+
+Where   fn must be a module-level function (so that it can be sent to
+           worker processes)
+
+Returns: list of results, in the same order as args
+"""
+def map_members(executor, fn, args):
+
+    if executor is None:
+        return [fn(*a) for a in args]
+
+    # Send several members to a worker process at a time
+    chunksize = max(1, len(args) // (4 * (os.cpu_count() or 1)))
+
+    stats = instrument.current()
+    if stats is None:
+        return list(executor.map(fn, *zip(*args), chunksize=chunksize))
+
+    # Collect the instrumentation stats of the workers too (worker threads
+    # don't share the stats of this one)
+    results = list(executor.map(instrument.collected, [fn] * len(args), *zip(*args), chunksize=chunksize))
+    for [r, s] in results:
+        stats.merge(s)
+
+    return [r for [r, s] in results]
+
+"""
+BATCH_ERR - Squared errors of a population of double cage parameter vectors
+            (as per calc_pqt_batch), split into row blocks that are evaluated
+            concurrently on the executor (or in one block if it is None)
+
+Usage: batch_err (executor, sf, x, pqt)
+
+Returns: vector of squared errors, one per row of x
+"""
+def batch_err(executor, sf, x, pqt):
+
+    if executor is None:
+        return calc_pqt_batch(sf, x, pqt)[1]
+
+    blocks = np.array_split(x, min(x.shape[0], os.cpu_count() or 1))
+    results = map_members(executor, calc_pqt_batch, [(sf, b, pqt) for b in blocks])
+
+    return np.concatenate([r[1] for r in results])
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Solver Race
+
+Runs several algorithms (by default the Newton-Raphson, Levenberg-Marquardt
+and damped Newton-Raphson solvers, optionally a hybrid algorithm) at the
+same time on a motor, in worker processes, and returns the first result that
+converges. The other solvers are cancelled at their next step (or member):
+they check a shared event from their trace and progress callbacks. The trace
+records of the solvers can be sent back to a trace callback of the race.
+
+Usage: python -m race [-m MODEL] [--hybrid ALGO] [--seed SEED] PATH [PATH ...]
+"""
+import sys, time, queue, argparse
+import multiprocessing
+import concurrent.futures
+from collections import namedtuple
+import numpy as np
+from estimate import DESCENT, estimate
+
+# Algorithms raced by default
+RACE_ALGORITHMS = DESCENT
+
+# Time between checks for cancellation of the race (s)
+POLL_INTERVAL = 0.05
+
+"""
+RACERESULT - Result of a race
+
+Fields: z, iter, err, conv as returned by the winning solver
+        winner is the algorithm that converged first (or, if none converged,
+          the algorithm with the lowest squared error)
+        entries (algorithm : RaceEntry) of every solver raced
+"""
+RaceResult = namedtuple("RaceResult", ["z", "iter", "err", "conv", "winner", "entries"])
+
+"""
+RACEENTRY - Outcome of one solver of a race
+
+Fields: result is z, iter, err, conv as returned by the solver (None if it
+          was cancelled or failed)
+        time is the run time of the solver (s)
+        error is "cancelled", the error message of a failed solver or None
+"""
+RaceEntry = namedtuple("RaceEntry", ["result", "time", "error"])
+
+class Cancelled(Exception):
+    pass
+
+# Event set to cancel the solvers of a race, and queue of the trace records
+# sent back (in the worker processes)
+_cancel = None
+_records = None
+
+def _init_worker(event, records):
+    global _cancel, _records
+    _cancel = event
+    _records = records
+
+# Run one solver of a race (in a worker process), returns the algorithm and
+# its RaceEntry (the trace records are sent back if traced is true)
+def _run_solver(model, algo, motor, settings, seed, traced=False):
+
+    def progress(gen, member, err):
+        return _cancel.is_set()
+
+    def trace(record):
+        if _cancel.is_set():
+            raise Cancelled()
+        if traced:
+            _records.put(record)
+
+    t = time.perf_counter()
+    try:
+        r = estimate(model, algo, motor, settings, progress, None, seed, trace=trace)
+    except Cancelled:
+        return algo, RaceEntry(None, time.perf_counter() - t, "cancelled")
+    except (ArithmeticError, ValueError, np.linalg.LinAlgError) as e:
+        return algo, RaceEntry(None, time.perf_counter() - t, str(e) or type(e).__name__)
+
+    return algo, RaceEntry(tuple(r), time.perf_counter() - t, None)
+
+"""
+SOLVERRACE - Races solvers on motors, keeping the worker processes between
+             races
+
+Usage: race = SolverRace (algos, n_workers)
+
+Where   algos is the list of algorithms raced on double cage motors (default
+          RACE_ALGORITHMS, single cage motors only have Newton-Raphson)
+        n_workers is the number of worker processes (default one per
+          algorithm)
+
+Motors are raced with race.run(model, motor, settings, seed, cancelled),
+which returns a RaceResult. The worker processes are started on the first
+race and stopped by race.shutdown() (or at the end of a with block).
+"""
+class SolverRace:
+
+    def __init__(self, algos=None, n_workers=None):
+        self.algos = list(algos or RACE_ALGORITHMS)
+        self.n_workers = n_workers or len(self.algos)
+        self.event = multiprocessing.Event()
+        self.records = multiprocessing.Queue()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.event.set()
+            self.pool.shutdown()
+            self.pool = None
+
+    """
+    RUN - Races the solvers on a motor
+
+    Usage: race.run (model, motor, settings, seed, cancelled, trace)
+
+    Where   model, motor, settings and seed are as per estimate.estimate
+            cancelled is an optional function returning True to cancel the
+              race (the best result so far is returned)
+            trace is an optional callback, called (in this process) with the
+              solvertrace.TraceRecord of every solver raced, as they are sent
+              back between checks for cancellation
+
+    Raises ValueError if every solver failed.
+
+    Returns: RaceResult
+    """
+    def run(self, model, motor, settings, seed=None, cancelled=None, trace=None):
+
+        algos = self.algos if model == "Double cage" else ["Newton-Raphson"]
+
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker, initargs=(self.event, self.records))
+
+        # (records of a previous race still on their way are dropped)
+        self.forward(None)
+        self.event.clear()
+        futures = [self.pool.submit(_run_solver, model, algo, motor, settings, seed, trace is not None) for algo in algos]
+        pending = set(futures)
+        entries = {}
+        winner = None
+
+        try:
+            while pending and (winner is None):
+                [done, pending] = concurrent.futures.wait(pending, timeout=POLL_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+                self.forward(trace)
+
+                # In the order of the algorithms, if several finished together
+                for f in [f for f in futures if f in done]:
+                    [algo, entry] = f.result()
+                    entries[algo] = entry
+                    if (winner is None) and (entry.result is not None) and (entry.result[3] == 1):
+                        winner = algo
+
+                if (cancelled is not None) and cancelled():
+                    break
+        finally:
+            # Cancel the other solvers and wait for them to stop
+            self.event.set()
+            for f in pending:
+                [algo, entry] = f.result()
+                entries[algo] = entry
+            self.forward(trace)
+
+        if winner is None:
+            finished = [algo for algo in algos if (algo in entries) and (entries[algo].result is not None)]
+            if not finished:
+                raise ValueError("All solvers failed: %s" % "; ".join("%s: %s" % (algo, entries[algo].error) for algo in algos if algo in entries))
+
+            winner = min(finished, key=lambda algo: entries[algo].result[2])
+
+        [z, iter, err, conv] = entries[winner].result
+
+        return RaceResult(z, iter, err, conv, winner, {algo : entries[algo] for algo in algos if algo in entries})
+
+    # Pass the trace records sent back by the solvers so far to trace (or
+    # drop them if trace is None)
+    def forward(self, trace):
+        while True:
+            try:
+                record = self.records.get_nowait()
+            except queue.Empty:
+                return
+
+            if trace is not None:
+                trace(record)
+
+"""
+RACE - Races solvers on a motor (in new worker processes)
+
+Usage: race (model, motor, settings, algos, seed)
+
+Where   the arguments are as per SolverRace and SolverRace.run
+
+Returns: RaceResult
+"""
+def race(model, motor, settings, algos=None, seed=None):
+
+    with SolverRace(algos) as r:
+        return r.run(model, motor, settings, seed)
+
+def main(argv=None):
+    import saveload
+    from config import MotorData, AlgoSettings
+    from batch import ALGO_NAMES, MODEL_NAMES, find_files
+
+    parser = argparse.ArgumentParser(prog="python -m race", description="Race the descent solvers (and optionally a hybrid algorithm) on a set of motors")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help=".mto file, directory of .mto files or glob pattern")
+    parser.add_argument("-m", "--model", choices=sorted(MODEL_NAMES), default="double", help="motor model (default double)")
+    parser.add_argument("--hybrid", choices=sorted(a for a in ALGO_NAMES if a.startswith("hy-")), default=None, help="also race a hybrid algorithm")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the hybrid algorithm")
+    args = parser.parse_args(argv)
+
+    files = find_files(args.paths)
+    if not files:
+        print("No .mto files found", file=sys.stderr)
+        return 1
+
+    algos = RACE_ALGORITHMS + ([ALGO_NAMES[args.hybrid]] if args.hybrid else [])
+
+    with SolverRace(algos) as r:
+        for filename in files:
+            [motor_data, algo_data] = saveload.read_file(filename)
+
+            t = time.perf_counter()
+            try:
+                result = r.run(MODEL_NAMES[args.model], MotorData.from_dict(motor_data), AlgoSettings.from_dict(algo_data), args.seed)
+            except ValueError as e:
+                print("%s: %s" % (filename, e))
+                continue
+            t = time.perf_counter() - t
+
+            print("%s: %s, err = %g, iter = %d, conv = %d (%.3f s)" % (filename, result.winner, result.err, result.iter, result.conv, t))
+            for [algo, entry] in result.entries.items():
+                outcome = entry.error or "err = %g, iter = %d, conv = %d" % (entry.result[2], entry.result[1], entry.result[3])
+                print("    %-24s %s (%.3f s)" % (algo, outcome, entry.time))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Persistent Result Cache
+
+Estimation results (z, iter, err, conv) are stored in a local SQLite
+database, keyed by a hash of the motor data, model, algorithm, settings and
+random seed, so that repeated estimations return straight away. Entries are
+evicted by age and, beyond the maximum number of entries, least recently used
+first.
+"""
+import os, time, json, hashlib, sqlite3
+from contextlib import closing
+import numpy as np
+from config import motor_record, algo_record
+from warmstart import warm_estimate
+
+# Default location of the cache (per user)
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".moto", "results.sqlite")
+
+# Version of the results, included in the keys (change to invalidate the
+# cached results when the solvers change)
+VERSION = 1
+
+# Settings that don't affect the results
+IGNORED_SETTINGS = ["n_workers"]
+
+# Stochastic algorithms (results depend on the seed)
+STOCHASTIC = ["Genetic Algorithm", "Hybrid GA-NR", "Hybrid GA-LM", "Hybrid GA-DNR"]
+
+"""
+RESULTCACHE - Persistent cache of estimation results
+
+Usage: cache = ResultCache (path, max_entries, max_age)
+
+Where   path is the SQLite database file (created if needed)
+        max_entries is the maximum number of results kept (None for no limit)
+        max_age is the maximum age of results in seconds (None for no limit)
+
+Results are looked up with cache.get(key), which returns (z, iter, err,
+conv) or None, and stored with cache.put(key, result), using the keys from
+cache.key(model, algo, motor, settings, seed). The number of lookups found
+and not found are counted in cache.hits and cache.misses. Database errors
+are not raised (results are just not cached).
+"""
+class ResultCache:
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=100000, max_age=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            with closing(self.connect()) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, z BLOB, iter INTEGER, err REAL, conv INTEGER, created REAL, accessed REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+                conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+        except (OSError, sqlite3.Error):
+            self.path = None
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Key of an estimation: hash of the motor data, model, algorithm, settings
+    # and seed
+    def key(self, model, algo, motor, settings, seed=None):
+        settings = algo_record(settings).as_dict()
+        for name in IGNORED_SETTINGS:
+            settings.pop(name, None)
+
+        data = [VERSION, model, algo, motor_record(motor).as_dict(), settings, seed]
+
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        r = None
+
+        if self.path is not None:
+            try:
+                with closing(self.connect()) as conn, conn:
+                    row = conn.execute("SELECT z, iter, err, conv, created FROM results WHERE key = ?", (key,)).fetchone()
+
+                    if (row is not None) and ((self.max_age is None) or (time.time() - row[4] <= self.max_age)):
+                        r = (np.frombuffer(row[0], dtype=float).copy(), row[1], row[2], row[3])
+                        conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error:
+                r = None
+
+        if r is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return r
+
+    def put(self, key, result):
+        if self.path is None:
+            return
+
+        [z, iter, err, conv] = result
+        t = time.time()
+
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", (key, np.asarray(z, dtype=float).tobytes(), int(iter), float(err), int(conv), t, t))
+                self.evict(conn)
+        except sqlite3.Error:
+            pass
+
+    # Remove results older than max_age, then the least recently used results
+    # beyond max_entries (only when there are too many, the oldest are found
+    # from the index without sorting the table)
+    def evict(self, conn):
+        if self.max_age is not None:
+            conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,))
+
+        if self.max_entries is not None:
+            n = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if n > self.max_entries:
+                conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)", (n - self.max_entries,))
+
+    def __len__(self):
+        if self.path is None:
+            return 0
+
+        with closing(self.connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        if self.path is not None:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("DELETE FROM results")
+
+        self.hits = 0
+        self.misses = 0
+
+"""
+CACHED_ESTIMATE - Estimates the equivalent circuit parameters of a motor (as
+                  per estimate.estimate), returning the cached result if
+                  there is one
+
+Usage: cached_estimate (cache, model, algo, motor, settings, progress, executor, seed, warm, trace)
+
+Where   cache is a ResultCache (or None to always estimate)
+        warm is an optional warmstart.WarmStartIndex used when the result is
+          not cached (see warmstart.warm_estimate)
+        the other arguments are as per estimate.estimate
+
+Results of cancelled runs are not stored, nor results that did not converge
+of genetic and hybrid runs without a seed, of runs with a budget (max_time
+or max_evals) or of warm started runs, so that running them again gives a
+new try (the keys don't include the budget used or the initial estimates
+from the warm start index).
+
+Returns: z, iter, err, conv as returned by the solver
+         hit is a true/false flag indicating the result was cached
+"""
+def cached_estimate(cache, model, algo, motor, settings, progress=None, executor=None, seed=None, warm=None, trace=None):
+
+    if cache is None:
+        return tuple(warm_estimate(warm, model, algo, motor, settings, progress, executor, seed, trace=trace)) + (False,)
+
+    key = cache.key(model, algo, motor, settings, seed)
+    r = cache.get(key)
+
+    if r is not None:
+        return r + (True,)
+
+    # Keep track of cancellation
+    cancelled = []
+
+    def report(gen, member, err):
+        if (progress is not None) and progress(gen, member, err):
+            cancelled.append(True)
+            return True
+        return False
+
+    r = tuple(warm_estimate(warm, model, algo, motor, settings, report, executor, seed, trace=trace))
+
+    s = algo_record(settings)
+    repeatable = ((seed is not None) or (algo not in STOCHASTIC)) and (s.max_time <= 0) and (s.max_evals <= 0) and (warm is None)
+
+    if not cancelled and (repeatable or (r[3] == 1)):
+        cache.put(key, r)
+
+    return r + (False,)
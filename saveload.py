@@ -11,46 +11,71 @@ Last edited: January 2014
 """
 import os, sys
 import globals
+from config import MOTOR_DEFAULTS
 
 # Load motor data from save file and put data into globals object
 def load_file(filename):
-    i = 1
-    for line in open(filename):
-        [key, item] = line.split(";")
-        
-        if i <= 8:
+    [motor_data, algo_data] = read_file(filename)
+    
+    globals.motor_data.update(motor_data)
+    globals.algo_data.update(algo_data)
+
+# Read motor data and algorithm settings from save file (without touching the
+# globals object), returns motor_data and algo_data dictionaries
+def read_file(filename):
+    motor_data = {}
+    algo_data = {}
+    motor_keys = [key for [key, value] in MOTOR_DEFAULTS]
+    
+    with open(filename) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            
+            [key, item] = line.strip().split(";", 1)
+            
+            # Motor data and algorithm settings are told apart by key
             if key == "description":
-                globals.motor_data[key] = str(item)
+                motor_data[key] = str(item)
+            elif key in motor_keys:
+                motor_data[key] = float(item)
+            elif (key == "max_iter") or (key == "n_gen") or (key == "pop") or (key == "n_r") or (key == "n_e") or (key == "n_starts") or (key == "n_workers") or (key == "cache_size") or (key == "max_evals"):
+                algo_data[key] = int(item)
             else:
-                globals.motor_data[key] = float(item)
-        else:
-            if (key == "max_iter") or (key == "n_gen") or (key == "pop") or (key == "n_r") or (key == "n_e"):
-                globals.algo_data[key] = int(item)
-            else:
-                globals.algo_data[key] = float(item)
-        
-        i = i + 1
+                algo_data[key] = float(item)
+    
+    return motor_data, algo_data
 
 def save_file(filename):
-    f = open(filename[0], "w")
+    write_file(filename[0], globals.motor_data, globals.algo_data)
+
+# Write motor data and algorithm settings dictionaries to a save file
+def write_file(filename, motor_data, algo_data):
+    f = open(filename, "w")
     
-    f.write("description;%s\n" % globals.motor_data["description"])
-    f.write("sync_speed;%f\n" % globals.motor_data["sync_speed"])
-    f.write("rated_speed;%f\n" % globals.motor_data["rated_speed"])
-    f.write("rated_pf;%f\n" % globals.motor_data["rated_pf"])
-    f.write("rated_eff;%f\n" % globals.motor_data["rated_eff"])
-    f.write("T_b;%f\n" % globals.motor_data["T_b"])
-    f.write("T_lr;%f\n" % globals.motor_data["T_lr"])
-    f.write("I_lr;%f\n" % globals.motor_data["I_lr"])
+    f.write("description;%s\n" % motor_data["description"])
+    f.write("sync_speed;%f\n" % motor_data["sync_speed"])
+    f.write("rated_speed;%f\n" % motor_data["rated_speed"])
+    f.write("rated_pf;%f\n" % motor_data["rated_pf"])
+    f.write("rated_eff;%f\n" % motor_data["rated_eff"])
+    f.write("T_b;%f\n" % motor_data["T_b"])
+    f.write("T_lr;%f\n" % motor_data["T_lr"])
+    f.write("I_lr;%f\n" % motor_data["I_lr"])
     
-    f.write("max_iter;%d\n" % globals.algo_data["max_iter"])
-    f.write("k_r;%f\n" % globals.algo_data["k_r"])
-    f.write("k_x;%f\n" % globals.algo_data["k_x"])
-    f.write("conv_err;%f\n" % globals.algo_data["conv_err"])
-    f.write("n_gen;%d\n" % globals.algo_data["n_gen"])
-    f.write("pop;%d\n" % globals.algo_data["pop"])
-    f.write("n_r;%d\n" % globals.algo_data["n_r"])
-    f.write("n_e;%d\n" % globals.algo_data["n_e"])
-    f.write("c_f;%f\n" % globals.algo_data["c_f"])
+    f.write("max_iter;%d\n" % algo_data["max_iter"])
+    f.write("k_r;%f\n" % algo_data["k_r"])
+    f.write("k_x;%f\n" % algo_data["k_x"])
+    f.write("conv_err;%f\n" % algo_data["conv_err"])
+    f.write("n_gen;%d\n" % algo_data["n_gen"])
+    f.write("pop;%d\n" % algo_data["pop"])
+    f.write("n_r;%d\n" % algo_data["n_r"])
+    f.write("n_e;%d\n" % algo_data["n_e"])
+    f.write("c_f;%f\n" % algo_data["c_f"])
+    f.write("n_starts;%d\n" % algo_data["n_starts"])
+    f.write("n_workers;%d\n" % algo_data["n_workers"])
+    f.write("cache_size;%d\n" % algo_data["cache_size"])
+    f.write("cache_tol;%g\n" % algo_data["cache_tol"])
+    f.write("max_time;%f\n" % algo_data["max_time"])
+    f.write("max_evals;%d\n" % algo_data["max_evals"])
     
     f.close()
\ No newline at end of file
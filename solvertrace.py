@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Solver Traces
+
+The solvers (nr_solver, lm_solver, dnr_solver, nr_solver_sc, ga_solver and
+hy_solver) take an optional trace callback, called with a TraceRecord for
+every trial step of the descent algorithms and every generation of the
+genetic and hybrid algorithms. A run stopped early (on a singular Jacobian
+matrix, a stalled step, an exhausted budget or when cancelled) ends with a
+stop record giving the reason. TraceRecorder keeps the last records in a
+ring buffer and dumps them to an NPZ file.
+
+Usage: python -m solvertrace FILE.mto [-a ALGO] [-m MODEL] [-o TRACE.npz]
+       python -m solvertrace --show TRACE.npz
+"""
+import sys, argparse
+from collections import namedtuple
+import numpy as np
+
+# Solver names of the records
+SOLVERS = ["NR", "LM", "DNR", "NR-SC", "GA", "HY"]
+
+# Reasons of the stop records ("" for the other records)
+STOP_REASONS = ["", "singular", "not finite", "stalled", "budget", "cancelled"]
+
+"""
+TRACERECORD - One trial step (descent algorithms) or generation (genetic and
+              hybrid algorithms) of a solver
+
+Fields: solver (one of SOLVERS)
+        iter is the iteration (number of accepted steps so far) or generation
+        err is the squared error of the trial point, or of the best member
+        hn, lambda_i are the step scale and damping for the next step (NaN
+          where the solver doesn't use them)
+        accepted is a true/false flag indicating the trial step was accepted
+          (always true for generations)
+        z is the trial point, or the best member
+        err_best, err_mean, err_worst are the best, mean and worst squared
+          errors of the population's solved members (NaN for the descent
+          algorithms)
+        reason is why the run stopped early (one of STOP_REASONS), for the
+          stop record at the end of the run ("" for the other records)
+"""
+TraceRecord = namedtuple("TraceRecord", ["solver", "iter", "err", "hn", "lambda_i", "accepted", "z", "err_best", "err_mean", "err_worst", "reason"])
+
+"""
+STEP_RECORD / GENERATION_RECORD / STOP_RECORD - Trace records of a descent
+                                                step, of a population and of
+                                                a run stopped early
+
+Usage: step_record (solver, iter, err, hn, lambda_i, accepted, z)
+       generation_record (solver, gen, x, err)
+       stop_record (solver, iter, err, z, reason)
+
+Where   x is the population (one member per row) and err the squared errors
+        of the members (members not solved are NaN or inf)
+        for stop_record, err and z are the best solution so far and reason
+          is one of STOP_REASONS (the record is not accepted)
+"""
+def step_record(solver, iter, err, hn, lambda_i, accepted, z):
+
+    return TraceRecord(solver, iter, err, hn, lambda_i, accepted, np.array(z, dtype=float), np.nan, np.nan, np.nan, "")
+
+def generation_record(solver, gen, x, err):
+
+    e = np.where(np.isfinite(err), err, np.nan)
+    if np.all(np.isnan(e)):
+        return TraceRecord(solver, gen, np.inf, np.nan, np.nan, True, np.full(x.shape[1], np.nan), np.nan, np.nan, np.nan, "")
+
+    i = np.nanargmin(e)
+
+    return TraceRecord(solver, gen, e[i], np.nan, np.nan, True, np.array(x[i,:], dtype=float), e[i], np.nanmean(e), np.nanmax(e), "")
+
+def stop_record(solver, iter, err, z, reason):
+
+    return TraceRecord(solver, iter, err, np.nan, np.nan, False, np.array(z, dtype=float), np.nan, np.nan, np.nan, reason)
+
+"""
+TRACERECORDER - Ring buffer of trace records (a trace callback)
+
+Usage: recorder = TraceRecorder (capacity, n)
+
+Where   capacity is the number of records kept (the oldest are overwritten)
+        n is the length of z stored (shorter z are padded with NaN)
+
+The recorder is passed as the trace argument of the solvers. The records
+kept are recorder.records() (oldest first), or recorder.arrays() as a
+dictionary of arrays, and are written to an NPZ file with
+recorder.dump(filename) and read back with load(filename). The number of
+records overwritten is recorder.dropped.
+"""
+class TraceRecorder:
+
+    def __init__(self, capacity=10000, n=8):
+        self.capacity = capacity
+        self.solver = np.zeros(capacity, dtype=np.int8)
+        self.iter = np.zeros(capacity, dtype=np.int32)
+        self.err = np.zeros(capacity)
+        self.hn = np.zeros(capacity)
+        self.lambda_i = np.zeros(capacity)
+        self.accepted = np.zeros(capacity, dtype=bool)
+        self.z = np.zeros((capacity, n))
+        self.err_best = np.zeros(capacity)
+        self.err_mean = np.zeros(capacity)
+        self.err_worst = np.zeros(capacity)
+        self.reason = np.zeros(capacity, dtype=np.int8)
+        self.clear()
+
+    def __call__(self, record):
+        i = self.count % self.capacity
+        z = record.z[0:self.z.shape[1]]
+
+        self.solver[i] = SOLVERS.index(record.solver)
+        self.iter[i] = record.iter
+        self.err[i] = record.err
+        self.hn[i] = record.hn
+        self.lambda_i[i] = record.lambda_i
+        self.accepted[i] = record.accepted
+        self.z[i,0:len(z)] = z
+        self.z[i,len(z):] = np.nan
+        self.err_best[i] = record.err_best
+        self.err_mean[i] = record.err_mean
+        self.err_worst[i] = record.err_worst
+        self.reason[i] = STOP_REASONS.index(record.reason)
+
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def dropped(self):
+        return max(0, self.count - self.capacity)
+
+    def clear(self):
+        self.count = 0
+
+    # Dictionary of the arrays of the records kept, oldest first
+    def arrays(self):
+        index = np.arange(self.count - len(self), self.count) % self.capacity
+
+        return {name : getattr(self, name)[index] for name in TraceRecord._fields}
+
+    def records(self):
+        a = self.arrays()
+
+        return [TraceRecord(SOLVERS[a["solver"][i]], int(a["iter"][i]), a["err"][i], a["hn"][i], a["lambda_i"][i], bool(a["accepted"][i]), a["z"][i], a["err_best"][i], a["err_mean"][i], a["err_worst"][i], STOP_REASONS[a["reason"][i]]) for i in range(len(self))]
+
+    def dump(self, filename):
+        np.savez_compressed(filename, solvers=np.array(SOLVERS), reasons=np.array(STOP_REASONS), dropped=self.dropped, **self.arrays())
+
+"""
+LOAD - Reads a trace dumped by TraceRecorder.dump
+
+Traces dumped before stop records were added have no stop reasons.
+
+Returns: list of TraceRecord (oldest first)
+"""
+def load(filename):
+
+    with np.load(filename) as data:
+        solvers = [str(s) for s in data["solvers"]]
+        a = {name : data[name] for name in TraceRecord._fields if name in data}
+
+        if "reasons" in data:
+            reasons = [str(s) for s in data["reasons"]]
+        else:
+            reasons = [""]
+            a["reason"] = np.zeros(len(a["iter"]), dtype=np.int8)
+
+    return [TraceRecord(solvers[a["solver"][i]], int(a["iter"][i]), a["err"][i], a["hn"][i], a["lambda_i"][i], bool(a["accepted"][i]), a["z"][i], a["err_best"][i], a["err_mean"][i], a["err_worst"][i], reasons[a["reason"][i]]) for i in range(len(a["iter"]))]
+
+# Print a trace as a table
+def show(records, f=sys.stdout):
+    print("%-6s %5s %12s %10s %10s %3s %12s %12s  %s" % ("solver", "iter", "err", "hn", "lambda", "acc", "err_mean", "err_worst", "stop"), file=f)
+
+    for r in records:
+        print("%-6s %5d %12.4e %10.3g %10.3g %3s %12.4e %12.4e  %s" % (r.solver, r.iter, r.err, r.hn, r.lambda_i, "yes" if r.accepted else "no", r.err_mean, r.err_worst, r.reason), file=f)
+
+def main(argv=None):
+    # Imported here, the solvers import this module
+    import saveload
+    from estimate import estimate
+    from config import MotorData, AlgoSettings
+    from batch import ALGO_NAMES, MODEL_NAMES
+
+    parser = argparse.ArgumentParser(prog="python -m solvertrace", description="Trace the iterations of a solver on a motor")
+    parser.add_argument("file", nargs="?", metavar="FILE.mto", help="motor to estimate")
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGO_NAMES), default="nr", help="algorithm (default nr)")
+    parser.add_argument("-m", "--model", choices=sorted(MODEL_NAMES), default="double", help="motor model (default double)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the genetic and hybrid algorithms")
+    parser.add_argument("-o", "--output", default=None, metavar="TRACE.npz", help="write the trace to an NPZ file (default print it)")
+    parser.add_argument("--show", default=None, metavar="TRACE.npz", help="print a trace written before")
+    args = parser.parse_args(argv)
+
+    if args.show is not None:
+        show(load(args.show))
+        return 0
+
+    if args.file is None:
+        parser.error("a motor file or --show is required")
+
+    [motor_data, algo_data] = saveload.read_file(args.file)
+    recorder = TraceRecorder()
+    [z, iter, err, conv] = estimate(MODEL_NAMES[args.model], ALGO_NAMES[args.algorithm], MotorData.from_dict(motor_data), AlgoSettings.from_dict(algo_data), seed=args.seed, trace=recorder)
+
+    if args.output is None:
+        show(recorder.records())
+    else:
+        recorder.dump(args.output)
+
+    print("err = %g, iter = %d, conv = %d (%d records)" % (err, iter, conv, len(recorder)), file=sys.stderr)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
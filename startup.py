@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Startup Benchmark
+
+Measures the cold start time of the GUI (importing the main window module
+and constructing and showing the main window, in a fresh Python process),
+checks it against a time budget, and checks that the modules only needed
+later (matplotlib, the genetic and hybrid solvers, the process pool, and
+the result cache and warm start index) are not loaded at startup.
+
+Usage: python -m startup [--budget SECONDS] [--repeats N] [--module MODULE]
+                         [--no-window] [--profile N]
+
+The window is shown offscreen unless QT_QPA_PLATFORM is set.
+
+The exit status is 1 if the startup time is over budget or a lazy module
+was imported.
+"""
+import os, sys, json, subprocess, argparse
+
+# Default cold start time budget (s)
+BUDGET = 1.5
+
+# Modules that must not be imported before the main window shows
+LAZY_MODULES = ["matplotlib", "dateutil", "pyparsing", "genetic", "hybrid", "parallel", "convplot", "concurrent.futures.process", "resultcache", "warmstart", "sqlite3"]
+
+# Program run in a fresh process: imports the module (and, if window is True,
+# constructs and shows its main window), then prints the times taken and the
+# lazy modules imported
+PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import %(module)s
+t_import = time.perf_counter() - t
+t_window = 0.0
+if %(window)r:
+    from PySide6 import QtWidgets
+    t = time.perf_counter()
+    app = QtWidgets.QApplication(sys.argv[0:1])
+    w = %(module)s.Window()
+    w.show()
+    app.processEvents()
+    t_window = time.perf_counter() - t
+print(json.dumps({"import" : t_import, "window" : t_window, "loaded" : [m for m in %(lazy)r if m in sys.modules]}))
+"""
+
+"""
+MEASURE_STARTUP - Measures the time to import a module (and show its main
+                  window) in fresh processes
+
+Usage: measure_startup (module, repeats, window)
+
+Where   module is the module imported (default main, the GUI)
+        repeats is the number of processes run
+        window is a true/false flag to also construct and show the module's
+          Window (default True for main only)
+
+Returns: dictionary of the results (total times of each run, time_min,
+         time_median, the median import_time and window_time, and the lazy
+         modules imported)
+"""
+def measure_startup(module="main", repeats=5, window=None):
+
+    if window is None:
+        window = (module == "main")
+
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    times = []
+    import_times = []
+    window_times = []
+    loaded = set()
+
+    for i in range(repeats):
+        probe = PROBE % {"module" : module, "window" : bool(window), "lazy" : LAZY_MODULES}
+        out = subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError("Cannot start %s: %s" % (module, out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "exit status %d" % out.returncode))
+
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(r["import"] + r["window"])
+        import_times.append(r["import"])
+        window_times.append(r["window"])
+        loaded.update(r["loaded"])
+
+    times.sort()
+    import_times.sort()
+    window_times.sort()
+
+    return {
+        "module" : module,
+        "window" : bool(window),
+        "times" : times,
+        "time_min" : times[0],
+        "time_median" : times[len(times) // 2],
+        "import_time" : import_times[len(times) // 2],
+        "window_time" : window_times[len(times) // 2],
+        "loaded" : sorted(loaded)
+        }
+
+"""
+PROFILE_IMPORTS - Lists the slowest imports of a module (python -X importtime)
+
+Usage: profile_imports (module, n)
+
+Returns: list of the n (cumulative time in s, module name) pairs with the
+         largest cumulative import times
+"""
+def profile_imports(module="main", n=15):
+
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    imports = []
+
+    for line in out.stderr.splitlines():
+        fields = line.split("|")
+        if (len(fields) == 3) and fields[1].strip().isdigit():
+            imports.append((int(fields[1]) * 1e-6, fields[2].rstrip()))
+
+    imports.sort(reverse=True)
+
+    return imports[0:n]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m startup", description="Measure the cold start time of Moto against a time budget")
+    parser.add_argument("--budget", type=float, default=BUDGET, help="startup time budget in seconds (default %g)" % BUDGET)
+    parser.add_argument("--repeats", type=int, default=5, help="fresh processes measured (default 5)")
+    parser.add_argument("--module", default="main", help="module imported (default main, the GUI)")
+    parser.add_argument("--no-window", action="store_true", help="only time the import (by default the main window of main is also constructed and shown)")
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="also list the N slowest imports")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        r = measure_startup(args.module, args.repeats, False if args.no_window else None)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    r["budget"] = args.budget
+
+    if args.json:
+        print(json.dumps(r, indent=2))
+    else:
+        print("start %s: %.3f s (min), %.3f s (median) of %d runs, budget %.3f s" % (args.module, r["time_min"], r["time_median"], args.repeats, args.budget))
+        if r["window"]:
+            print("    import %.3f s, window %.3f s (median)" % (r["import_time"], r["window_time"]))
+
+    if args.profile > 0:
+        for [t, name] in profile_imports(args.module, args.profile):
+            print("%8.3f s  %s" % (t, name))
+
+    failed = False
+    # The minimum is the least affected by other load on the machine
+    if r["time_min"] > args.budget:
+        print("Startup over budget: %.3f s > %.3f s" % (r["time_min"], args.budget), file=sys.stderr)
+        failed = True
+    if r["loaded"]:
+        print("Modules imported at startup that should be lazy: %s" % ", ".join(r["loaded"]), file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Synthetic Motors
+
+Generates test motors with known equivalent circuit parameters: plausible
+double cage or single cage parameter vectors z are sampled, and their
+nameplate data (full-load slip, efficiency, power factor, breakdown and
+locked rotor torque, locked rotor current) is computed with the same
+calculations as the solvers. The motors are written as .mto files or as a
+CSV fleet (see fleet.py), along with the true parameters, and the recovery
+report scores the algorithms on them.
+
+Usage: python -m synthetic generate N -o OUTPUT [-m MODEL] [--seed SEED]
+       python -m synthetic report [--sizes N,N,...] [-a ALGO ...] [-m MODEL]
+                                  [--seed SEED] [--workers N] [-o REPORT]
+
+Where OUTPUT is a directory (.mto files and truth.csv) or a .csv file (a
+fleet, with the true parameters in the true_* columns)
+"""
+import os, sys, csv, json, time, argparse
+import numpy as np
+import saveload
+import parallel
+from common_calcs import calc_pqt, calc_pqt_sc, get_torque_sc
+from estimate import PARAMS, estimate
+from config import AlgoSettings
+from batch import ALGO_NAMES, MODEL_NAMES
+from fleet import MOTOR_FIELDS
+
+# Ranges of the sampled parameters (log-uniform, per-unit before scaling to
+# the rated current), around the solutions of the library motors. Rs and
+# Xr2 (double cage) or Xr1 (single cage) follow from the k_r and k_x
+# restrictions of the solvers
+CIRCUIT_RANGES = {
+    "Double cage" : {"Xs" : (0.07, 0.15), "Xm" : (2.0, 4.5), "Rr1" : (0.006, 0.02), "Xr1-Xr2" : (0.03, 0.25), "Rr2/Rr1" : (2.5, 8.0), "Rc" : (20.0, 80.0)},
+    "Single cage" : {"Xs" : (0.1, 0.2), "Xm" : (2.0, 7.5), "Rr1" : (0.005, 0.012), "Rc" : (25.0, 60.0)}
+    }
+
+# Range of the full-load slip (pu, log-uniform)
+SLIP_RANGE = (0.004, 0.02)
+
+# Nameplate data of plausible motors (others are sampled again)
+PLAUSIBLE = {"rated_pf" : (0.7, 0.95), "rated_eff" : (0.85, 0.985), "T_b" : (1.6, 3.5), "T_lr" : (0.4, 2.5), "I_lr" : (4.0, 9.0)}
+
+# Synchronous speeds (rpm, 50Hz 2 to 8 poles)
+SYNC_SPEEDS = [3000.0, 1500.0, 1000.0, 750.0]
+
+# Largest relative parameter error of a recovered motor
+RECOVERY_TOL = 0.01
+
+# Default data set sizes of the recovery report
+SIZES = [10, 100, 1000]
+
+"""
+SAMPLE_CIRCUIT - Samples a random equivalent circuit and full-load slip
+
+Usage: sample_circuit (rng, model, k_r, k_x)
+
+Where   rng is a numpy random generator
+        model is "Single cage" or "Double cage"
+        k_r, k_x are the ratios Rs / Rr1 and Xr2 / Xs (double cage) or
+          Xr1 / Xs (single cage)
+
+Returns: z (not scaled, see nameplate) and sf
+"""
+def sample_circuit(rng, model, k_r, k_x):
+
+    r = {name : np.exp(rng.uniform(np.log(lo), np.log(hi))) for [name, (lo, hi)] in CIRCUIT_RANGES[model].items()}
+    sf = np.exp(rng.uniform(np.log(SLIP_RANGE[0]), np.log(SLIP_RANGE[1])))
+
+    if model == "Double cage":
+        Xr2 = k_x * r["Xs"]
+        z = np.array([k_r * r["Rr1"], r["Xs"], r["Xm"], r["Rr1"], Xr2 + r["Xr1-Xr2"], r["Rr1"] * r["Rr2/Rr1"], Xr2, r["Rc"]])
+    else:
+        z = np.array([k_r * r["Rr1"], r["Xs"], r["Xm"], r["Rr1"], r["Rc"], k_x * r["Xs"]])
+
+    return z, sf
+
+"""
+NAMEPLATE - Nameplate data of an equivalent circuit
+
+Usage: nameplate (model, z, sf)
+
+The circuit is scaled so that the full-load input current is 1 pu (as
+assumed by the solvers).
+
+Returns: z scaled to per-unit
+         dictionary of rated_pf, rated_eff, T_b, T_lr (as # of FL torque)
+         and I_lr (pu)
+"""
+def nameplate(model, z, sf):
+
+    if model == "Double cage":
+        [Pm, Q, T_b, T_lr, I_lr, eff] = calc_pqt(sf, z)
+    else:
+        [Pm, Q, T_b, eff] = calc_pqt_sc(sf, z)
+        [T_lr, i_lr] = get_torque_sc(1, z)
+        I_lr = np.abs(i_lr + 1 / z[4])
+
+    # Apparent input power at full load (the impedances scale as 1 / S)
+    S = np.hypot(Pm / eff, Q)
+    T_fl = Pm / (1 - sf)
+
+    return z * S, {"rated_pf" : float(Pm / eff / S), "rated_eff" : float(eff), "T_b" : float(T_b / T_fl), "T_lr" : float(T_lr / T_fl), "I_lr" : float(I_lr / S)}
+
+# Nameplate data within the PLAUSIBLE ranges (locked rotor torque is not
+# checked for the single cage model, which doesn't fit it)
+def plausible(model, data):
+    for [key, (lo, hi)] in PLAUSIBLE.items():
+        if (key == "T_lr") and (model == "Single cage"):
+            continue
+        if not (lo <= data[key] <= hi):
+            return False
+
+    return True
+
+"""
+GENERATE - Generates synthetic motors with known equivalent circuits
+
+Usage: generate (n, model, seed, settings)
+
+Where   n is the number of motors
+        model is "Single cage" or "Double cage"
+        seed is the random seed (the same seed gives the same motors)
+        settings is a config.AlgoSettings record (k_r and k_x are used)
+
+Returns: list of (motor_data, z) pairs, motor_data a dictionary of motor
+         data (as per config.MotorData) and z the true parameters
+"""
+def generate(n, model, seed=None, settings=None):
+
+    rng = np.random.default_rng(seed)
+    s = settings or AlgoSettings()
+    motors = []
+
+    while len(motors) < n:
+        [z, sf] = sample_circuit(rng, model, s.k_r, s.k_x)
+        sync_speed = SYNC_SPEEDS[rng.integers(len(SYNC_SPEEDS))]
+        [z, data] = nameplate(model, z, sf)
+
+        if not plausible(model, data):
+            continue
+
+        data["description"] = "Synthetic %s %d" % (model.lower(), len(motors) + 1)
+        data["sync_speed"] = sync_speed
+        data["rated_speed"] = sync_speed * (1 - sf)
+        motors.append((data, z))
+
+    return motors
+
+"""
+WRITE_MTO / WRITE_FLEET - Writes synthetic motors as .mto files (with the
+                          true parameters in truth.csv) or as a CSV fleet
+                          (with the true parameters in the true_* columns)
+
+Usage: write_mto (directory, model, motors, settings)
+       write_fleet (filename, model, motors)
+
+Where   motors is a list of (motor_data, z) pairs (see generate)
+        settings is a config.AlgoSettings record, written to the files
+"""
+def write_mto(directory, model, motors, settings=None):
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    algo_data = (settings or AlgoSettings()).as_dict()
+    digits = len(str(len(motors)))
+
+    with open(os.path.join(directory, "truth.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "model"] + PARAMS[model])
+
+        for [i, (motor_data, z)] in enumerate(motors):
+            name = "synthetic_%0*d.mto" % (digits, i + 1)
+            saveload.write_file(os.path.join(directory, name), motor_data, algo_data)
+            writer.writerow([name, model] + [repr(float(v)) for v in z])
+
+def write_fleet(filename, model, motors):
+
+    true_fields = ["true_" + name for name in PARAMS[model]]
+
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(MOTOR_FIELDS + ["model"] + true_fields)
+
+        for [motor_data, z] in motors:
+            writer.writerow([motor_data[key] if key == "description" else repr(float(motor_data[key])) for key in MOTOR_FIELDS] + [model] + [repr(float(v)) for v in z])
+
+# Estimates one synthetic motor (in a worker process), returns z, iter, err,
+# conv and the run time (z is None if the solver failed)
+def recover_motor(model, algo, motor_data, settings, seed):
+    t = time.perf_counter()
+
+    try:
+        [z, iter, err, conv] = estimate(model, algo, motor_data, settings, seed=seed)
+    except (ArithmeticError, np.linalg.LinAlgError):
+        [z, iter, err, conv] = [None, 0, np.nan, 0]
+
+    return z, iter, err, conv, time.perf_counter() - t
+
+"""
+RECOVERY_REPORT - Scores the recovery of the true parameters of synthetic
+                  motors, for each algorithm and data set size
+
+Usage: recovery_report (sizes, model, algos, seed, settings, n_workers, log)
+
+Where   sizes is a list of data set sizes (the first motors of one
+          generated set)
+        algos is a list of algorithms (as per estimate.estimate)
+        settings is a config.AlgoSettings record
+        n_workers is the number of worker processes (1 to run serially)
+        log is an optional function called with a line of text per result
+
+The error of a motor is the largest relative error of its parameters.
+Errors are of the converged motors only, and a motor is recovered if it
+converged with an error below RECOVERY_TOL.
+
+Returns: list of result dictionaries (algorithm, motors, converged,
+         recovered, failed, err_median, err_p95, param_err_median, time,
+         motors_per_s)
+"""
+def recovery_report(sizes, model, algos, seed=0, settings=None, n_workers=1, log=None):
+
+    settings = settings or AlgoSettings()
+    motors = generate(max(sizes), model, seed, settings)
+    results = []
+
+    executor = parallel.get_executor(n_workers)
+    try:
+        for algo in algos:
+            for n in sizes:
+                t = time.perf_counter()
+                runs = parallel.map_members(executor, recover_motor, [(model, algo, motors[i][0], settings, seed + i) for i in range(n)])
+                t = time.perf_counter() - t
+
+                results.append(score(algo, runs, [z for [motor_data, z] in motors[0:n]], t))
+
+                if log is not None:
+                    r = results[-1]
+                    log("%s, %d motors: converged %d, recovered %d, error median %s, %.2f s (%.1f motors/s)" % (algo, n, r["converged"], r["recovered"], "-" if r["err_median"] is None else "%.3g" % r["err_median"], r["time"], r["motors_per_s"]))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return results
+
+# Scores the runs of one algorithm on a data set against the true parameters
+def score(algo, runs, truth, t):
+    errs = []
+    param_errs = []
+    failed = 0
+
+    for [[z, iter, err, conv, run_time], z_true] in zip(runs, truth):
+        if z is None:
+            failed += 1
+        elif conv == 1:
+            e = np.abs(np.asarray(z, dtype=float) - z_true) / z_true
+            param_errs.append(e)
+            errs.append(np.max(e))
+
+    return {
+        "algorithm" : algo,
+        "motors" : len(runs),
+        "converged" : len(errs),
+        "recovered" : int(np.sum(np.array(errs) < RECOVERY_TOL)),
+        "failed" : failed,
+        "err_median" : float(np.median(errs)) if errs else None,
+        "err_p95" : float(np.percentile(errs, 95)) if errs else None,
+        "param_err_median" : [float(e) for e in np.median(param_errs, axis=0)] if errs else None,
+        "time" : t,
+        "motors_per_s" : len(runs) / t
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m synthetic", description="Generate synthetic motors with known equivalent circuit parameters, and score the algorithms on them")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="write synthetic motors as .mto files or a CSV fleet")
+    gen.add_argument("n", type=int, help="number of motors")
+    gen.add_argument("-o", "--output", required=True, help="directory of .mto files, or .csv fleet file")
+
+    report = commands.add_parser("report", help="score the parameter recovery and run time of the algorithms")
+    report.add_argument("--sizes", default=",".join(str(n) for n in SIZES), help="data set sizes (default %s)" % ",".join(str(n) for n in SIZES))
+    report.add_argument("-a", "--algorithm", dest="algorithms", action="append", choices=sorted(ALGO_NAMES), default=None, help="algorithm (can be repeated, default nr, lm and dnr)")
+    report.add_argument("--workers", type=int, default=1, help="worker processes (default 1)")
+    report.add_argument("--conv-err", type=float, default=None, help="convergence criterion of the solvers (default %g)" % AlgoSettings().conv_err)
+    report.add_argument("--max-iter", type=int, default=None, help="maximum iterations of the solvers (default %d)" % AlgoSettings().max_iter)
+    report.add_argument("-o", "--output", default=None, help="JSON report file")
+
+    for p in (gen, report):
+        p.add_argument("-m", "--model", choices=sorted(MODEL_NAMES), default="double", help="motor model (default double)")
+        p.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+
+    args = parser.parse_args(argv)
+    model = MODEL_NAMES[args.model]
+
+    if args.command == "generate":
+        motors = generate(args.n, model, args.seed)
+
+        if args.output.lower().endswith(".csv"):
+            write_fleet(args.output, model, motors)
+        else:
+            write_mto(args.output, model, motors)
+
+        return 0
+
+    settings = AlgoSettings().replace(**{key : getattr(args, key) for key in ("conv_err", "max_iter") if getattr(args, key) is not None})
+    algos = [ALGO_NAMES[a] for a in (args.algorithms or ["nr", "lm", "dnr"])]
+    if model == "Single cage":
+        algos = [a for a in algos if a == "Newton-Raphson"]
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    results = recovery_report(sizes, model, algos, args.seed, settings, args.workers, lambda line: print(line, file=sys.stderr))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"model" : model, "seed" : args.seed, "settings" : settings.as_dict(), "recovery_tol" : RECOVERY_TOL, "params" : PARAMS[model], "results" : results}, f, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
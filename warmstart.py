@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Moto: Induction motor parameter estimation tool
+
+Warm Start Index
+
+Index of previously converged double cage solutions, mapping each motor's
+performance parameters p = [sf eff pf Tb Tlr Ilr] to its equivalent circuit
+parameters z. The initial estimate for a new motor is interpolated from its
+nearest neighbours, instead of the standard initial estimate of the descent
+solvers.
+"""
+import os
+import numpy as np
+from estimate import estimate, performance_params, DESCENT
+from budget import settings_budget, limited
+from config import algo_record
+
+# Default location of the index (per user)
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".moto", "warmstart.npz")
+
+"""
+WARMSTARTINDEX - Nearest neighbour index of converged solutions
+
+Usage: index = WarmStartIndex (path, max_entries)
+
+Where   path is the .npz file the index is kept in (loaded if it exists,
+          None to keep the index in memory only)
+        max_entries is the maximum number of solutions kept (the oldest are
+          dropped first)
+
+Solutions are added with index.add(p, z) and the interpolated initial
+estimate for a motor is index.query(p, k). The index is written to its
+file with index.save().
+"""
+class WarmStartIndex:
+
+    def __init__(self, path=None, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.p = np.zeros((0,6))
+        self.z = np.zeros((0,8))
+
+        if (path is not None) and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self.p = data["p"]
+                    self.z = data["z"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def __len__(self):
+        return self.p.shape[0]
+
+    # Add a converged solution (replaces the solution of the same motor)
+    def add(self, p, z):
+        p = np.asarray(p, dtype=float)
+        z = np.asarray(z, dtype=float)
+
+        if not (np.all(np.isfinite(z)) and np.all(z > 0)):
+            return
+
+        keep = np.any(self.p != p, axis=1)
+        self.p = np.vstack([self.p[keep], p])[-self.max_entries:]
+        self.z = np.vstack([self.z[keep], z])[-self.max_entries:]
+
+    """
+    QUERY - Initial estimate for a motor, interpolated from the k nearest
+            solutions (distance is the norm of the relative differences of
+            the performance parameters, and the estimate is the inverse
+            distance weighted geometric mean of their z)
+
+    Returns: vector z0, or None if the index is empty
+    """
+    def query(self, p, k=3):
+        if len(self) == 0:
+            return None
+
+        p = np.asarray(p, dtype=float)
+        d = np.sqrt(np.sum(((self.p - p) / p) ** 2, axis=1))
+
+        k = min(k, len(self))
+        i = np.argpartition(d, k - 1)[0:k]
+
+        # Exact match
+        if d[i].min() < 1e-12:
+            return self.z[i[np.argmin(d[i])]].copy()
+
+        w = 1 / d[i]
+        w = w / np.sum(w)
+
+        return np.exp(np.dot(w, np.log(self.z[i])))
+
+    def save(self):
+        if self.path is None:
+            return
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            tmp = self.path + ".tmp.npz"
+            np.savez(tmp, p=self.p, z=self.z)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+"""
+WARM_ESTIMATE - Estimates the equivalent circuit parameters of a motor (as
+                per estimate.estimate), starting the double cage descent
+                algorithms from the nearest solutions of a warm start index
+
+Usage: warm_estimate (index, model, algo, motor, settings, progress, executor, seed, k, trace)
+
+Where   index is a WarmStartIndex (or None to not warm start)
+        k is the number of nearest solutions interpolated
+        the other arguments are as per estimate.estimate
+
+If the warm started solver doesn't converge (or fails on a singular
+matrix), it is run again from the standard initial estimate and the better
+of the two results is returned (both runs share the budget of the
+settings, and the second is skipped if it ran out).
+Converged double cage solutions (of any algorithm) are added to the index.
+
+Returns: z, iter, err, conv as returned by the solver
+"""
+def warm_estimate(index, model, algo, motor, settings, progress=None, executor=None, seed=None, k=3, trace=None):
+
+    if (index is None) or (model != "Double cage"):
+        return estimate(model, algo, motor, settings, progress, executor, seed, trace=trace)
+
+    p = performance_params(model, motor)
+    budget = settings_budget(algo_record(settings))
+
+    r = limited(budget, warm_runs, index, model, algo, motor, settings, progress, executor, seed, k, trace, budget)
+
+    if r[3] == 1:
+        index.add(p, r[0])
+
+    return r
+
+# Warm started run, then cold run if needed (see warm_estimate)
+def warm_runs(index, model, algo, motor, settings, progress, executor, seed, k, trace, budget):
+    r = None
+
+    if algo in DESCENT:
+        z0 = index.query(performance_params(model, motor), k)
+
+        if z0 is not None:
+            try:
+                r = estimate(model, algo, motor, settings, progress, executor, seed, z0, trace, budget)
+            except np.linalg.LinAlgError:
+                r = None
+
+    if (r is not None) and (budget is not None) and budget.exhausted():
+        return r
+
+    if (r is None) or (r[3] != 1):
+        r_cold = estimate(model, algo, motor, settings, progress, executor, seed, trace=trace, budget=budget)
+
+        if (r is None) or not (r[2] <= r_cold[2]):
+            r = r_cold
+
+    return r